@@ -0,0 +1,802 @@
+#!/usr/bin/env python3
+"""
+Alert audio asset pack (optional).
+`build` decodes every cached MP3 in hooks/cache/ once (with ffmpeg, or mpv)
+into 16-bit mono PCM with CODEX_AUDIO_VOLUME already applied, and packs all
+clips into hooks/cache/alerts.pack: one file with an index from phrase hash
+to offset, length and format. The notification player maps the pack once
+and streams clip samples straight from the mapping to a light sink (aplay,
+paplay, pw-play, afplay, winsound), so no decoder runs per alert.
+Phrases without a pre-made clip are synthesized by a local TTS backend
+(espeak-ng, espeak, say) on first use and cached (see tts_clip).
+
+    python3 alert_audio.py build          # decode new or changed clips, then pack
+    python3 alert_audio.py pack           # pack the MP3s as they are (no decoder)
+    python3 alert_audio.py verify         # phrases of notification.py missing from the pack
+    CODEX_AUDIO_SINK=file:/tmp/out.pcm python3 alert_audio.py play "All clear! Standing by."
+    python3 alert_audio.py say "myproject: Work complete!"    # TTS, cached for next time
+    python3 alert_audio.py warm --project myproject           # synthesize its alerts ahead of time
+    python3 alert_audio.py tts-cache [--clear]                # TTS cache size and budget
+"""
+
+import json
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+PCM_DIR = os.path.join(CACHE_DIR, "pcm")
+MANIFEST = "manifest.json"
+RATE = 24000            # Hz, mono, signed 16-bit little-endian
+CHUNK_FRAMES = 4096     # frames per write to a streaming sink
+
+# Sinks that read raw PCM on stdin; {rate} and {channels} are filled in
+STREAM_SINKS = {
+    "aplay": ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-c", "{channels}", "-r", "{rate}", "-"],
+    "paplay": ["paplay", "--raw", "--format=s16le", "--channels={channels}", "--rate={rate}"],
+    "pw-play": ["pw-play", "--format", "s16", "--channels", "{channels}", "--rate", "{rate}", "-"],
+}
+
+
+def volume() -> int:
+    """CODEX_AUDIO_VOLUME: 0 (silent) to 1000 (full). Default 1000."""
+    try:
+        return max(0, min(1000, int(os.environ.get("CODEX_AUDIO_VOLUME", 1000))))
+    except ValueError:
+        return 1000
+
+
+# =============================================================================
+# Build
+# =============================================================================
+
+
+def decoder_command(source: str, target: str, level: int) -> list[str] | None:
+    """Command that decodes source to a mono s16 WAV at target with the volume applied."""
+    import shutil
+
+    gain = f"{level / 1000:.3f}"
+    if shutil.which("ffmpeg"):
+        return ["ffmpeg", "-v", "error", "-nostdin", "-y", "-i", source, "-vn", "-ac", "1", "-ar", str(RATE),
+                "-c:a", "pcm_s16le", "-af", f"volume={gain}", "-f", "wav", target]
+    if shutil.which("mpv"):
+        return ["mpv", "--no-config", "--really-quiet", "--vo=null", "--ao=pcm", f"--ao-pcm-file={target}",
+                "--audio-channels=mono", f"--audio-samplerate={RATE}", "--audio-format=s16",
+                f"--af=lavfi=[volume={gain}]", source]
+    return None
+
+
+def read_manifest(directory: str = PCM_DIR) -> dict:
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def source_stamp(path: str) -> list[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def valid_wav(path: str) -> bool:
+    import wave
+
+    try:
+        with wave.open(path, "rb") as w:
+            return w.getnchannels() == 1 and w.getsampwidth() == 2 and w.getnframes() > 0
+    except (OSError, EOFError, wave.Error):
+        return False
+
+
+def clip_path(stem: str) -> str | None:
+    """The pre-decoded WAV for a cached clip, if it is current for this volume and MP3."""
+    manifest = read_manifest()
+    stamp = manifest.get("clips", {}).get(stem)
+    if stamp is None or manifest.get("volume") != volume() or manifest.get("rate") != RATE:
+        return None
+    try:
+        if source_stamp(os.path.join(CACHE_DIR, stem + ".mp3")) != stamp:
+            return None
+    except OSError:
+        return None
+    path = os.path.join(PCM_DIR, stem + ".wav")
+    return path if os.path.exists(path) else None
+
+
+def build(force: bool = False) -> tuple[int, int, list[str]]:
+    """
+    Decode the cached MP3s whose WAV is missing or stale (source changed, or
+    built at another volume). Returns (decoded, up to date, failed names).
+    """
+    import subprocess
+
+    level = volume()
+    os.makedirs(PCM_DIR, exist_ok=True)
+    manifest = read_manifest()
+    if manifest.get("volume") != level or manifest.get("rate") != RATE:
+        manifest = {}
+    clips = manifest.get("clips", {})
+    built, fresh, failed, current = 0, 0, [], {}
+
+    for name in sorted(os.listdir(CACHE_DIR)):
+        if not name.endswith(".mp3"):
+            continue
+        stem = name[:-4]
+        source = os.path.join(CACHE_DIR, name)
+        target = os.path.join(PCM_DIR, stem + ".wav")
+        stamp = source_stamp(source)
+        if not force and clips.get(stem) == stamp and os.path.exists(target):
+            current[stem] = stamp
+            fresh += 1
+            continue
+
+        command = decoder_command(source, target + ".tmp", level)
+        if command is None:
+            raise RuntimeError("ffmpeg or mpv is needed to build the PCM cache")
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+        if result.returncode != 0 or not valid_wav(target + ".tmp"):
+            failed.append(name)
+            try:
+                os.remove(target + ".tmp")
+            except OSError:
+                pass
+            continue
+        os.replace(target + ".tmp", target)
+        current[stem] = stamp
+        built += 1
+
+    # WAVs of removed MP3s would otherwise be played for stale text
+    for name in os.listdir(PCM_DIR):
+        if name.endswith(".wav") and name[:-4] not in current:
+            os.remove(os.path.join(PCM_DIR, name))
+
+    tmp = os.path.join(PCM_DIR, MANIFEST + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"volume": level, "rate": RATE, "clips": current}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(PCM_DIR, MANIFEST))
+    return built, fresh, failed
+
+
+# =============================================================================
+# Asset pack
+# =============================================================================
+#
+# One file, opened with mmap and kept open by the player:
+#   header   magic, version, volume the PCM clips were built at, clip count
+#   index    one entry per clip, sorted by phrase hash (binary search)
+#   names    "phrase\0cache stem" per clip, UTF-8
+#   data     raw s16le PCM (pre-decoded) or MP3 bytes
+# A phrase is looked up by the BLAKE2b hash of its exact text, so clips are
+# found without a file name derived from the text.
+
+PACK_PATH = os.path.join(CACHE_DIR, "alerts.pack")
+PACK_MAGIC = b"CXAUDIO\0"
+PACK_VERSION = 1
+HEADER = struct.Struct("<8sHHI")            # magic, version, volume, count
+ENTRY = struct.Struct("<8sQIIIHBB")         # hash, offset, length, rate, name offset, name length, channels, format
+FORMAT_PCM, FORMAT_MP3 = 1, 2
+
+
+def phrase_hash(phrase: str) -> bytes:
+    import hashlib
+    return hashlib.blake2b(phrase.encode("utf-8"), digest_size=8).digest()
+
+
+def phrase_key(text: str) -> str:
+    """Letters and digits only: matches phrases to cache files whose names lost `?`, `/` and the like."""
+    return "".join(c for c in text.lower() if c.isalnum())
+
+
+def notification_phrases() -> list[str]:
+    """Every phrase notification.py can announce."""
+    from notification import COMPLETION_PHRASES, MESSAGES
+    return list(dict.fromkeys([*MESSAGES.values(), *COMPLETION_PHRASES]))
+
+
+def clip_sources() -> dict[str, str]:
+    """Phrase -> cache stem: notification phrases matched to their MP3, then any other MP3 under its own name."""
+    stems = [name[:-4] for name in sorted(os.listdir(CACHE_DIR)) if name.endswith(".mp3")]
+    by_key = {phrase_key(stem): stem for stem in stems}
+    sources = {}
+    for phrase in notification_phrases():
+        stem = phrase if phrase in stems else by_key.get(phrase_key(phrase))
+        if stem is not None:
+            sources[phrase] = stem
+    used = set(sources.values())
+    for stem in stems:
+        if stem not in used:
+            sources[stem] = stem
+    return sources
+
+
+def clip_data(stem: str) -> tuple[int, int, int, bytes]:
+    """(format, rate, channels, bytes) of a cached clip: pre-decoded PCM if current, else the MP3."""
+    import wave
+
+    path = clip_path(stem)
+    if path is not None:
+        with wave.open(path, "rb") as w:
+            return FORMAT_PCM, w.getframerate(), w.getnchannels(), w.readframes(w.getnframes())
+    with open(os.path.join(CACHE_DIR, stem + ".mp3"), "rb") as f:
+        return FORMAT_MP3, 0, 0, f.read()
+
+
+def pack(path: str = PACK_PATH) -> int:
+    """Write every cached clip into one pack file (atomically replaced); returns the clip count."""
+    clips = sorted((phrase_hash(phrase), phrase, stem) for phrase, stem in clip_sources().items())
+    names = b"".join(f"{phrase}\0{stem}".encode("utf-8") for _, phrase, stem in clips)
+    names_offset = HEADER.size + ENTRY.size * len(clips)
+    offset = names_offset + len(names)
+    index, blobs, name_offset = [], [], names_offset
+    for digest, phrase, stem in clips:
+        kind, rate, channels, data = clip_data(stem)
+        name_length = len(f"{phrase}\0{stem}".encode("utf-8"))
+        index.append(ENTRY.pack(digest, offset, len(data), rate, name_offset, name_length, channels, kind))
+        blobs.append(data)
+        offset += len(data)
+        name_offset += name_length
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, volume(), len(clips)))
+        f.write(b"".join(index))
+        f.write(names)
+        for data in blobs:
+            f.write(data)
+    # Players that have the old pack mapped keep reading the old inode
+    os.replace(tmp, path)
+    return len(clips)
+
+
+class Clip:
+    __slots__ = ("phrase", "stem", "format", "rate", "channels", "data")
+
+    def __init__(self, phrase, stem, kind, rate, channels, data):
+        self.phrase, self.stem, self.format = phrase, stem, kind
+        self.rate, self.channels, self.data = rate, channels, data
+
+
+class Pack:
+    """A memory-mapped asset pack; clip data are memoryview slices of the mapping (no copies)."""
+
+    def __init__(self, path: str = PACK_PATH):
+        import mmap
+
+        with open(path, "rb") as f:
+            self.stamp = (os.fstat(f.fileno()).st_ino, os.fstat(f.fileno()).st_mtime_ns)
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if len(self.map) < HEADER.size:
+            raise ValueError("truncated pack header")
+        magic, version, self.volume, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            raise ValueError("not an alert pack (or another pack version)")
+        if HEADER.size + ENTRY.size * self.count > len(self.map):
+            raise ValueError("truncated pack index")
+
+    def entry(self, i: int) -> tuple:
+        return ENTRY.unpack_from(self.map, HEADER.size + ENTRY.size * i)
+
+    def clip(self, i: int) -> Clip:
+        _, offset, length, rate, name_offset, name_length, channels, kind = self.entry(i)
+        if offset + length > len(self.map) or name_offset + name_length > len(self.map):
+            raise ValueError(f"pack entry {i} points past the end of the file")
+        phrase, _, stem = bytes(self.view[name_offset:name_offset + name_length]).decode("utf-8").partition("\0")
+        return Clip(phrase, stem, kind, rate, channels, self.view[offset:offset + length])
+
+    def find(self, phrase: str) -> Clip | None:
+        """Binary search of the index by phrase hash."""
+        digest = phrase_hash(phrase)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = self.entry(mid)[0]
+            if key < digest:
+                lo = mid + 1
+            elif key > digest:
+                hi = mid
+            else:
+                clip = self.clip(mid)
+                return clip if clip.phrase == phrase else None
+        return None
+
+    def clips(self):
+        for i in range(self.count):
+            yield self.clip(i)
+
+
+_pack = None
+
+
+def open_pack() -> Pack | None:
+    """The pack, mapped once per process and remapped when `pack` replaces the file."""
+    global _pack
+    try:
+        st = os.stat(PACK_PATH)
+    except OSError:
+        return None
+    if _pack is None or _pack.stamp != (st.st_ino, st.st_mtime_ns):
+        try:
+            _pack = Pack(PACK_PATH)
+        except (OSError, ValueError):
+            _pack = None
+    return _pack
+
+
+def verify(path: str = PACK_PATH) -> tuple[list[str], list[str]]:
+    """(problems, notification phrases missing from the pack)."""
+    try:
+        pack_file = Pack(path)
+        clips = list(pack_file.clips())
+    except (OSError, ValueError, UnicodeDecodeError) as e:
+        return [str(e)], notification_phrases()
+
+    problems = []
+    hashes = [pack_file.entry(i)[0] for i in range(pack_file.count)]
+    if hashes != sorted(hashes):
+        problems.append("index is not sorted by phrase hash")
+    for clip in clips:
+        if clip.format not in (FORMAT_PCM, FORMAT_MP3) or not len(clip.data):
+            problems.append(f"bad clip: {clip.phrase}")
+        elif pack_file.find(clip.phrase) is None:
+            problems.append(f"not found by its own phrase: {clip.phrase}")
+    if pack_file.volume != volume() and any(clip.format == FORMAT_PCM for clip in clips):
+        problems.append(f"PCM clips built at volume {pack_file.volume}, CODEX_AUDIO_VOLUME is {volume()}")
+    missing = [phrase for phrase in notification_phrases() if pack_file.find(phrase) is None]
+    return problems, missing
+
+
+# =============================================================================
+# Playback
+# =============================================================================
+
+# Decoders fed MP3 clips on stdin; used for clips the pack holds undecoded
+DECODER_SINKS = [
+    ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-volume", "{volume}", "-i", "pipe:0"],
+    ["mpv", "--no-video", "--really-quiet", "--volume={volume}", "-"],
+]
+
+
+def sink_name() -> str | None:
+    """CODEX_AUDIO_SINK, or the first available sink for this platform when unset/"auto"."""
+    name = os.environ.get("CODEX_AUDIO_SINK", "auto")
+    if name != "auto":
+        return name
+    if sys.platform == "win32":
+        return "winsound"
+    if sys.platform == "darwin":
+        return "afplay"
+    import shutil
+
+    return next((sink for sink in STREAM_SINKS if shutil.which(sink)), None)
+
+
+def write_chunks(data: memoryview, out) -> None:
+    step = CHUNK_FRAMES * 2
+    for start in range(0, len(data), step):
+        out.write(data[start:start + step])
+
+
+def stream(command: list[str], data: memoryview, params: dict) -> bool:
+    """Start the sink and feed it the clip while it plays (no decode, no temp file)."""
+    import subprocess
+
+    try:
+        proc = subprocess.Popen([arg.format(**params) for arg in command], stdin=subprocess.PIPE,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    try:
+        write_chunks(data, proc.stdin)
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    return proc.wait() == 0
+
+
+def wav_bytes(clip: Clip) -> bytes:
+    import io
+    import wave
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(clip.channels)
+        w.setsampwidth(2)
+        w.setframerate(clip.rate)
+        w.writeframes(clip.data)
+    return out.getvalue()
+
+
+def play_pcm(clip: Clip, sink: str) -> bool:
+    """Play a pre-decoded clip on a sink; False if the sink is unknown or fails."""
+    if sink == "null":
+        with open(os.devnull, "wb") as out:
+            write_chunks(clip.data, out)
+        return True
+    if sink.startswith("file:"):
+        with open(sink[5:], "ab") as out:
+            write_chunks(clip.data, out)
+        return True
+    if sink == "winsound":
+        import winsound
+        winsound.PlaySound(wav_bytes(clip), winsound.SND_MEMORY | winsound.SND_NODEFAULT)
+        return True
+    if sink == "afplay":
+        # afplay only reads files: use the WAV `build` left next to the pack
+        path = clip_path(clip.stem)
+        if path is None:
+            return False
+        import subprocess
+        try:
+            return subprocess.run(["afplay", path], capture_output=True).returncode == 0
+        except OSError:
+            return False
+    params = {"rate": clip.rate, "channels": clip.channels}
+    if sink in STREAM_SINKS:
+        return stream(STREAM_SINKS[sink], clip.data, params)
+    if " " in sink:
+        import shlex
+        return stream(shlex.split(sink), clip.data, params)  # custom command reading raw PCM on stdin
+    return False
+
+
+def play_encoded(data, level: int) -> bool:
+    """Pipe an encoded clip (MP3 or WAV) to the first decoder that plays it, at level (0-100)."""
+    import shutil
+
+    for command in DECODER_SINKS:
+        if shutil.which(command[0]) and stream(command, data, {"volume": level}):
+            return True
+    return False
+
+
+def play_mp3(clip: Clip) -> bool:
+    return play_encoded(clip.data, volume() // 10)
+
+
+def play(phrase: str) -> bool:
+    """
+    Play a phrase from the pack. False when there is no pack, the phrase is
+    not in it, or no sink/decoder works; the caller then uses the loose files.
+    """
+    pack_file = open_pack()
+    clip = pack_file.find(phrase) if pack_file else None
+    if clip is None:
+        return False
+    try:
+        if clip.format == FORMAT_PCM:
+            # PCM carries the volume it was built at
+            sink = sink_name() if pack_file.volume == volume() else None
+            return sink is not None and play_pcm(clip, sink)
+        if clip.format == FORMAT_MP3 and sys.platform != "win32":
+            return play_mp3(clip)
+    except (OSError, ValueError, ImportError):
+        pass
+    return False
+
+
+# =============================================================================
+# Speech synthesis (dynamic TTS cache)
+# =============================================================================
+#
+# Phrases without a pre-made clip (one naming the project, say) are spoken by a
+# local TTS backend on first use and kept as WAV files named by a hash of the
+# backend, volume and text, so a repeat plays with no synthesis delay. The cache
+# stays under a byte budget: a hit refreshes the file's mtime and the least
+# recently used files are evicted first.
+
+TTS_CACHE_BYTES = 16 * 1024 * 1024
+# Commands read the text on stdin and write a WAV to {output}
+TTS_BACKENDS = {
+    "espeak-ng": ["espeak-ng", "--stdin", "-w", "{output}"],
+    "espeak": ["espeak", "--stdin", "-w", "{output}"],
+    "say": ["say", "-o", "{output}", "--file-format=WAVE", f"--data-format=LEI16@{RATE}"],
+}
+STUB_WORD_SECONDS = 0.08
+
+
+def tts_backend() -> str | None:
+    """
+    CODEX_TTS_BACKEND: "auto" (default: the first backend installed), "off",
+    a TTS_BACKENDS name, "stub" (tones, for tests) or a command that reads
+    the text on stdin and writes a WAV to {output}.
+    """
+    name = os.environ.get("CODEX_TTS_BACKEND", "auto")
+    if name == "off":
+        return None
+    if name != "auto":
+        return name
+    import shutil
+
+    return next((backend for backend in TTS_BACKENDS
+                 if shutil.which(backend) and (backend != "say" or sys.platform == "darwin")), None)
+
+
+def tts_dir() -> str:
+    override = os.environ.get("CODEX_TTS_CACHE")
+    if override:
+        return override
+    from hook_paths import state_dir
+    return os.path.join(state_dir(), "tts")
+
+
+def tts_budget() -> int:
+    """CODEX_TTS_CACHE_BYTES: size the TTS cache is kept under. Default 16 MiB."""
+    try:
+        return max(0, int(os.environ.get("CODEX_TTS_CACHE_BYTES", TTS_CACHE_BYTES)))
+    except ValueError:
+        return TTS_CACHE_BYTES
+
+
+def tts_path(text: str, backend: str) -> str:
+    import hashlib
+
+    key = hashlib.blake2b(f"{backend}\0{volume()}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(tts_dir(), key + ".wav")
+
+
+def stub_wav(text: str, path: str) -> None:
+    """A tone per word, pitched by the word: deterministic audio without a TTS engine."""
+    import array
+    import math
+    import wave
+
+    samples = array.array("h")
+    frames = int(RATE * STUB_WORD_SECONDS)
+    for word in text.split() or [""]:
+        frequency = 300 + sum(word.encode("utf-8")) % 600
+        samples.extend(int(8000 * math.sin(2 * math.pi * frequency * i / RATE)) for i in range(frames))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    with wave.open(path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(RATE)
+        w.writeframes(samples.tobytes())
+
+
+def synthesize(text: str, backend: str, path: str) -> bool:
+    """Speak text into a WAV at path (16-bit, CODEX_AUDIO_VOLUME applied), replaced atomically."""
+    import array
+    import subprocess
+    import wave
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        if backend == "stub":
+            stub_wav(text, tmp)
+        else:
+            if backend in TTS_BACKENDS:
+                command = TTS_BACKENDS[backend]
+            else:
+                import shlex
+                command = shlex.split(backend)
+            result = subprocess.run([arg.format(output=tmp) for arg in command], input=text.encode("utf-8"),
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30)
+            if result.returncode != 0:
+                return False
+
+        with wave.open(tmp, "rb") as w:
+            channels, width, rate = w.getnchannels(), w.getsampwidth(), w.getframerate()
+            frames = w.readframes(w.getnframes())
+        if width != 2 or channels not in (1, 2) or not frames:
+            return False
+        level = volume()
+        if level < 1000:
+            samples = array.array("h", frames)
+            if sys.byteorder == "big":
+                samples.byteswap()
+            samples = array.array("h", (sample * level // 1000 for sample in samples))
+            if sys.byteorder == "big":
+                samples.byteswap()
+            frames = samples.tobytes()
+        with wave.open(tmp, "wb") as w:
+            w.setnchannels(channels)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(frames)
+        os.replace(tmp, path)
+        return True
+    except (OSError, EOFError, wave.Error, subprocess.SubprocessError):
+        return False
+    finally:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def evict(directory: str, budget: int, keep: str | None = None) -> int:
+    """Delete least recently used clips until the cache fits budget; returns the bytes freed."""
+    files = []
+    try:
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".wav"):
+                st = entry.stat()
+                files.append((st.st_mtime_ns, st.st_size, entry.path))
+    except OSError:
+        return 0
+    total = sum(size for _, size, _ in files)
+    freed = 0
+    for _, size, path in sorted(files):
+        if total <= budget:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue  # Another player evicted it
+        total -= size
+        freed += size
+    return freed
+
+
+def cached_clip(path: str, text: str) -> Clip | None:
+    """A cached TTS clip, marked as just used (its mtime is the LRU order)."""
+    import wave
+
+    try:
+        with wave.open(path, "rb") as w:
+            clip = Clip(text, None, FORMAT_PCM, w.getframerate(), w.getnchannels(),
+                        memoryview(w.readframes(w.getnframes())))
+        os.utime(path)
+    except (OSError, EOFError, wave.Error):
+        return None
+    return clip
+
+
+def tts_clip(text: str) -> tuple[Clip, str] | None:
+    """(clip, WAV path) for text from the TTS cache, synthesizing it on a miss; None without a backend."""
+    backend = tts_backend()
+    if backend is None or not text.strip():
+        return None
+    path = tts_path(text, backend)
+    clip = cached_clip(path, text)
+    if clip is None and synthesize(text, backend, path):
+        evict(os.path.dirname(path), tts_budget(), keep=path)
+        clip = cached_clip(path, text)
+    return None if clip is None else (clip, path)
+
+
+def premade(phrase: str) -> bool:
+    """Whether phrase has a pre-made clip (in the pack or as a loose MP3), so it needs no synthesis."""
+    pack_file = open_pack()
+    if pack_file is not None and pack_file.find(phrase) is not None:
+        return True
+    return os.path.exists(os.path.join(CACHE_DIR, phrase.replace("/", "-").replace("\x00", "") + ".mp3"))
+
+
+def speak(text: str) -> bool:
+    """Play text from the TTS cache (synthesized on first use); False without a backend or sink."""
+    found = tts_clip(text)
+    if found is None:
+        return False
+    clip, path = found
+    try:
+        sink = sink_name()
+        if sink == "afplay":
+            import subprocess
+            return subprocess.run(["afplay", path], capture_output=True).returncode == 0
+        if sink is not None and play_pcm(clip, sink):
+            return True
+        if sys.platform != "win32":
+            # No PCM sink: a decoder plays the WAV file; the volume is already in the samples
+            with open(path, "rb") as f:
+                return play_encoded(f.read(), 100)
+    except (OSError, ValueError, ImportError):
+        pass
+    return False
+
+
+def warm(phrases: list[str]) -> int:
+    """Synthesize the phrases that have neither a pre-made clip nor a cached one; returns how many."""
+    backend = tts_backend()
+    if backend is None:
+        return 0
+    made = 0
+    for phrase in phrases:
+        if not phrase.strip() or premade(phrase) or os.path.exists(tts_path(phrase, backend)):
+            continue
+        path = tts_path(phrase, backend)
+        if synthesize(phrase, backend, path):
+            evict(os.path.dirname(path), tts_budget(), keep=path)
+            made += 1
+    return made
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild = commands.add_parser("build", help="decode cached MP3s with the volume applied, then pack them")
+    rebuild.add_argument("--force", action="store_true", help="decode every clip, even if up to date")
+    commands.add_parser("pack", help="pack the cached clips as they are (no decoder needed)")
+    commands.add_parser("verify", help="check the pack; list notification phrases missing from it")
+    trial = commands.add_parser("play", help="play one phrase from the pack")
+    trial.add_argument("text", help="phrase, exactly as notification.py announces it")
+    spoken = commands.add_parser("say", help="speak any text through the TTS cache")
+    spoken.add_argument("text")
+    prewarm = commands.add_parser("warm", help="synthesize the alerts of a project that have no pre-made clip")
+    prewarm.add_argument("--project", default=os.path.basename(os.getcwd()), help="default: this directory's name")
+    prewarm.add_argument("--session", default="", help="session id, for templates that use {session}")
+    usage = commands.add_parser("tts-cache", help="size of the TTS cache")
+    usage.add_argument("--clear", action="store_true", help="delete every cached clip")
+    args = parser.parse_args()
+
+    if args.command in ("say", "warm") and tts_backend() is None:
+        print("no TTS backend (install espeak-ng, or set CODEX_TTS_BACKEND)", file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == "say":
+        import time
+
+        started = time.perf_counter()
+        cached = os.path.exists(tts_path(args.text, tts_backend()))
+        played = speak(args.text)
+        print(f"{'cached' if cached else 'synthesized'}, {(time.perf_counter() - started) * 1000:.0f} ms"
+              f"{'' if played else ' (not played: no working sink)'}", file=sys.stderr)
+        sys.exit(0 if played else 1)
+
+    if args.command == "warm":
+        from notification import expected_phrases
+        phrases = expected_phrases({"project": args.project, "session": args.session[:8]})
+        print(f"synthesized {warm(phrases)} of {len(phrases)} phrases into {tts_dir()}")
+        return
+
+    if args.command == "tts-cache":
+        directory = tts_dir()
+        if args.clear:
+            evict(directory, 0)
+        try:
+            sizes = [entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith(".wav")]
+        except OSError:
+            sizes = []
+        print(f"{len(sizes)} clips, {sum(sizes)} of {tts_budget()} bytes in {directory}")
+        return
+
+    if args.command == "build":
+        try:
+            built, fresh, failed = build(args.force)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        print(f"decoded {built}, up to date {fresh}, failed {len(failed)} (volume {volume()}, {PCM_DIR})")
+        for name in failed:
+            print(f"  failed: {name}", file=sys.stderr)
+        print(f"packed {pack()} clips into {PACK_PATH}")
+        sys.exit(1 if failed else 0)
+
+    if args.command == "pack":
+        print(f"packed {pack()} clips into {PACK_PATH}")
+        return
+
+    if args.command == "verify":
+        problems, missing = verify()
+        for problem in problems:
+            print(f"problem: {problem}")
+        for phrase in missing:
+            print(f"missing: {phrase}")
+        if not problems and not missing:
+            print(f"ok: {open_pack().count} clips, every notification phrase present")
+        sys.exit(1 if problems or missing else 0)
+
+    if open_pack() is None or open_pack().find(args.text) is None:
+        print(f"not in the pack: {args.text} (run: python3 {os.path.basename(__file__)} verify)", file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0 if play(args.text) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+"""
+Native desktop notifications over D-Bus (Linux).
+Talks to org.freedesktop.Notifications on the session bus through one
+reused connection, with the wire protocol implemented here (no dbus-python),
+so an alert costs a socket round trip instead of a notify-send process.
+Each alert replaces the previous one (replaces_id) instead of stacking.
+notification.py falls back to notify-send when there is no session bus.
+
+    python3 dbus_notify.py send "Codex" "Hello"     # one notification
+    python3 dbus_notify.py stub-server              # print notifications (a test bus without a desktop)
+    python3 dbus_notify.py check                    # replaces_id round trip on a private bus (exit 1 on failure)
+"""
+
+import os
+import socket
+import struct
+import sys
+
+NOTIFICATIONS = "org.freedesktop.Notifications"
+NOTIFICATIONS_PATH = "/org/freedesktop/Notifications"
+BUS = "org.freedesktop.DBus"
+BUS_PATH = "/org/freedesktop/DBus"
+TIMEOUT = 1.0  # seconds for connecting and for each reply
+
+METHOD_CALL, METHOD_RETURN, ERROR, SIGNAL = 1, 2, 3, 4
+FIELD_PATH, FIELD_INTERFACE, FIELD_MEMBER, FIELD_ERROR_NAME = 1, 2, 3, 4
+FIELD_REPLY_SERIAL, FIELD_DESTINATION, FIELD_SENDER, FIELD_SIGNATURE = 5, 6, 7, 8
+FIELD_TYPES = {FIELD_PATH: "o", FIELD_INTERFACE: "s", FIELD_MEMBER: "s", FIELD_ERROR_NAME: "s",
+               FIELD_REPLY_SERIAL: "u", FIELD_DESTINATION: "s", FIELD_SENDER: "s", FIELD_SIGNATURE: "g"}
+
+
+class DBusError(Exception):
+    """Authentication failed, a malformed message, or an error reply."""
+
+
+# =============================================================================
+# Marshalling
+# =============================================================================
+
+FIXED = {"y": "B", "b": "I", "n": "h", "q": "H", "i": "i", "u": "I", "x": "q", "t": "Q", "d": "d", "h": "I"}
+ALIGN = {"y": 1, "b": 4, "n": 2, "q": 2, "i": 4, "u": 4, "x": 8, "t": 8, "d": 8, "h": 4,
+         "s": 4, "o": 4, "g": 1, "v": 1, "a": 4, "(": 8, "{": 8}
+
+
+def type_end(signature: str, start: int) -> int:
+    """Index just past the single complete type starting at signature[start]."""
+    c = signature[start]
+    if c == "a":
+        return type_end(signature, start + 1)
+    if c in "({":
+        depth, i = 0, start
+        while True:
+            if signature[i] in "({":
+                depth += 1
+            elif signature[i] in ")}":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+    return start + 1
+
+
+def split_signature(signature: str) -> list[str]:
+    types, i = [], 0
+    while i < len(signature):
+        end = type_end(signature, i)
+        types.append(signature[i:end])
+        i = end
+    return types
+
+
+class Writer:
+    def __init__(self):
+        self.buf = bytearray()
+
+    def align(self, n: int) -> None:
+        self.buf.extend(b"\0" * (-len(self.buf) % n))
+
+    def write(self, signature: str, value) -> None:
+        c = signature[0]
+        if c in FIXED:
+            self.align(ALIGN[c])
+            self.buf += struct.pack("<" + FIXED[c], value)
+        elif c in "so":
+            data = value.encode("utf-8")
+            self.align(4)
+            self.buf += struct.pack("<I", len(data)) + data + b"\0"
+        elif c == "g":
+            data = value.encode("ascii")
+            self.buf += bytes([len(data)]) + data + b"\0"
+        elif c == "v":
+            inner_signature, inner = value
+            self.write("g", inner_signature)
+            self.write(inner_signature, inner)
+        elif c == "a":
+            element = signature[1:]
+            self.align(4)
+            length_at = len(self.buf)
+            self.buf += b"\0\0\0\0"
+            self.align(ALIGN[element[0]])
+            start = len(self.buf)
+            for item in (value.items() if element[0] == "{" else value):
+                self.write(element, item)
+            struct.pack_into("<I", self.buf, length_at, len(self.buf) - start)
+        elif c in "({":
+            self.align(8)
+            for member, item in zip(split_signature(signature[1:-1]), value):
+                self.write(member, item)
+        else:
+            raise DBusError(f"cannot marshal type {signature!r}")
+
+
+class Reader:
+    def __init__(self, data: bytes, order: str, offset: int = 0):
+        self.data, self.order, self.pos = data, order, offset
+
+    def align(self, n: int) -> None:
+        self.pos += -self.pos % n
+
+    def read(self, signature: str):
+        c = signature[0]
+        if c in FIXED:
+            self.align(ALIGN[c])
+            fmt = self.order + FIXED[c]
+            value = struct.unpack_from(fmt, self.data, self.pos)[0]
+            self.pos += struct.calcsize(fmt)
+            return bool(value) if c == "b" else value
+        if c in "so":
+            length = self.read("u")
+            value = bytes(self.data[self.pos:self.pos + length]).decode("utf-8")
+            self.pos += length + 1
+            return value
+        if c == "g":
+            length = self.data[self.pos]
+            value = bytes(self.data[self.pos + 1:self.pos + 1 + length]).decode("ascii")
+            self.pos += length + 2
+            return value
+        if c == "v":
+            inner_signature = self.read("g")
+            return self.read(inner_signature)
+        if c == "a":
+            element = signature[1:]
+            length = self.read("u")
+            self.align(ALIGN[element[0]])
+            end = self.pos + length
+            items = []
+            while self.pos < end:
+                items.append(self.read(element))
+            return dict(items) if element[0] == "{" else items
+        if c in "({":
+            self.align(8)
+            return tuple(self.read(member) for member in split_signature(signature[1:-1]))
+        raise DBusError(f"cannot unmarshal type {signature!r}")
+
+
+def encode_message(kind: int, serial: int, fields: dict, signature: str = "", body: tuple = (),
+                   flags: int = 0) -> bytes:
+    payload = Writer()
+    for member, value in zip(split_signature(signature), body):
+        payload.write(member, value)
+    if signature:
+        fields = {**fields, FIELD_SIGNATURE: signature}
+    header = Writer()
+    for member, value in zip("yyyyuu", (ord("l"), kind, flags, 1, len(payload.buf), serial)):
+        header.write(member, value)
+    header.write("a(yv)", [(code, (FIELD_TYPES[code], value)) for code, value in sorted(fields.items())])
+    header.align(8)
+    return bytes(header.buf + payload.buf)
+
+
+# =============================================================================
+# Connection
+# =============================================================================
+
+
+def session_address() -> str | None:
+    """DBUS_SESSION_BUS_ADDRESS, else the systemd per-user bus socket if present."""
+    address = os.environ.get("DBUS_SESSION_BUS_ADDRESS")
+    if address:
+        return address
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime and os.path.exists(os.path.join(runtime, "bus")):
+        return "unix:path=" + os.path.join(runtime, "bus")
+    return None
+
+
+def connect_socket(address: str, timeout: float) -> socket.socket:
+    """Connect to the first reachable unix: entry of a D-Bus address list."""
+    from urllib.parse import unquote
+
+    for entry in address.split(";"):
+        transport, _, params = entry.partition(":")
+        options = dict(param.split("=", 1) for param in params.split(",") if "=" in param)
+        if transport != "unix":
+            continue
+        if "path" in options:
+            target = unquote(options["path"])
+        elif "abstract" in options:
+            target = "\0" + unquote(options["abstract"])
+        else:
+            continue
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(target)
+            return sock
+        except OSError:
+            sock.close()
+    raise ConnectionRefusedError(f"no reachable unix transport in {address!r}")
+
+
+class Connection:
+    """An authenticated session-bus connection (SASL EXTERNAL), registered with Hello."""
+
+    def __init__(self, address: str | None = None, timeout: float | None = TIMEOUT):
+        self.address = address or session_address()
+        if self.address is None:
+            raise ConnectionRefusedError("no session bus")
+        self.sock = connect_socket(self.address, TIMEOUT)
+        self.buffer = bytearray()
+        self.serial = 0
+        try:
+            self.authenticate()
+            self.sock.settimeout(timeout)
+            self.unique_name = self.call(BUS, BUS_PATH, BUS, "Hello")[0]
+        except BaseException:
+            self.close()
+            raise
+
+    def authenticate(self) -> None:
+        uid = str(os.getuid()).encode("ascii").hex().encode("ascii")
+        self.sock.sendall(b"\0AUTH EXTERNAL " + uid + b"\r\n")
+        while b"\r\n" not in self.buffer:
+            self.fill()
+        line, _, rest = bytes(self.buffer).partition(b"\r\n")
+        if not line.startswith(b"OK "):
+            raise DBusError(f"authentication rejected: {line.decode('ascii', 'replace')}")
+        self.buffer = bytearray(rest)
+        self.sock.sendall(b"BEGIN\r\n")
+
+    def fill(self) -> None:
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise ConnectionResetError("bus closed the connection")
+        self.buffer += chunk
+
+    def send(self, kind: int, fields: dict, signature: str = "", body: tuple = (), flags: int = 0) -> int:
+        self.serial += 1
+        self.sock.sendall(encode_message(kind, self.serial, fields, signature, body, flags))
+        return self.serial
+
+    def receive(self) -> tuple[int, int, dict, tuple]:
+        """The next message: (kind, serial, header fields, body)."""
+        while len(self.buffer) < 16:
+            self.fill()
+        order = "<" if self.buffer[0] == ord("l") else ">"
+        body_length, serial, fields_length = struct.unpack_from(order + "III", self.buffer, 4)
+        header_length = 16 + fields_length + (-(16 + fields_length) % 8)
+        while len(self.buffer) < header_length + body_length:
+            self.fill()
+        data = bytes(self.buffer[:header_length + body_length])
+        del self.buffer[:header_length + body_length]
+        fields = dict(Reader(data, order, 12).read("a(yv)"))
+        body = Reader(data, order, header_length)
+        signature = fields.get(FIELD_SIGNATURE, "")
+        return data[1], serial, fields, tuple(body.read(member) for member in split_signature(signature))
+
+    def call(self, destination: str, path: str, interface: str, member: str,
+             signature: str = "", body: tuple = ()) -> tuple:
+        """Method call; returns the reply body. Signals and other traffic in between are skipped."""
+        serial = self.send(METHOD_CALL, {FIELD_PATH: path, FIELD_INTERFACE: interface, FIELD_MEMBER: member,
+                                         FIELD_DESTINATION: destination}, signature, body)
+        while True:
+            kind, _, fields, reply = self.receive()
+            if fields.get(FIELD_REPLY_SERIAL) != serial:
+                continue
+            if kind == ERROR:
+                detail = f": {reply[0]}" if reply and isinstance(reply[0], str) else ""
+                raise DBusError(fields.get(FIELD_ERROR_NAME, "error") + detail)
+            return reply
+
+    def reply(self, serial: int, destination: str, signature: str = "", body: tuple = (),
+              error: str | None = None) -> None:
+        fields = {FIELD_REPLY_SERIAL: serial, FIELD_DESTINATION: destination}
+        if error:
+            fields[FIELD_ERROR_NAME] = error
+        self.send(ERROR if error else METHOD_RETURN, fields, signature, body)
+
+    def close(self) -> None:
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+# =============================================================================
+# Notifications
+# =============================================================================
+
+
+class Notifier:
+    """
+    Sends notifications over a connection that is opened on first use and
+    kept, so a resident process pays the connect and Hello once. The id of
+    the last notification is kept in id_path (shared by hook processes) and
+    passed as replaces_id, so each alert updates the previous one in place.
+    """
+
+    def __init__(self, app_name: str, hints: dict | None = None, id_path: str | None = None):
+        self.app_name = app_name
+        self.hints = {name: ("s", value) for name, value in (hints or {}).items()}
+        self.id_path = id_path
+        self.conn = None
+
+    def last_id(self, address: str) -> int:
+        """The previous notification's id, if it was sent on this bus (ids are per server)."""
+        if not self.id_path:
+            return 0
+        try:
+            with open(self.id_path, encoding="utf-8") as f:
+                saved_id, _, saved_address = f.read().partition(" ")
+            return int(saved_id) if saved_address == address else 0
+        except (OSError, ValueError):
+            return 0
+
+    def save_id(self, notification_id: int, address: str) -> None:
+        if not self.id_path:
+            return
+        tmp = f"{self.id_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.id_path), mode=0o700, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(f"{notification_id} {address}")
+            os.replace(tmp, self.id_path)
+        except OSError:
+            pass
+
+    def notify(self, title: str, message: str, timeout_ms: int = -1) -> int:
+        """Show (or update) the notification; returns its id. Reconnects once if the bus went away."""
+        for attempt in (1, 2):
+            try:
+                if self.conn is None:
+                    self.conn = Connection()
+                address = self.conn.address
+                body = (self.app_name, self.last_id(address), "", title, message, [], self.hints, timeout_ms)
+                (notification_id,) = self.conn.call(NOTIFICATIONS, NOTIFICATIONS_PATH, NOTIFICATIONS, "Notify",
+                                                    "susssasa{sv}i", body)
+                self.save_id(notification_id, address)
+                return notification_id
+            except OSError:
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def stub_server(address: str | None = None) -> None:
+    """
+    Own org.freedesktop.Notifications and print each Notify call as a JSON
+    line, for testing against a private dbus-daemon without a desktop.
+    """
+    import json
+
+    conn = Connection(address, timeout=None)
+    (result,) = conn.call(BUS, BUS_PATH, BUS, "RequestName", "su", (NOTIFICATIONS, 4))  # DO_NOT_QUEUE
+    if result != 1:
+        raise DBusError(f"{NOTIFICATIONS} is already owned on this bus")
+    print(json.dumps({"listening": conn.address}), flush=True)
+    next_id = 0
+    while True:
+        kind, serial, fields, body = conn.receive()
+        if kind != METHOD_CALL:
+            continue
+        member, sender = fields.get(FIELD_MEMBER), fields.get(FIELD_SENDER, "")
+        if member == "Notify":
+            app_name, replaces_id, _, summary, text, _, hints, _ = body
+            if not replaces_id:
+                next_id += 1
+            notification_id = replaces_id or next_id
+            print(json.dumps({"id": notification_id, "replaces_id": replaces_id, "app_name": app_name,
+                              "summary": summary, "body": text, "hints": hints}), flush=True)
+            conn.reply(serial, sender, "u", (notification_id,))
+        elif member == "GetServerInformation":
+            conn.reply(serial, sender, "ssss", ("codex-stub", "codex", "1", "1.2"))
+        elif member == "GetCapabilities":
+            conn.reply(serial, sender, "as", (["body"],))
+        elif member == "CloseNotification":
+            conn.reply(serial, sender)
+        else:
+            conn.reply(serial, sender, "s", (f"no method {member}",), error="org.freedesktop.DBus.Error.UnknownMethod")
+
+
+# Private session bus for `check`: any client may own any name and call anyone
+CHECK_TIMEOUT = 5.0  # seconds to wait for each line from the bus or the stub server
+CHECK_BUS_CONFIG = """<!DOCTYPE busconfig PUBLIC "-//freedesktop//DTD D-Bus Bus Configuration 1.0//EN"
+ "http://www.freedesktop.org/standards/dbus/1.0/busconfig.dtd">
+<busconfig>
+  <type>session</type>
+  <listen>unix:dir={directory}</listen>
+  <auth>EXTERNAL</auth>
+  <policy context="default">
+    <allow send_destination="*"/>
+    <allow receive_sender="*"/>
+    <allow own="*"/>
+  </policy>
+</busconfig>
+"""
+
+
+def check(sends: int = 3) -> list[str]:
+    """
+    Start a private dbus-daemon and a stub server on it, send notifications
+    the way hook processes do (a new Notifier per alert, one shared id_path)
+    and check that each after the first passes the first one's id as
+    replaces_id. Returns the failures; empty means the round trip works.
+    """
+    import json
+    import select
+    import shutil
+    import subprocess
+    import tempfile
+
+    def read_line(process) -> str:
+        if not select.select([process.stdout], [], [], CHECK_TIMEOUT)[0]:
+            return ""
+        return process.stdout.readline().strip()
+
+    daemon = shutil.which("dbus-daemon")
+    if daemon is None:
+        return ["dbus-daemon not found"]
+    with tempfile.TemporaryDirectory(prefix="codex-dbus-check-") as tmp:
+        config = os.path.join(tmp, "bus.conf")
+        with open(config, "w", encoding="utf-8") as f:
+            f.write(CHECK_BUS_CONFIG.format(directory=tmp))
+        bus = subprocess.Popen([daemon, f"--config-file={config}", "--nofork", "--print-address=1"],
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        server, saved_address = None, os.environ.get("DBUS_SESSION_BUS_ADDRESS")
+        try:
+            address = read_line(bus)
+            if not address:
+                return ["dbus-daemon did not print its address"]
+            env = dict(os.environ, DBUS_SESSION_BUS_ADDRESS=address)
+            server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "stub-server"],
+                                      stdout=subprocess.PIPE, env=env, text=True)
+            if "listening" not in json.loads(read_line(server) or "{}"):
+                return ["stub server did not start"]
+
+            os.environ["DBUS_SESSION_BUS_ADDRESS"] = address
+            id_path = os.path.join(tmp, "notification_id")
+            failures, first_id = [], None
+            for number in range(1, sends + 1):
+                notifier = Notifier("Codex", id_path=id_path)
+                try:
+                    notification_id = notifier.notify("Codex", f"check {number}")
+                finally:
+                    notifier.close()
+                received = json.loads(read_line(server) or "{}")
+                expected_replaces = 0 if first_id is None else first_id
+                first_id = notification_id if first_id is None else first_id
+                if received.get("body") != f"check {number}":
+                    failures.append(f"send {number}: stub server received {received}")
+                elif received.get("replaces_id") != expected_replaces:
+                    failures.append(f"send {number}: replaces_id {received.get('replaces_id')}, "
+                                    f"expected {expected_replaces}")
+                elif notification_id != first_id:
+                    failures.append(f"send {number}: got id {notification_id}, expected {first_id}")
+            return failures
+        finally:
+            if saved_address is None:
+                os.environ.pop("DBUS_SESSION_BUS_ADDRESS", None)
+            else:
+                os.environ["DBUS_SESSION_BUS_ADDRESS"] = saved_address
+            for process in (server, bus):
+                if process is not None:
+                    process.kill()
+                    process.wait()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    send = commands.add_parser("send", help="send one notification")
+    send.add_argument("title")
+    send.add_argument("message")
+    commands.add_parser("stub-server", help="own the notification service and print what it receives")
+    commands.add_parser("check", help="check replaces_id reuse against a stub server on a private bus")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "send":
+            print(Notifier("Codex").notify(args.title, args.message))
+        elif args.command == "check":
+            failures = check()
+            for failure in failures:
+                print(failure, file=sys.stderr)
+            print("FAIL" if failures else "OK")
+            sys.exit(1 if failures else 0)
+        else:
+            stub_server()
+    except (OSError, DBusError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
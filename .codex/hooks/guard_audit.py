@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Guard audit store (optional) and query CLI.
+With CODEX_GUARD_AUDIT=sqlite (or "both"), guard.py records every decision
+in <log dir>/audit.sqlite3 (WAL mode, indexed by time, tool, verdict and
+reason) instead of (or as well as) the JSON Lines log. Query it with:
+
+    python3 guard_audit.py blocked --days 7      # blocked calls by reason
+    python3 guard_audit.py top --days 30         # most frequent commands
+    python3 guard_audit.py recent --blocked      # latest decisions
+    python3 guard_audit.py import                # backfill from the JSONL logs
+"""
+
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+DB_NAME = 'audit.sqlite3'
+SCHEMA_VERSION = 1
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS decisions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,               -- unix time
+    tool_name TEXT NOT NULL,
+    blocked INTEGER NOT NULL,
+    reason TEXT,
+    subject TEXT,                   -- Bash command or the tool's path
+    tool_input TEXT NOT NULL        -- JSON
+);
+CREATE INDEX IF NOT EXISTS decisions_ts ON decisions (ts);
+CREATE INDEX IF NOT EXISTS decisions_tool ON decisions (tool_name, ts);
+CREATE INDEX IF NOT EXISTS decisions_blocked ON decisions (blocked, ts, reason);
+CREATE INDEX IF NOT EXISTS decisions_reason ON decisions (reason, ts)
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open the audit database, creating it on first use. Safe for many
+    concurrent hook processes: in WAL mode readers never block the writer,
+    and writers wait up to BUSY_TIMEOUT_MS for each other instead of failing.
+    """
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # Owner-only; SQLite gives the -wal/-shm files the same mode
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False)
+    # WAL + NORMAL: a crash cannot corrupt the database, commits skip fsync
+    conn.execute('PRAGMA synchronous=NORMAL')
+    if conn.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for statement in SCHEMA.split(';'):
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    return conn
+
+
+def subject_of(tool_name: str, tool_input: dict) -> str | None:
+    """What a decision was about: the Bash command, else the path the tool works on (see TOOL_PATH_FIELDS)."""
+    from guard_core import TOOL_PATH_FIELDS
+
+    if not isinstance(tool_input, dict):
+        return None
+    if tool_name == 'Bash':
+        return tool_input.get('command')
+    return tool_input.get(TOOL_PATH_FIELDS.get(tool_name, ('file_path',))[0])
+
+
+INSERT = 'INSERT INTO decisions (ts, tool_name, blocked, reason, subject, tool_input) VALUES (?, ?, ?, ?, ?, ?)'
+
+# A log line's timestamp is the hook's time truncated to microseconds
+# (guard_core.timestamp), while the hook stores that time as is: a row and
+# the log line it was written with are this close
+SAME_RECORD_SECONDS = 2e-6
+
+
+def entry_row(ts: float, entry: dict) -> tuple:
+    """INSERT parameters for one guard.py log entry."""
+    tool_name = entry.get('tool_name', '')
+    tool_input = entry.get('tool_input', {})
+    return (ts, tool_name, int(bool(entry.get('blocked'))), entry.get('reason'), subject_of(tool_name, tool_input),
+            json.dumps(tool_input, ensure_ascii=False, separators=(',', ':')))
+
+
+class AuditStore:
+    """Decision writer used by guard.py; the connection is opened on first use and kept."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = None
+
+    def record(self, records: list[tuple[float, dict]]) -> None:
+        """Insert (unix time, log entry) pairs in one transaction."""
+        if self.conn is None:
+            self.conn = connect(self.path)
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.executemany(INSERT, [entry_row(ts, entry) for ts, entry in records])
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+    def close(self) -> None:
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# =============================================================================
+# Queries
+# =============================================================================
+
+
+def since(days: float) -> float:
+    """Unix time `days` ago; 0 (everything) when days is 0."""
+    return time.time() - days * 86400 if days > 0 else 0.0
+
+
+def blocked_by_reason(conn: sqlite3.Connection, days: float) -> list[tuple]:
+    return conn.execute(
+        'SELECT reason, COUNT(*) AS calls, MAX(ts) AS last FROM decisions'
+        ' WHERE blocked = 1 AND ts >= ? GROUP BY reason ORDER BY calls DESC',
+        (since(days),),
+    ).fetchall()
+
+
+def top_subjects(conn: sqlite3.Connection, days: float, tool_name: str = 'Bash',
+                 limit: int = 20, blocked_only: bool = False) -> list[tuple]:
+    return conn.execute(
+        'SELECT COUNT(*) AS calls, SUM(blocked), subject FROM decisions'
+        ' WHERE tool_name = ? AND ts >= ?' + (' AND blocked = 1' if blocked_only else '') +
+        ' GROUP BY subject ORDER BY calls DESC LIMIT ?',
+        (tool_name, since(days), limit),
+    ).fetchall()
+
+
+def recent(conn: sqlite3.Connection, limit: int = 20, blocked_only: bool = False) -> list[tuple]:
+    return conn.execute(
+        'SELECT ts, tool_name, blocked, reason, subject FROM decisions' +
+        (' WHERE blocked = 1' if blocked_only else '') + ' ORDER BY ts DESC LIMIT ?',
+        (limit,),
+    ).fetchall()
+
+
+# =============================================================================
+# Import of JSON Lines / legacy JSON array logs
+# =============================================================================
+
+
+def read_log(path: str, raw: bool = False):
+    """
+    Records of a pre_tool_use.jsonl segment or a legacy pre_tool_use.json
+    array, read incrementally: memory does not grow with the file. With raw,
+    JSON Lines records are yielded as unparsed lines (array elements are
+    always parsed), for callers that parse them elsewhere.
+    """
+    with open(path, encoding='utf-8') as f:
+        head = f.readline()
+        if head.lstrip().startswith('['):
+            yield from read_array(f, head.lstrip()[1:])
+            return
+        for line in itertools.chain((head,), f):
+            if raw:
+                if line.strip():
+                    yield line
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn or foreign line
+
+
+def read_array(f, buffer: str):
+    """Elements of a JSON array whose '[' has been consumed, decoded one at a time from f."""
+    decoder = json.JSONDecoder()
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            element, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            # Element incomplete: read at least as much again, so a large one is not re-parsed per chunk
+            chunk = f.read(max(65536, len(buffer)))
+            if not chunk:
+                return  # truncated array
+            buffer += chunk
+            continue
+        yield element
+        buffer = buffer[end:]
+
+
+def import_logs(conn: sqlite3.Connection, paths: list[str]) -> int:
+    """Insert the records of paths, oldest file first; records already present are skipped."""
+    from datetime import datetime
+
+    imported = 0
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for path in paths:
+            for entry in read_log(path):
+                if not isinstance(entry, dict) or 'timestamp' not in entry:
+                    continue
+                ts = datetime.fromisoformat(entry['timestamp']).timestamp()
+                row = entry_row(ts, entry)
+                if conn.execute('SELECT 1 FROM decisions WHERE tool_name = ? AND ts > ? AND ts < ? AND tool_input = ?',
+                                (row[1], ts - SAME_RECORD_SECONDS, ts + SAME_RECORD_SECONDS, row[5])).fetchone():
+                    continue
+                conn.execute(INSERT, row)
+                imported += 1
+        conn.execute('COMMIT')
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    return imported
+
+
+def log_files(log_dir: str) -> list[str]:
+    """Existing guard logs in log_dir, oldest first."""
+    from guard_core import LOG_NAME
+
+    base = os.path.join(log_dir, LOG_NAME)
+    rotated = sorted(
+        (name for name in os.listdir(log_dir) if name.startswith(LOG_NAME + '.') and name[len(LOG_NAME) + 1:].isdigit()),
+        key=lambda name: int(name[len(LOG_NAME) + 1:]), reverse=True,
+    )
+    candidates = [os.path.join(log_dir, 'pre_tool_use.json')] + [os.path.join(log_dir, n) for n in rotated] + [base]
+    return [path for path in candidates if os.path.isfile(path)]
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+
+def default_log_dir() -> str:
+    from hook_paths import resolve_log_dir
+    return resolve_log_dir()
+
+
+def format_ts(ts: float) -> str:
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ts))
+
+
+def one_line(text: str | None, width: int = 100) -> str:
+    """text on one line, whitespace runs collapsed, cut to width."""
+    text = ' '.join((text or '').split())
+    return text if len(text) <= width else text[:width - 1] + '…'
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help=f'audit database (default: <log dir>/{DB_NAME})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument('--json', action='store_true', help='print rows as JSON')
+
+    blocked = commands.add_parser('blocked', parents=[output], help='blocked calls by reason')
+    blocked.add_argument('--days', type=float, default=7, help='look back this many days (0 = all)')
+
+    top = commands.add_parser('top', parents=[output], help='most frequent commands (or paths with --tool)')
+    top.add_argument('--days', type=float, default=7, help='look back this many days (0 = all)')
+    top.add_argument('--tool', default='Bash')
+    top.add_argument('--limit', type=int, default=20)
+    top.add_argument('--blocked', action='store_true', help='only blocked calls')
+
+    latest = commands.add_parser('recent', parents=[output], help='latest decisions')
+    latest.add_argument('--limit', type=int, default=20)
+    latest.add_argument('--blocked', action='store_true', help='only blocked calls')
+
+    backfill = commands.add_parser('import', help='load JSONL (or legacy JSON) logs into the database')
+    backfill.add_argument('files', nargs='*', help='log files, oldest first (default: the guard logs)')
+
+    args = parser.parse_args()
+    needs_log_dir = not args.db or (args.command == 'import' and not args.files)
+    log_dir = default_log_dir() if needs_log_dir else None
+    conn = connect(args.db or os.path.join(log_dir, DB_NAME))
+
+    started = time.perf_counter()
+    if args.command == 'import':
+        files = args.files or log_files(log_dir)
+        print(f"imported {import_logs(conn, files)} records from {len(files)} file(s)")
+        return
+
+    if args.command == 'blocked':
+        rows = blocked_by_reason(conn, args.days)
+        header = ('calls', 'last', 'reason')
+        table = [(calls, format_ts(last), reason) for reason, calls, last in rows]
+    elif args.command == 'top':
+        rows = top_subjects(conn, args.days, args.tool, args.limit, args.blocked)
+        header = ('calls', 'blocked', 'subject')
+        table = [(calls, blocked_calls, one_line(subject)) for calls, blocked_calls, subject in rows]
+    else:
+        rows = recent(conn, args.limit, args.blocked)
+        header = ('time', 'tool', 'verdict', 'subject')
+        table = [(format_ts(ts), tool, f"BLOCKED: {reason}" if is_blocked else 'allowed', one_line(subject, 80))
+                 for ts, tool, is_blocked, reason, subject in rows]
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if args.json:
+        print(json.dumps([dict(zip(header, row)) for row in table], ensure_ascii=False, indent=2))
+        return
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *table)]
+    for row in [header, *table]:
+        print('  '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+    print(f"({len(table)} rows, {elapsed_ms:.1f} ms)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Options of guard.py besides the hook itself: --daemon, --stream, --drain,
+--rule-report and --startup-report. Each loads the module it needs; a hook
+call never imports this one (nor argparse, which costs more than a check).
+A bad option or an invalid rule file is reported as one line on stderr
+with exit code 1; --stream exits 2 when an event is blocked, like the hook.
+"""
+
+import os
+import sys
+
+from hook_paths import HOOKS_DIR, default_socket_path, resolve_log_dir
+
+
+def startup_report() -> int:
+    """--startup-report: import, setup and end-to-end timings against the hook budget."""
+    from guard_core import evaluate, get_rules, load_rules, log_action
+    from startup_report import run_report
+
+    event = {"tool_name": "Bash", "tool_input": {"command": "git status"}}
+
+    def measure_phases(timed):
+        log_dir = timed('resolve_log_dir (probe)', resolve_log_dir)
+        timed('resolve_log_dir (cached)', resolve_log_dir)
+        timed('load rules (compile)', load_rules)
+        timed('load rules (cached)', load_rules)
+        get_rules()
+        timed('evaluate', evaluate, event['tool_name'], event['tool_input'])
+        timed('log_action', log_action, log_dir, event)
+
+    return run_report(os.path.join(HOOKS_DIR, 'guard.py'), event, measure_phases)
+
+
+def parse_options(argv: list[str]):
+    import argparse
+
+    class Parser(argparse.ArgumentParser):
+        def error(self, message):
+            self.exit(1, f"{self.prog}: {message}\n")
+
+    def positive(value):
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number < 1:
+            raise argparse.ArgumentTypeError(f"expected a positive integer, got {value!r}")
+        return number
+
+    parser = Parser(prog='guard.py', description='PreToolUse guard; without options, screens one hook event on stdin.')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--daemon', nargs='?', const='', metavar='SOCKET',
+                      help='serve verdicts over a Unix socket (default: $CODEX_GUARD_SOCKET or the runtime dir)')
+    mode.add_argument('--stream', action='store_true', help='screen NDJSON tool events from stdin')
+    mode.add_argument('--drain', action='store_true', help='flush the deferred-logging spool now')
+    mode.add_argument('--rule-report', action='store_true', help='report per-rule statistics')
+    mode.add_argument('--startup-report', action='store_true', help='time imports, setup and a hook run')
+    parser.add_argument('--jobs', type=positive, default=1, help='--stream worker processes')
+    parser.add_argument('--top', type=positive, default=10, help='--rule-report rows per list')
+    parser.add_argument('--metrics', action='store_true', help='record per-phase metrics (like CODEX_HOOK_METRICS=1)')
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    from guard_core import RuleFileError
+
+    args = parse_options(sys.argv[1:] if argv is None else argv)
+    try:
+        if args.startup_report:
+            return startup_report()
+
+        if args.rule_report:
+            from guard_stats import rule_report
+            return rule_report(args.top)
+
+        if args.daemon is not None:
+            from guard_daemon import serve
+            serve(args.daemon or default_socket_path())
+            return 0
+
+        if args.drain:
+            # Flush the deferred-logging spool now (cron, shutdown scripts)
+            from guard_spool import drain_spool
+            print(f"drained {drain_spool()} spooled record(s)", file=sys.stderr)
+            return 0
+
+        from guard_core import save_rule_stats
+        from guard_stream import screen_stream
+        code = screen_stream(sys.stdin, sys.stdout, jobs=args.jobs)
+        save_rule_stats()
+        return code
+    except RuleFileError as e:
+        print(f"guard.py: invalid guard rules: {e}", file=sys.stderr)
+        return 1
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+PreToolUse Hook client (Claude Code / Codex)
+Forwards the hook event to a resident `guard.py --daemon` over a Unix socket
+and exits with its verdict. If the daemon is unreachable, slow or not ours,
+the event is evaluated in-process by guard.py, so the hook still fails closed.
+"""
+
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from hook_paths import default_socket_path
+
+TIMEOUT = 0.5
+
+
+def ask_daemon(payload: bytes) -> tuple[int, str] | None:
+    """Return (exit code, stderr message) from the daemon, or None to fall back."""
+    if not hasattr(socket, 'AF_UNIX') or not hasattr(os, 'getuid'):
+        return None
+    try:
+        socket_path = default_socket_path()
+        # Only trust a socket owned by us (another user could serve "allow")
+        if os.stat(socket_path).st_uid != os.getuid():
+            return None
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(float(os.environ.get('CODEX_GUARD_TIMEOUT', TIMEOUT)))
+            sock.connect(socket_path)
+            sock.sendall(payload)
+            sock.shutdown(socket.SHUT_WR)
+            chunks = []
+            while chunk := sock.recv(65536):
+                chunks.append(chunk)
+        code, _, message = b''.join(chunks).decode('utf-8').partition('\n')
+        return int(code), message
+    except (OSError, ValueError):
+        return None
+
+
+def main():
+    payload = sys.stdin.buffer.read()
+
+    reply = ask_daemon(payload)
+    if reply is None:
+        try:
+            import guard
+        except Exception:
+            # guard.py missing or broken - block (fail-close)
+            sys.exit(2)
+        guard.main(payload)
+        return
+
+    code, message = reply
+    if message:
+        print(message, file=sys.stderr)
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
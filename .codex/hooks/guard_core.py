@@ -0,0 +1,2143 @@
+"""
+Guard checks behind the PreToolUse hook (guard.py).
+Rule tables and their compiled matchers, shell segmentation, the path
+policy, the audit log, evaluate() and handle_event(): what one hook call
+runs. guard.py imports this module, so its bytecode is cached in
+__pycache__ instead of compiled from source on every call. The daemon,
+--stream, the spool collector, the verdict cache and the rule report live
+in guard_daemon.py, guard_stream.py, guard_spool.py, guard_verdicts.py and
+guard_stats.py, imported only when used.
+"""
+
+import functools
+import json
+import os
+import posixpath
+import re
+import sys
+import time
+
+from hook_paths import SCRIPT_ROOT, forget_log_dir, resolve_log_dir, state_dir
+
+# No platform/pathlib/datetime: their imports cost more than the checks themselves
+# on a hook that runs before every tool call (see --startup-report)
+IS_WINDOWS = sys.platform == "win32"
+
+
+def timestamp(now: float | None = None) -> str:
+    """Local time in datetime.isoformat() layout, without importing datetime."""
+    if now is None:
+        now = time.time()
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(now)) + f'.{int(now % 1 * 1_000_000):06d}'
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+# Audit log: JSON Lines, rotated by size into pre_tool_use.jsonl.1 ... .N (oldest)
+LOG_NAME = 'pre_tool_use.jsonl'
+LOG_SEGMENT_BYTES = env_int('CODEX_GUARD_LOG_SEGMENT_BYTES', 1024 * 1024)
+LOG_SEGMENTS = env_int('CODEX_GUARD_LOG_SEGMENTS', 5)
+
+# Audit backend: "jsonl" (default), "sqlite" (<log dir>/audit.sqlite3, see guard_audit.py) or "both"
+AUDIT_BACKEND = os.environ.get('CODEX_GUARD_AUDIT', 'jsonl')
+
+# Bounded records: string fields of tool_input/reason over LOG_FIELD_BYTES (UTF-8) are cut
+# to that size and listed under "elided" with their SHA-256 and length, and a record is
+# kept under LOG_RECORD_BYTES (0 = log tool input verbatim). With CODEX_GUARD_LOG_BLOBS=1
+# the full values go to <log dir>/blobs/, one file per distinct content
+LOG_FIELD_BYTES = env_int('CODEX_GUARD_LOG_FIELD_BYTES', 4096)
+LOG_RECORD_BYTES = env_int('CODEX_GUARD_LOG_RECORD_BYTES', 16384)
+LOG_BLOBS = os.environ.get('CODEX_GUARD_LOG_BLOBS') == '1'
+
+# "deferred": the verdict goes out first, records are spooled for a background collector
+LOG_MODE = os.environ.get('CODEX_GUARD_LOG_MODE', 'sync')
+
+# Verdict cache size in entries (0 = off); see guard_verdicts.py
+VERDICT_CACHE_ENTRIES = env_int('CODEX_GUARD_VERDICT_CACHE', 0)
+
+# Longest command/file_path screened, in characters (0 = no limit); longer
+# input is blocked without being matched (fail-closed). At 16 Ki the worst
+# input matches in under 20 ms, inside the hook budget (CODEX_HOOK_BUDGET_MS)
+MAX_SCAN = env_int('CODEX_GUARD_MAX_SCAN', 16 * 1024)
+
+# Bash commands made only of allowlisted prefixes (see safe_pipelines) skip the
+# delete, system and docker rules; credential checks still run (0 = off)
+FAST_PATH = env_int('CODEX_GUARD_FAST_PATH', 1)
+
+# realpath() results memoized per process (entries; 0 = off), each for REALPATH_TTL seconds
+REALPATH_CACHE = env_int('CODEX_GUARD_REALPATH_CACHE', 1024)
+REALPATH_TTL = 2.0
+
+
+class NoTimer:
+    """Stands in for hook_metrics.PhaseTimer while per-phase metrics are off (the default)."""
+
+    def mark(self, phase: str) -> None:
+        pass
+
+    def count(self, event: str) -> None:
+        pass
+
+
+# Hook runs with CODEX_HOOK_METRICS=1 or --metrics replace this with a PhaseTimer (see main)
+TIMER = NoTimer()
+
+# Per-rule evaluations, hits and time, added to <state>/rule_stats.json after each
+# run: {table: {pattern: {"reason", "evaluations", "hits", "first", "seconds"}}}.
+# None while CODEX_GUARD_RULE_STATS is off (the default); see RuleSet.profile
+RULE_STATS = {} if env_int('CODEX_GUARD_RULE_STATS', 0) else None
+RULE_STATS_NAME = 'rule_stats.json'
+
+
+# =============================================================================
+# Rule tables
+# =============================================================================
+
+# === Dangerous delete: Unix ===
+UNIX_RM_PATTERNS = [
+    r'\brm\s+.*-[a-qs-z]*r[a-eg-z]*f',     # -rf, -fr, -Rf...: [^r]*r[^f]*f scans once, [a-z]*r[a-z]*f backtracks
+    r'\brm\s+.*-[a-eg-z]*f[a-qs-z]*r',
+    r'\brm\s+--recursive\s+--force',
+    r'\brm\s+--force\s+--recursive',
+    r'\brm\s+-r\s+.*-f',
+    r'\brm\s+-f\s+.*-r',
+]
+
+UNIX_DANGEROUS_PATHS = [
+    r'\s/$',
+    r'\s/\s',
+    r'\s/\*',
+    r'\s~/?(\s|$)',
+    r'\s\$HOME',
+    r'\s\.\.',
+    r'\s\./?\s*$',
+    r'\s/etc\b',
+    r'\s/var\b',
+    r'\s/usr\b',
+    r'\s/home\b',
+    r'\s/root\b',
+    r'\bxargs\s+(?:-\S+\s+|\d+\s+)*(?:sudo\s+)?rm\s',     # targets read from stdin: unbounded
+]
+
+# === Dangerous delete: Windows ===
+WINDOWS_DEL_PATTERNS = [
+    r'\bdel\s+/[sfq]',                 # del /s, del /f, del /q
+    r'\brd\s+/[sq]',                   # rd /s, rd /q
+    r'\brmdir\s+/[sq]',                # rmdir /s, rmdir /q
+    r'remove-item\s+.*-recurse',       # PowerShell Remove-Item -Recurse
+    r'\bri\s+.*-r',                    # PowerShell alias ri -r
+]
+
+WINDOWS_DANGEROUS_PATHS = [
+    r'[a-z]:\\[\s\"\'\*]*$',           # C:\ or C:\*
+    r'[a-z]:\\windows\b',              # C:\Windows
+    r'[a-z]:\\program\s*files',        # C:\Program Files
+    r'[a-z]:\\users\\[^\s\\]+\\?\s*$', # C:\Users\username
+    r'[a-z]:\\users\\\*',              # C:\Users\*
+    r'%systemroot%',
+    r'%userprofile%',
+    r'%programfiles%',
+    r'\$env:systemroot',
+    r'\$env:userprofile',
+    r'\$home[\\/]?\s*$',               # PowerShell $HOME
+]
+
+# === Dangerous system commands: Unix ===
+UNIX_PATTERNS = [
+    # Disk formatting and writing
+    (r'\bmkfs\.', "filesystem formatting"),
+    (r'\bdd\s+.*of=/dev/', "direct disk write"),
+    (r'>\s*/dev/sd[a-z]', "write to block device"),
+    (r'\bfdisk\b', "disk partitioning"),
+    (r'\bparted\b', "disk partitioning"),
+
+    # Download and execute
+    (r'curl\s+.*\|\s*(ba)?sh', "curl pipe to shell"),
+    (r'wget\s+.*\|\s*(ba)?sh', "wget pipe to shell"),
+    (r'curl\s+.*\|\s*python', "curl pipe to python"),
+    (r'wget\s+.*\|\s*python', "wget pipe to python"),
+
+    # Dangerous chmod
+    (r'\bchmod\s+777\s+/', "chmod 777 on system path"),
+    (r'\bchmod\s+-R\s+777', "recursive chmod 777"),
+
+    # System operations
+    (r'\b:(){ :\|:& };:', "fork bomb"),
+    (r'\brm\s+/etc/passwd', "remove passwd"),
+    (r'\brm\s+/etc/shadow', "remove shadow"),
+    (r'\bshutdown\b', "system shutdown"),
+    (r'\breboot\b', "system reboot"),
+    (r'\binit\s+0', "system halt"),
+
+    # Network attacks
+    (r'\bnc\s+-e\s+/bin/(ba)?sh', "reverse shell"),
+    (r'\bbash\s+-i\s+>&\s+/dev/tcp/', "reverse shell"),
+
+    # Git — destructive remote operations
+    (r'\bgit\s+push\s+.*--force\b(?!-with-lease)', "git force push"),
+    (r'\bgit\s+push\s+.*-f\b', "git force push"),
+    (r'\bgit\s+reset\s+--hard', "git reset --hard"),
+    (r'\bgit\s+clean\s+.*-[a-z]*f', "git clean -f"),
+
+    # GitHub CLI — irreversible remote actions
+    (r'\bgh\s+repo\s+delete\b', "gh repo delete"),
+    (r'\bgh\s+release\s+delete\b', "gh release delete"),
+]
+
+# === Dangerous system commands: Windows ===
+WINDOWS_PATTERNS = [
+    # Disk operations
+    (r'\bformat\s+[a-z]:', "disk format"),
+    (r'\bdiskpart\b', "disk partitioning"),
+    (r'\bbcdboot\b', "boot configuration"),
+    (r'\bbcdedit\b', "boot configuration edit"),
+
+    # Registry attacks
+    (r'\breg\s+delete\s+hk', "registry delete"),
+    (r'remove-itemproperty.*registry', "PowerShell registry delete"),
+
+    # User/system attacks
+    (r'\bnet\s+user\s+\S.*\s+/delete', "user delete"),
+    (r'\bnet\s+localgroup\s+administrators', "admin group modify"),
+
+    # Download and execute (PowerShell)
+    (r'iex\s*\(.*downloadstring', "PowerShell download & execute"),
+    (r'invoke-expression.*net\.webclient', "PowerShell download & execute"),
+    (r'powershell\s+.*-enc', "encoded PowerShell command"),
+    (r'powershell\s+.*-e\s+[a-z0-9+/=]', "encoded PowerShell command"),
+
+    # System operations
+    (r'\bshutdown\s+/[srt]', "system shutdown"),
+    (r'stop-computer', "PowerShell shutdown"),
+    (r'restart-computer', "PowerShell restart"),
+
+    # Service attacks
+    (r'\bsc\s+delete\b', "service delete"),
+    (r'stop-service.*-force', "force stop service"),
+]
+
+# === Credential files ===
+# Path policy, see PathPolicy: 'dir/' protects a directory and everything under it,
+# 'a/b' a file path ending, '*.ext' a file name ending; other wildcards make a glob.
+# Entries starting with '/' or '~/' are absolute, the rest match at any depth.
+PROTECTED_PATHS = [
+    ('.ssh/', "SSH key"),
+    ('.aws/credentials', "AWS credentials"),
+    ('.aws/config', "AWS credentials"),
+    ('.gcloud/', "GCloud credentials"),
+    ('.kube/config', "Kubernetes config"),
+    ('*credentials.json*', "credentials file"),
+    ('*.pem', "PEM certificate"),
+    ('*.key', "private key"),
+    ('*.p12', "PKCS12 certificate"),
+    ('*.pfx', "PFX certificate"),
+    ('*token.json*', "auth token"),
+    ('/etc/ssl/private/', "TLS private key"),
+]
+
+# Regex credential rules (guard_rules.toml [[credential]]), matched against paths and Bash segments
+CREDENTIAL_PATTERNS = []
+
+READ_COMMANDS = r'\b(cat|head|tail|less|more|bat|type|get-content)\b'
+
+# === Docker ===
+DANGEROUS_DOCKER = [
+    r'docker\s+run\s+.*--privileged',       # privileged containers
+    r'docker\s+run\s+.*-v\s+/:/host',       # mounting root
+    r'docker\s+run\s+.*--pid=host',         # host PID namespace
+    r'docker\s+run\s+.*--network=host',     # might be ok, but be careful
+    r'docker\s+system\s+prune\s+-a',        # will delete everything
+]
+
+# === Safe command prefixes ===
+# Commands that are harmless as written, each with the options that may follow it
+# (guard_rules.toml safe_prefix adds more, without options); matched token by
+# token, see safe_pipelines(). Other arguments, such as `which reboot` or
+# `git diff --output=<file>`, go through the rules; never list -o/--output here
+SAFE_PREFIXES = [
+    ('ls', '-a -l -la -al -lh -lah -1'), ('pwd', ''), ('whoami', ''), ('date', ''), ('wc', '-l'),
+    ('git status', '-s -b -sb --short --porcelain'), ('git diff', '--stat --cached --staged --name-only'),
+    ('git log', '--oneline --stat --graph --decorate --all'), ('git show', '--stat --name-only'),
+    ('git rev-parse', '--show-toplevel --abbrev-ref HEAD'),
+    ('pytest', '-q -x -v -s'), ('python -m pytest', '-q -x -v -s'), ('python3 -m pytest', '-q -x -v -s'),
+    ('npm test', ''), ('npm run build', ''), ('npm run lint', ''), ('npm run test', ''),
+    ('cargo build', '--release'), ('cargo check', '--release'), ('cargo test', '--release'),
+    ('go build', './...'), ('go test', './... -v'), ('go vet', './...'), ('make test', ''),
+]
+
+
+# =============================================================================
+# Rule engine
+# =============================================================================
+
+
+class LazyPatterns:
+    """
+    Named regexes compiled on first use, like get_rules() for the rule
+    tables. A hook call compiles only what it touches: a Read call or a
+    fast-path hit never needs the shell tokenizer's patterns. After the
+    first lookup a pattern is a plain instance attribute.
+    """
+
+    def __init__(self, **sources):
+        self._sources = sources
+
+    def __getattr__(self, name: str) -> re.Pattern:
+        try:
+            source = self._sources[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        compiled = re.compile(*source) if isinstance(source, tuple) else re.compile(source)
+        setattr(self, name, compiled)
+        return compiled
+
+
+# Pattern syntax read by pattern_branches(): group openers, quantifiers, and the
+# character a \n-style escape stands for
+REGEX_SYNTAX = LazyPatterns(
+    GROUP_OPENER=r'\((?:\?(?:P<\w+>|P=\w+|<\w+>|<[=!]|[:>=!#]|[aiLmsux-]+:?))?',
+    QUANTIFIER=r'(?:[*+?]|\{\d*(?:,\d*)?\})[?+]?',
+    FLAG_GROUP=r'\(\?[aiLmsux-]',
+    DIGITS=r'\d{0,2}',
+)
+ESCAPED_CHARS = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', 'a': '\a'}
+
+
+class PatternSyntaxError(ValueError):
+    """Regex syntax pattern_branches() does not follow; callers then assume the worst."""
+
+
+def pattern_branches(pattern: str) -> list[list[tuple]]:
+    """
+    Top-level alternatives of a regex, each a list of (kind, value,
+    quantifier) items: 'char' (value is the character), 'class' (., \\s,
+    [...], an unknown escape; value is its source), 'anchor' (^, $, \\b ...)
+    and 'group' (value is (opener, branches)). Enough of re's syntax for the
+    rule checks below, without re's private parser.
+    """
+    branches, pos = scan_branches(pattern, 0)
+    if pos != len(pattern):
+        raise PatternSyntaxError(f"unbalanced ')' at {pos}")
+    return branches
+
+
+def scan_branches(pattern: str, pos: int) -> tuple[list, int]:
+    branches = [[]]
+    while pos < len(pattern):
+        char = pattern[pos]
+        if char == ')':
+            break
+        if char == '|':
+            branches.append([])
+            pos += 1
+            continue
+        if char == '(':
+            opener = REGEX_SYNTAX.GROUP_OPENER.match(pattern, pos).group()
+            if opener.endswith(')') or opener.startswith('(?#'):
+                end = pattern.find(')', pos)
+                if end < 0:
+                    raise PatternSyntaxError(f"unterminated group at {pos}")
+                kind, value, pos = 'group', (pattern[pos:end + 1], []), end + 1
+            else:
+                inner, end = scan_branches(pattern, pos + len(opener))
+                if end >= len(pattern):
+                    raise PatternSyntaxError(f"unterminated group at {pos}")
+                kind, value, pos = 'group', (opener, inner), end + 1
+        elif char == '[':
+            end = pos + 1
+            end += pattern.startswith('^', end)
+            end += pattern.startswith(']', end)
+            while end < len(pattern) and pattern[end] != ']':
+                end += 2 if pattern[end] == '\\' else 1
+            if end >= len(pattern):
+                raise PatternSyntaxError(f"unterminated character set at {pos}")
+            kind, value, pos = 'class', pattern[pos:end + 1], end + 1
+        elif char == '\\':
+            escaped = pattern[pos + 1:pos + 2]
+            if not escaped:
+                raise PatternSyntaxError("trailing backslash")
+            if escaped in 'bBAZ':
+                kind, value, pos = 'anchor', pattern[pos:pos + 2], pos + 2
+            elif escaped in ESCAPED_CHARS:
+                kind, value, pos = 'char', ESCAPED_CHARS[escaped], pos + 2
+            elif escaped.isalnum():
+                # \s, \d, \w and the like, \x41, \u..., backreferences: matched, not literal
+                length = {'x': 4, 'u': 6, 'U': 10}.get(escaped, 2)
+                if escaped.isdigit():
+                    length += len(REGEX_SYNTAX.DIGITS.match(pattern, pos + 2).group())
+                elif escaped == 'N':
+                    length = pattern.find('}', pos) + 1 - pos
+                kind, value, pos = 'class', pattern[pos:pos + length], pos + length
+            else:
+                kind, value, pos = 'char', escaped, pos + 2
+        elif char == '.':
+            kind, value, pos = 'class', char, pos + 1
+        elif char in '^$':
+            kind, value, pos = 'anchor', char, pos + 1
+        else:
+            kind, value, pos = 'char', char, pos + 1
+        quantifier = REGEX_SYNTAX.QUANTIFIER.match(pattern, pos)
+        if quantifier:
+            pos = quantifier.end()
+        branches[-1].append((kind, value, quantifier.group() if quantifier else ''))
+    return branches, pos
+
+
+def has_inline_flags(branches: list[list[tuple]]) -> bool:
+    """Whether a (?i), (?x:...) or other flag group appears anywhere: it changes what the items mean."""
+    for items in branches:
+        for kind, value, _ in items:
+            if kind == 'group' and (REGEX_SYNTAX.FLAG_GROUP.match(value[0]) or has_inline_flags(value[1])):
+                return True
+    return False
+
+
+def min_repeat(quantifier: str) -> int:
+    """Fewest repetitions a quantifier allows ('' is exactly one)."""
+    if not quantifier:
+        return 1
+    if quantifier[0] == '{':
+        low = quantifier[1:].split(',')[0].rstrip('}?+')
+        return int(low) if low else 0
+    return 1 if quantifier[0] == '+' else 0
+
+
+def required_literal(pattern: str) -> str:
+    """
+    Longest run of literal text every match of pattern contains, found on
+    its top level; '' when there is none or the pattern is beyond
+    pattern_branches() (then the rule is always run). RuleSet skips a rule
+    whose literal is not in the text.
+    """
+    try:
+        branches = pattern_branches(pattern)
+    except (PatternSyntaxError, IndexError, ValueError):
+        return ''
+    if len(branches) != 1 or has_inline_flags(branches):
+        return ''
+    best = run = ''
+    for kind, value, quantifier in branches[0]:
+        if kind == 'char' and min_repeat(quantifier) >= 1:
+            run += value
+            if not quantifier:
+                continue
+        if len(run) > len(best):
+            best = run
+        run = ''
+    return run if len(run) > len(best) else best
+
+
+def split_gaps(pattern: str) -> list[str]:
+    """Split pattern at its top-level `.*` gaps; [pattern] if it has none or a top-level `|`."""
+    pieces = []
+    start = depth = i = 0
+    in_class = False
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if in_class:
+            in_class = char != ']'
+        elif char == '[':
+            in_class = True
+            # A ']' right after '[' or '[^' is a literal
+            i += 1 if pattern[i + 1:i + 2] == '^' else 0
+            i += 1 if pattern[i + 1:i + 2] == ']' else 0
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif depth == 0 and char == '|':
+            return [pattern]
+        elif depth == 0 and pattern[i:i + 2] == '.*' and pattern[i + 2:i + 3] not in ('?', '+'):
+            pieces.append(pattern[start:i])
+            i += 2
+            start = i
+            continue
+        i += 1
+    pieces.append(pattern[start:])
+    return pieces
+
+
+# Escapes that match one char of a kind, alone or inside [...]
+CLASS_KINDS = {'\\s': 'space', '\\S': 'solid', '\\d': 'solid', '\\w': 'solid'}
+
+
+def char_kind(kind: str, value) -> str | None:
+    """'solid' if a pattern_branches() item matches one non-whitespace char, 'space' if one whitespace char."""
+    if kind == 'char':
+        return 'space' if value.isspace() else 'solid'
+    if kind != 'class':
+        return None
+    if value in CLASS_KINDS:
+        return CLASS_KINDS[value]
+    if not value.startswith('[') or value.startswith('[^'):
+        return None
+    kinds = set()
+    body, i = value[1:-1], 0
+    while i < len(body):
+        char, i = body[i:i + 2] if body[i] == '\\' else body[i], i + (2 if body[i] == '\\' else 1)
+        if char in CLASS_KINDS:
+            kinds.add(CLASS_KINDS[char])
+            continue
+        if char[0] == '\\':
+            if char[1:].isalnum() and char[1:] not in ESCAPED_CHARS:
+                return None
+            char = ESCAPED_CHARS.get(char[1:], char[1:])
+        if body[i:i + 1] == '-' and i + 1 < len(body):
+            high, i = body[i + 1], i + 2
+            if high == '\\' or ord(high) - ord(char) >= 256:
+                return None
+            spaces = sum(chr(code).isspace() for code in range(ord(char), ord(high) + 1))
+            kinds.add('space' if spaces == ord(high) - ord(char) + 1 else 'solid' if not spaces else None)
+        else:
+            kinds.add('space' if char.isspace() else 'solid')
+    return kinds.pop() if len(kinds) == 1 else None
+
+
+def gap_prefix_ok(piece: str, following: str) -> bool:
+    """
+    Whether only the first match of piece needs trying before a `.*` gap.
+    True for a skeleton of single non-whitespace chars, starting with one,
+    with whitespace runs only in front of a non-whitespace char (`\\brm\\s+`,
+    `docker\\s+run\\s+`). Every match of such a piece has the same number
+    of non-whitespace chars and one possible end, so a match that starts
+    later also ends later and can only leave less room for the rest.
+    """
+    try:
+        branches, following_branches = pattern_branches(piece), pattern_branches(following)
+    except (PatternSyntaxError, IndexError, ValueError):
+        return False
+    if len(branches) != 1 or len(following_branches) != 1:
+        return False
+    items = [item for item in branches[0] if item[0] != 'anchor']
+    following_items = [item for item in following_branches[0] if item[0] != 'anchor']
+
+    def single(item, kind):
+        return not item[2] and char_kind(item[0], item[1]) == kind
+
+    if not items or not single(items[0], 'solid'):
+        return False
+    for index, (kind, value, quantifier) in enumerate(items):
+        if not quantifier and char_kind(kind, value):
+            continue
+        # Only a greedy repeat of whitespace, followed by a non-whitespace char
+        greedy = quantifier in ('*', '+') or (quantifier[:1] == '{' and quantifier[-1] == '}')
+        if not greedy or char_kind(kind, value) != 'space':
+            return False
+        after = (items[index + 1:] or following_items)[:1]
+        if not after or not single(after[0], 'solid'):
+            return False
+    return True
+
+
+def linear_pattern(pattern: str) -> str:
+    """
+    pattern rewritten so that search() runs in linear time, else unchanged.
+    re retries `A.*B` at every occurrence of A, rescanning the rest of the
+    line each time: quadratic on a long line full of A's. When every piece
+    before a gap passes gap_prefix_ok(), trying its first occurrence on each
+    line is enough, so the rewrite commits to it with an atomic group and
+    each line is scanned once. Match positions differ, matching does not.
+    """
+    pieces = split_gaps(pattern)
+    if len(pieces) == 1 or sys.version_info < (3, 11):
+        return pattern
+    try:
+        # Inline flags (DOTALL, VERBOSE...) change what the pieces mean
+        if has_inline_flags(pattern_branches(pattern)):
+            return pattern
+    except (PatternSyntaxError, IndexError, ValueError):
+        return pattern
+    if not all(gap_prefix_ok(piece, following) for piece, following in zip(pieces, pieces[1:])):
+        return pattern
+    return r'(?<![^\n])' + ''.join(f'(?>.*?{piece})' for piece in pieces[:-1]) + '.*' + pieces[-1]
+
+
+def max_repeat(quantifier: str) -> float:
+    """Most repetitions a quantifier allows ('' is exactly one)."""
+    if not quantifier:
+        return 1
+    if quantifier[0] == '{':
+        high = quantifier[1:].rstrip('?+').rstrip('}').split(',')[-1]
+        return int(high) if high else float('inf')
+    return 1 if quantifier[0] == '?' else float('inf')
+
+
+def backtracking_risk(pattern: str) -> str | None:
+    """
+    Describe a construct that makes re backtrack exponentially (a repeat
+    inside a repeat), if any. Possessive repeats and atomic groups never
+    backtrack into themselves and are not looked into.
+    """
+    def walk(branches, in_repeat):
+        for items in branches:
+            for kind, value, quantifier in items:
+                if len(quantifier) > 1 and quantifier[-1] == '+':
+                    continue    # Possessive
+                if in_repeat and max_repeat(quantifier) == float('inf'):
+                    return "nested repeat (like (a+)+)"
+                if kind == 'group' and not value[0].startswith('(?>'):
+                    found = walk(value[1], in_repeat or max_repeat(quantifier) > 1)
+                    if found:
+                        return found
+        return None
+
+    return walk(pattern_branches(pattern), False)
+
+
+class RuleSet:
+    """
+    Rule table checked one rule at a time. Each rule is compiled, in its
+    linear_pattern() form, the first time it is needed, and sits behind a
+    literal prefilter: a rule whose required_literal() does not occur in the
+    text is skipped without running re, so most rules of a table cost one
+    substring test. The literals are read the first time the table is
+    used. first() answers in table order; matches() stops at the first hit.
+    """
+
+    def __init__(self, rules: list, name: str | None = None):
+        self.rules = [tuple(rule) if isinstance(rule, (tuple, list)) else (rule, None) for rule in rules]
+        self.name = name
+        self._compiled = [None] * len(self.rules)
+        self._checks = None
+
+    def checks(self) -> list:
+        """(required_literal(), index) per rule, in table order."""
+        if self._checks is None:
+            self._checks = [(required_literal(rule[0]), index) for index, rule in enumerate(self.rules)]
+        return self._checks
+
+    def search(self, index: int, text: str) -> bool:
+        """Whether rule index matches text (compiling it on first use)."""
+        compiled = self._compiled[index]
+        if compiled is None:
+            compiled = self._compiled[index] = re.compile(linear_pattern(self.rules[index][0]))
+        return compiled.search(text) is not None
+
+    def first(self, text: str) -> tuple | None:
+        """Return the first (pattern, reason) in table order that matches text."""
+        if RULE_STATS is not None and self.name:
+            self.profile(text, first=True)
+        for literal, index in self.checks():
+            if literal in text and self.search(index, text):
+                return self.rules[index]
+        return None
+
+    def matches(self, text: str) -> bool:
+        if RULE_STATS is not None and self.name and self.rules:
+            self.profile(text, first=False)
+        for literal, index in self.checks():
+            if literal in text and self.search(index, text):
+                return True
+        return False
+
+    def profile(self, text: str, first: bool) -> None:
+        """
+        Stats mode: run every rule on its own, counting evaluations, hits and
+        time, and which rule a first-match loop in table order would return.
+        """
+        table = RULE_STATS.setdefault(self.name, {})
+        decided = not first
+        for rule in self.rules:
+            compiled = re.compile(linear_pattern(rule[0]))  # Compilation is a per-process cost, not the rule's
+            started = time.perf_counter()
+            hit = compiled.search(text) is not None
+            elapsed = time.perf_counter() - started
+            stats = table.get(rule[0])
+            if stats is None:
+                stats = table[rule[0]] = {'reason': rule[1], 'evaluations': 0, 'hits': 0, 'first': 0, 'seconds': 0.0}
+            stats['evaluations'] += 1
+            stats['seconds'] += elapsed
+            if hit:
+                stats['hits'] += 1
+                if not decided:
+                    stats['first'] += 1
+                    decided = True
+
+
+POLICY_SYNTAX = LazyPatterns(
+    GLOB_CHARS=r'[*?\[]',
+    HOME_PREFIX=r'^(?:~|\$home|\$\{home\})(?=/|$)',
+)
+
+
+def policy_path(path: str, home: str = '') -> str:
+    """
+    Lowercased, '/'-separated form of a path that PathPolicy matches: ~,
+    $HOME and ${HOME} expanded to home, empty and '.' components dropped,
+    'dir/..' collapsed (so /a/.ssh/../x is /a/x, not a path under .ssh).
+    Case is folded for case-insensitive file systems (macOS, Windows).
+    """
+    path = path.replace('\\', '/').lower()
+    if home:
+        path = POLICY_SYNTAX.HOME_PREFIX.sub(lambda _: home, path, 1)
+    if not path:
+        return path
+    path = posixpath.normpath(path)
+    return path[1:] if path.startswith('//') else path
+
+
+def glob_pattern(glob: str, directory: bool = False) -> str:
+    """Regex for a policy_path() form glob: ** crosses directories, * and ? do not."""
+    pieces = []
+    for token in re.findall(r'\*\*/?|\*|\?|\[!?\]?[^\]]*\]|[^*?\[]+|\[', glob):
+        if token.startswith('**'):
+            pieces.append('(?:.*/)?' if token.endswith('/') else '.*')
+        elif token == '*':
+            pieces.append('[^/]*')
+        elif token == '?':
+            pieces.append('[^/]')
+        elif token.startswith('[') and len(token) > 2:
+            body = token[1:-1]
+            pieces.append('[' + ('^/' + body[1:] if body.startswith('!') else body) + ']')
+        else:
+            pieces.append(re.escape(token))
+    pattern = ''.join(pieces)
+    # Relative globs match at any depth; a glob without '/' matches the file name
+    anchor = '^' if glob.startswith('/') or re.match(r'[a-z]:/', glob) else '(?:^|/)'
+    # A directory glob also covers everything under the directory
+    return anchor + pattern + ('(?:/|$)' if directory else '$')
+
+
+class PathPolicy:
+    """
+    Protected-path table (see PROTECTED_PATHS) compiled into indexes whose
+    lookup cost depends on the path, not on the number of entries: a trie of
+    directory components walked from each component of the path, a trie of
+    reversed file-path components walked back from the file name, and a
+    trie of reversed file-name characters for '*suffix' entries. Globs are
+    one RuleSet. first() returns the earliest table entry that matches.
+    """
+
+    def __init__(self, entries: list, home: str | None = None):
+        self.entries = [tuple(entry) for entry in entries]
+        self.home = policy_path(os.path.expanduser('~') if home is None else home)
+        self._locations = None
+        self.dirs, self.files, self.suffixes = {}, {}, {}
+        globs = []
+        for index, (spec, _) in enumerate(self.entries):
+            directory = spec.strip().endswith(('/', '\\'))
+            path = policy_path(spec.strip(), self.home)
+            if path.startswith('*') and not POLICY_SYNTAX.GLOB_CHARS.search(path, 1) and '/' not in path:
+                self._insert(self.suffixes, reversed(path[1:]), index)
+            elif POLICY_SYNTAX.GLOB_CHARS.search(path):
+                globs.append((glob_pattern(path, directory), index))
+            elif directory:
+                self._insert(self.dirs, path.split('/'), index)
+            else:
+                self._insert(self.files, reversed(path.split('/')), index)
+        self.globs = RuleSet(globs)
+
+    @staticmethod
+    def _insert(trie: dict, keys, index: int) -> None:
+        node = trie
+        for key in keys:
+            node = node.setdefault(key, {})
+        node.setdefault(None, index)
+
+    def first_index(self, path: str) -> int | None:
+        """Index of the first entry matching a policy_path() form path, or None."""
+        parts = path.split('/')
+        hits = []
+
+        node = self.files
+        for part in reversed(parts):
+            node = node.get(part)
+            if node is None:
+                break
+            if None in node:
+                hits.append(node[None])
+
+        if self.dirs:
+            for start in range(len(parts)):
+                node = self.dirs
+                for position in range(start, len(parts)):
+                    node = node.get(parts[position])
+                    if node is None:
+                        break
+                    if None in node:
+                        hits.append(node[None])
+                        break
+
+        node = self.suffixes
+        for char in reversed(parts[-1]):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                hits.append(node[None])
+
+        glob = self.globs.first(path)
+        if glob is not None:
+            hits.append(glob[1])
+        return min(hits) if hits else None
+
+    def first(self, path: str) -> tuple | None:
+        """Return the first (entry, reason) in table order protecting path (any form)."""
+        index = self.first_index(policy_path(path, self.home))
+        return None if index is None else self.entries[index]
+
+    def locations(self) -> list:
+        """
+        (location, index) of every directory and file entry: absolute entries
+        as written, relative ones (.ssh/, .aws/credentials) under home, where
+        the tools that use them keep them. '*suffix' entries and globs name
+        files anywhere and have no location.
+        """
+        if self._locations is None:
+            self._locations = []
+            for index, (spec, _) in enumerate(self.entries):
+                path = policy_path(spec.strip(), self.home)
+                if path.startswith('*') or POLICY_SYNTAX.GLOB_CHARS.search(path):
+                    continue
+                if not (path.startswith('/') or re.match(r'[a-z]:/', path)):
+                    path = policy_path(f'{self.home}/{path}')
+                self._locations.append((path, index))
+        return self._locations
+
+    def first_within(self, directory: str) -> tuple | None:
+        """Return the first (entry, reason) in table order with a location in or under directory (absolute)."""
+        prefix = policy_path(directory, self.home).rstrip('/') + '/'
+        for location, index in self.locations():
+            if (location + '/').startswith(prefix):
+                return self.entries[index]
+        return None
+
+
+def builtin_tables(windows: bool = IS_WINDOWS) -> dict:
+    """Built-in rule tables for one platform, as plain (marshal-friendly) data."""
+    # Windows hosts also run Unix tools (Git Bash, WSL), Unix hosts never see cmd/PowerShell syntax
+    tables = {
+        'delete': [[list(UNIX_RM_PATTERNS), list(UNIX_DANGEROUS_PATHS)]],
+        'system': list(UNIX_PATTERNS),
+        'protected_paths': list(PROTECTED_PATHS),
+        'credentials': list(CREDENTIAL_PATTERNS),
+        'read_commands': [READ_COMMANDS],
+        'docker': list(DANGEROUS_DOCKER),
+        'safe_prefixes': list(SAFE_PREFIXES),
+    }
+    if windows:
+        tables['delete'].append([list(WINDOWS_DEL_PATTERNS), list(WINDOWS_DANGEROUS_PATHS)])
+        tables['system'] += WINDOWS_PATTERNS
+    return tables
+
+
+def prefix_trie(prefixes: list) -> dict:
+    """Token trie of (prefix, options) pairs: {token: {token: ... {None: [option, ...]}}}."""
+    trie = {}
+    for prefix, options in prefixes:
+        node = trie
+        for token in prefix.split():
+            node = node.setdefault(token, {})
+        node[None] = options.split()
+    return trie
+
+
+class GuardRules:
+    """All rule tables for one platform, ready to match; see load_rules() for caching."""
+
+    def __init__(self, tables: dict | None = None, windows: bool = IS_WINDOWS):
+        self.tables = tables if tables is not None else builtin_tables(windows)
+        self.path = None
+        self.stamp = None
+        self.delete = [
+            (RuleSet(commands, f'delete.{i}.commands'), RuleSet(paths, f'delete.{i}.paths'))
+            for i, (commands, paths) in enumerate(self.tables['delete'])
+        ]
+        self.system = RuleSet(self.tables['system'], 'system')
+        self.paths = PathPolicy(self.tables['protected_paths'])
+        self.credentials = RuleSet(self.tables['credentials'], 'credentials')
+        self.read_commands = RuleSet(self.tables['read_commands'], 'read_commands')
+        self.docker = RuleSet(self.tables['docker'], 'docker')
+        self.safe_prefixes = prefix_trie(self.tables['safe_prefixes'])
+
+
+# =============================================================================
+# Rule file (guard_rules.toml) and merged-rules cache
+# =============================================================================
+
+ARTIFACT_FORMAT = 7
+
+
+class RuleFileError(ValueError):
+    """The custom rule file cannot be read, parsed or compiled."""
+
+
+def rules_path() -> str:
+    return os.environ.get('CODEX_GUARD_RULES') or os.path.join(SCRIPT_ROOT, 'guard_rules.toml')
+
+
+def file_stamp(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def merge_rule_file(tables: dict, source: bytes, path: str, windows: bool = IS_WINDOWS) -> dict:
+    """Merge the rules of a guard_rules.toml into tables (see guard_rules.toml.sample)."""
+    try:
+        import tomllib
+    except ImportError:
+        # Python < 3.11: the org rules cannot be read, so they cannot be left out silently either
+        raise RuleFileError(f"{path}: rule files need Python 3.11+ (tomllib)") from None
+
+    try:
+        data = tomllib.loads(source.decode('utf-8'))
+    except (UnicodeDecodeError, tomllib.TOMLDecodeError) as e:
+        raise RuleFileError(f"{path}: {e}") from e
+
+    def entries(section: str):
+        for entry in data.get(section, []):
+            if not isinstance(entry, dict) or not isinstance(entry.get('pattern'), str):
+                raise RuleFileError(f"{path}: every [[{section}]] needs a string 'pattern'")
+            try:
+                re.compile(entry['pattern'])
+                risk = backtracking_risk(entry['pattern'])
+            except (re.error, PatternSyntaxError) as e:
+                raise RuleFileError(f"{path}: [[{section}]] {entry['pattern']!r}: {e}") from e
+            if risk:
+                raise RuleFileError(f"{path}: [[{section}]] {entry['pattern']!r}: {risk} can take exponential time")
+            # Windows hosts check Unix rules too, so only Windows-only rules are filtered
+            if entry.get('platform', 'any') != 'windows' or windows:
+                yield entry
+
+    disabled = set(data.get('disable', []))
+    tables['system'] = [rule for rule in tables['system'] if rule[1] not in disabled]
+    tables['protected_paths'] = [rule for rule in tables['protected_paths'] if rule[1] not in disabled]
+    tables['credentials'] = [rule for rule in tables['credentials'] if rule[1] not in disabled]
+    tables['safe_prefixes'] = [rule for rule in tables['safe_prefixes'] if rule[0] not in disabled]
+
+    tables['system'] += [(e['pattern'], e.get('reason', 'custom rule')) for e in entries('system')]
+    tables['credentials'] += [(e['pattern'], e.get('reason', 'credential file')) for e in entries('credential')]
+    for entry in data.get('protected_path', []):
+        if not isinstance(entry, dict) or not isinstance(entry.get('path'), str) or not entry['path'].strip():
+            raise RuleFileError(f"{path}: every [[protected_path]] needs a non-empty string 'path'")
+        try:
+            re.compile(glob_pattern(policy_path(entry['path'].strip())))
+        except re.error as e:
+            raise RuleFileError(f"{path}: [[protected_path]] {entry['path']!r}: {e}") from e
+        if entry.get('platform', 'any') != 'windows' or windows:
+            tables['protected_paths'].append((entry['path'], entry.get('reason', 'protected path')))
+    tables['docker'] += [e['pattern'] for e in entries('docker')]
+    for prefix in data.get('safe_prefix', []):
+        if not isinstance(prefix, str) or not prefix.split():
+            raise RuleFileError(f"{path}: every safe_prefix needs to be a non-empty string")
+        if prefix.translate(SAFE_WORD_CHARS).strip():
+            raise RuleFileError(f"{path}: safe_prefix {prefix!r}: only plain words (no quotes, $, |, ;, & or <>)")
+        if prefix.split()[0] in ('cd', 'pushd'):
+            # A directory change alters what the paths of later commands mean
+            raise RuleFileError(f"{path}: safe_prefix {prefix!r}: cd/pushd cannot be allowlisted")
+        if any(word.startswith(('-o', '--output')) for word in prefix.split()[1:]):
+            # Writes wherever the option points
+            raise RuleFileError(f"{path}: safe_prefix {prefix!r}: -o/--output cannot be allowlisted")
+        tables['safe_prefixes'].append((' '.join(prefix.split()), ''))
+    for entry in entries('delete_command'):
+        tables['delete'][1 if entry.get('platform') == 'windows' else 0][0].append(entry['pattern'])
+    for entry in entries('delete_path'):
+        tables['delete'][1 if entry.get('platform') == 'windows' else 0][1].append(entry['pattern'])
+    return tables
+
+
+def load_rules(path: str | None = None, windows: bool = IS_WINDOWS, use_cache: bool = True) -> GuardRules:
+    """
+    Built-in tables plus the rule file at path. The merged tables and the
+    rule file's sha256 are cached in state_dir()/rules.marshal and reused
+    until guard_core.py, the Python version or the rule file changes, so a
+    hook call skips reading, parsing and checking the rule file; a changed
+    mtime/size with identical content still reuses them. Patterns are
+    compiled with re.compile() in each process, on first use.
+    """
+    import marshal
+
+    path = path or rules_path()
+    stamp = file_stamp(path)
+    key = [ARTIFACT_FORMAT, sys.hexversion, windows, path, file_stamp(os.path.abspath(__file__))]
+    artifact_path = os.path.join(state_dir(), 'rules.marshal')
+
+    artifact = None
+    if use_cache:
+        try:
+            with open(artifact_path, 'rb') as f:
+                artifact = marshal.loads(f.read())
+            if artifact.get('key') != key:
+                artifact = None
+        except Exception:
+            # Missing, truncated or foreign artifact - rebuild it
+            artifact = None
+
+    if artifact is not None and artifact['stamp'] == stamp:
+        rules = GuardRules(artifact['tables'])
+        rules.path, rules.stamp = path, stamp
+        return rules
+
+    source = None
+    if stamp is not None:
+        try:
+            with open(path, 'rb') as f:
+                source = f.read()
+        except OSError as e:
+            raise RuleFileError(f"{path}: {e}") from e
+
+    digest = None
+    if source is not None:
+        import hashlib
+        digest = hashlib.sha256(source).hexdigest()
+
+    if artifact is not None and digest is not None and artifact['digest'] == digest:
+        # Touched but unchanged: keep the merged tables, refresh the stamp
+        rules = GuardRules(artifact['tables'])
+    else:
+        tables = builtin_tables(windows)
+        if source is not None:
+            merge_rule_file(tables, source, path, windows)
+        rules = GuardRules(tables)
+    rules.path, rules.stamp = path, stamp
+
+    if use_cache:
+        artifact = {'key': key, 'stamp': stamp, 'digest': digest, 'tables': rules.tables}
+        try:
+            os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+            tmp_path = f"{artifact_path}.{os.getpid()}"
+            with open(tmp_path, 'wb') as f:
+                f.write(marshal.dumps(artifact))
+            os.replace(tmp_path, artifact_path)
+        except (OSError, ValueError):
+            pass
+
+    return rules
+
+
+_RULES = None
+
+
+def get_rules() -> GuardRules:
+    global _RULES
+    if _RULES is None:
+        _RULES = load_rules()
+    return _RULES
+
+
+def refresh_rules() -> GuardRules:
+    """Drop the in-memory rules if the rule file changed since they were built (daemon)."""
+    global _RULES
+    if _RULES is not None and _RULES.path is not None and file_stamp(_RULES.path) != _RULES.stamp:
+        _RULES = None
+    return get_rules()
+
+
+# =============================================================================
+# Shell segmentation
+# =============================================================================
+
+# Commands whose output is plain data: 'args' (every argument), 'strings' (quoted or
+# substituted arguments) and their heredoc input are not matched against the rules,
+# unless the output is written to a file (see ShellCommand.writes_file)
+DATA_COMMANDS = {
+    ('echo',): 'args',
+    ('printf',): 'args',
+    ('cat',): 'stdin',
+    ('tee',): 'stdin',
+    ('git', 'commit'): 'strings',
+    ('git', 'tag'): 'strings',
+    ('gh', 'pr', 'create'): 'strings',
+    ('gh', 'pr', 'comment'): 'strings',
+    ('gh', 'pr', 'edit'): 'strings',
+    ('gh', 'pr', 'review'): 'strings',
+    ('gh', 'issue', 'create'): 'strings',
+    ('gh', 'issue', 'comment'): 'strings',
+    ('gh', 'issue', 'edit'): 'strings',
+    ('gh', 'release', 'create'): 'strings',
+}
+
+DATA_NAMES = {key[0] for key in DATA_COMMANDS}
+
+# Anything that can run text the command itself prints or writes makes the whole
+# command opaque: it is then matched flat, as one string
+EXECUTOR_NAMES = (
+    r'(?:(?:ba|da|k|mk|z|c|tc|fi)?sh|busybox|eval|source|exec|alias|trap|xargs|parallel|ssh|su|script|'
+    r'python[\d.]*|pypy[\d.]*|perl|ruby|node|deno|bun|php|lua|pwsh|powershell|cmd|osascript)(?:\.exe)?'
+)
+# Compiled on first use (re's cache) with re.IGNORECASE for case-insensitive file systems:
+# only commands that drop data need them
+EXECUTOR = r'(?:.*/)?' + EXECUTOR_NAMES
+# Pre-check over the whole command (quotes removed) before words are matched one by one
+EXECUTOR_HINT = r'(?<![^\s|&;()<>/])' + EXECUTOR_NAMES + r'(?![^\s|&;()<>])'
+# Compound statements run several segments as one unit (for d in /; do rm -rf $d; done)
+COMPOUND_WORDS = {'if', 'then', 'else', 'elif', 'fi', 'do', 'done', 'while', 'until', 'for', 'select',
+                  'case', 'esac', 'function', 'coproc', '{', '}'}
+# Run their arguments, or the file they name, as a command
+WRAPPERS = {'.', 'sudo', 'doas', 'env', 'command', 'builtin', 'nohup', 'nice', 'ionice', 'chrt', 'taskset',
+            'time', 'timeout', 'watch', 'stdbuf', 'unbuffer', 'strace', 'ltrace', 'setsid', 'flock'}
+CD_WORDS = {'cd', 'pushd'}
+# Redirection targets that show output rather than store it
+STREAM_FILES = {'/dev/null', '/dev/stdout', '/dev/stderr', '/dev/tty'}
+
+SHELL_SYNTAX = LazyPatterns(
+    SHELL_OPERATOR=r'\|\||&&|;;&?|;&|\|&|[|&;\n]',
+    REDIRECTION=r'(?:\d+|\{[a-zA-Z_]\w*\})?(?:&>>|&>|<<<|<<-|<<|<&|<>|>>|>&|>\||[<>])',
+    WORD_TEXT=(r'(?:[^ \t\n|&;()<>\'"\\`$]|\'[^\']*\'|\\.)+', re.DOTALL),
+    QUOTED_TEXT=r'[^"\\`$]+',
+    HEREDOC_TEXT=r'[^\\`$]+',
+    BRACED_TEXT=r'[^}\'"\\`$]+',
+    BLANKS=r'(?:[ \t]|\\\n)+',
+    ASSIGNMENT=r'[a-zA-Z_]\w*(?:\[[^\]]*\])?\+?=',
+    PLAIN_WORD=(r'(?:[ \t]|\\\n)*(?!#)((?:[^ \t\n|&;()<>\'"\\`$]|\'[^\']*\'|\\.)+)(?=[ \t\n|&;()]|\Z)',
+                re.DOTALL),
+    SIMPLE_COMMAND=r'[^\'"\\`$()|&;<>\n#]*',
+    PIPELINE_SEPARATORS=r'&&|\|\||[;&\n]',
+)
+UNQUOTE = str.maketrans('', '', '\'"\\')
+
+
+def unquoted(word: str) -> str:
+    return word.translate(UNQUOTE)
+
+
+class ShellSyntaxError(ValueError):
+    """Shell syntax the segmenter does not follow; the command is matched flat."""
+
+
+class ShellCommand:
+    """One simple command: its words (raw source text), redirections and heredocs."""
+
+    __slots__ = ('words', 'quoted', 'dynamic', 'redirects', 'heredocs', 'data_ok', 'data')
+
+    def __init__(self, data_ok: bool):
+        self.words = []
+        self.quoted = []        # word has quoted or substituted parts
+        self.dynamic = []       # word has $ or ` expansions
+        self.redirects = []
+        self.heredocs = []      # [strip_tabs, delimiter, quoted, body]
+        self.data_ok = data_ok  # False inside subshell groups, whose output may be piped
+        self.data = None        # (DATA_COMMANDS kind, name length) once known to be a data command
+
+    def start(self) -> int:
+        """Index of the command word (after VAR=value assignments)."""
+        for i, word in enumerate(self.words):
+            if not SHELL_SYNTAX.ASSIGNMENT.match(word):
+                return i
+        return len(self.words)
+
+    def writes_file(self, start: int) -> bool:
+        """Whether stdout goes to a file (> file, >> file, &> file, tee file) rather than the screen."""
+        if unquoted(self.words[start]) == 'tee' and len(self.words) > start + 1:
+            return True
+        for redirect in self.redirects:
+            op, target = redirect.split(' ', 1)
+            if op.lstrip('1').startswith(('>', '&>')) and not op.endswith('&') and target not in STREAM_FILES:
+                return True
+        return False
+
+    def names(self, start: int) -> list[str]:
+        """Command word and following words with quotes removed; stops at the first expansion."""
+        names = []
+        for word, dynamic in zip(self.words[start:start + 3], self.dynamic[start:start + 3]):
+            if dynamic:
+                break
+            names.append(unquoted(word))
+        return names
+
+
+class ShellScript:
+    """
+    Single-pass shell tokenizer for the subset agents write: pipelines,
+    && || ; & lists, subshells, $(...) and backtick substitutions, quoting and
+    heredocs. Splits a command into segments (one per pipeline, substitutions
+    and subshells separately) so rules only see what each segment runs.
+
+    Heredoc bodies, echo/printf arguments and commit messages are left out of
+    the segment text when the command's output is plain data (DATA_COMMANDS).
+    A compound statement makes the script opaque; so does anything that could
+    execute the left-out data (executes_data). Opaque commands are matched
+    flat by command_segments().
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+        self.pending = []       # heredocs whose body starts after the next newline
+        self.segments = []      # (commands, is cd) per pipeline, in source order
+        self.opaque = False     # compound statements: segments would split what runs together
+        self.drops = False      # some segment leaves data out
+
+    def parse(self) -> 'ShellScript':
+        self.script(None, True)
+        if self.pending:
+            raise ShellSyntaxError("missing heredoc body")
+        return self
+
+    # --- grammar ---
+
+    def script(self, end: str | None, data_ok: bool) -> None:
+        text, pipeline = self.text, []
+        while True:
+            command = self.command(data_ok)
+            if command.words or command.redirects:
+                pipeline.append(command)
+            if self.pos >= len(text):
+                if end is not None:
+                    raise ShellSyntaxError(f"missing {end!r}")
+                self.finish(pipeline)
+                return
+            if text[self.pos] == ')':
+                if end != ')':
+                    raise ShellSyntaxError("unexpected ')'")
+                self.finish(pipeline)
+                return
+            op = SHELL_SYNTAX.SHELL_OPERATOR.match(text, self.pos).group()
+            self.pos += len(op)
+            if op not in ('|', '|&'):
+                self.finish(pipeline)
+                pipeline = []
+            if op == '\n':
+                self.heredoc_bodies()
+
+    def command(self, data_ok: bool) -> ShellCommand:
+        text, command = self.text, ShellCommand(data_ok)
+        while True:
+            match = SHELL_SYNTAX.PLAIN_WORD.match(text, self.pos)
+            if match:
+                # Common case in one match: no expansions, ends at a blank or an operator
+                word = match.group(1)
+                self.pos = match.end()
+                command.words.append(word)
+                command.quoted.append("'" in word or '\\' in word)
+                command.dynamic.append(False)
+                continue
+            match = SHELL_SYNTAX.BLANKS.match(text, self.pos)
+            if match:
+                self.pos = match.end()
+            if self.pos >= len(text):
+                return command
+            char = text[self.pos]
+            if char == '#' and (self.pos == 0 or text[self.pos - 1] in ' \t\n;&|()'):
+                newline = text.find('\n', self.pos)
+                self.pos = len(text) if newline < 0 else newline
+                continue
+            if char in '<>' and text.startswith('(', self.pos + 1):
+                # Process substitution: its output or input is another command
+                self.opaque = True
+                self.pos += 2
+                self.group(')', False)
+                continue
+            match = SHELL_SYNTAX.REDIRECTION.match(text, self.pos)
+            if match:
+                # At a word start, so 2>&1 is a redirection of fd 2
+                self.redirect(command, match.group())
+                continue
+            if char in '|&;\n)':
+                return command
+            if char == '(':
+                # Subshell group, or a function definition `name()`
+                if command.words:
+                    self.opaque = True
+                self.pos += 1
+                self.group(')', False)
+                continue
+            start = self.pos
+            quoted, dynamic = self.word()
+            command.words.append(text[start:self.pos])
+            command.quoted.append(quoted)
+            command.dynamic.append(dynamic)
+
+    def group(self, end: str, data_ok: bool) -> None:
+        self.script(end, data_ok)
+        self.pos += 1
+
+    def redirect(self, command: ShellCommand, op: str) -> None:
+        self.pos += len(op)
+        match = SHELL_SYNTAX.BLANKS.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+        start = self.pos
+        quoted, _ = self.word()
+        target = self.text[start:self.pos]
+        if not target:
+            raise ShellSyntaxError(f"missing target after {op!r}")
+        command.redirects.append(f"{op} {target}")
+        if op.endswith(('<<', '<<-')):
+            delimiter = unquoted(target)
+            heredoc = [op.endswith('-'), delimiter, quoted, None]
+            self.pending.append(heredoc)
+            command.heredocs.append(heredoc)
+
+    def word(self) -> tuple[bool, bool]:
+        """Advance over one word; returns (has quoted parts, has expansions)."""
+        text, quoted, dynamic = self.text, False, False
+        while self.pos < len(text):
+            match = SHELL_SYNTAX.WORD_TEXT.match(text, self.pos)
+            if match:
+                self.pos = match.end()
+                quoted = quoted or "'" in match.group() or '\\' in match.group()
+                continue
+            char = text[self.pos]
+            if char == '\\':
+                self.pos += 2
+            elif char == "'":
+                raise ShellSyntaxError("unterminated '")
+            elif char == '"':
+                self.pos += 1
+                self.quoted_text(SHELL_SYNTAX.QUOTED_TEXT, '"')
+                quoted = True
+            elif char == '`':
+                self.backtick()
+                quoted = dynamic = True
+            elif char == '$':
+                substituted = self.dollar()
+                quoted = quoted or substituted
+                dynamic = True
+            else:
+                break
+        return quoted, dynamic
+
+    def closing(self, char: str, start: int) -> int:
+        end = self.text.find(char, start)
+        if end < 0:
+            raise ShellSyntaxError(f"unterminated {char}")
+        return end
+
+    def quoted_text(self, pattern: re.Pattern, end: str | None) -> None:
+        """Inside "...", ${...} or an unquoted heredoc body: only expansions matter."""
+        text = self.text
+        while True:
+            match = pattern.match(text, self.pos)
+            if match:
+                self.pos = match.end()
+            if self.pos >= len(text):
+                if end is not None:
+                    raise ShellSyntaxError(f"unterminated {end}")
+                return
+            char = text[self.pos]
+            if char == end:
+                self.pos += 1
+                return
+            if char == '\\':
+                self.pos += 2
+            elif char == '`':
+                self.backtick()
+            elif char == '$':
+                self.dollar()
+            elif char == "'":
+                self.pos = self.closing("'", self.pos + 1) + 1
+            else:
+                self.pos += 1
+                self.quoted_text(SHELL_SYNTAX.QUOTED_TEXT, '"')
+
+    def dollar(self) -> bool:
+        """Advance over a $ expansion; True for $(...) command substitution."""
+        following = self.text[self.pos + 1:self.pos + 2]
+        if following == '(':
+            # $(...) and $((...)): the arithmetic form parses as a subshell inside
+            self.pos += 2
+            self.group(')', True)
+            return True
+        if following == '{':
+            self.pos += 2
+            self.quoted_text(SHELL_SYNTAX.BRACED_TEXT, '}')
+        elif following == "'":
+            pos = self.pos + 2
+            while self.text[end := self.closing_any("\\'", pos)] == '\\':
+                pos = end + 2
+            self.pos = end + 1
+        else:
+            self.pos += 1
+        return False
+
+    def closing_any(self, chars: str, start: int) -> int:
+        """Position of the first of chars from start (a backslash or the closing quote)."""
+        positions = [p for p in (self.text.find(c, start) for c in chars) if p >= 0]
+        if not positions:
+            raise ShellSyntaxError(f"unterminated {chars[-1]}")
+        return min(positions)
+
+    def backtick(self) -> None:
+        """`...`: the unescaped body is a script of its own."""
+        text, pos = self.text, self.pos + 1
+        while text[end := self.closing_any('\\`', pos)] == '\\':
+            pos = end + 2
+        body = text[self.pos + 1:end].replace('\\\\', '\\').replace('\\`', '`').replace('\\$', '$')
+        self.pos = end + 1
+        self.merge(ShellScript(body).parse())
+
+    def heredoc_bodies(self) -> None:
+        text = self.text
+        for heredoc in self.pending:
+            strip_tabs, delimiter, quoted, _ = heredoc
+            end = re.compile(('^\t*' if strip_tabs else '^') + re.escape(delimiter) + '$', re.M).search(text, self.pos)
+            if end is None:
+                raise ShellSyntaxError(f"unterminated heredoc {delimiter!r}")
+            heredoc[3] = text[self.pos:end.start()]
+            self.pos = min(end.end() + 1, len(text))
+            if not quoted:
+                # Unquoted delimiter: $(...) and `...` in the body run
+                body = ShellScript(heredoc[3])
+                body.quoted_text(SHELL_SYNTAX.HEREDOC_TEXT, None)
+                if body.pending:
+                    raise ShellSyntaxError("heredoc inside an unterminated substitution")
+                self.merge(body)
+        self.pending = []
+
+    def merge(self, other: 'ShellScript') -> None:
+        self.segments += other.segments
+        self.opaque = self.opaque or other.opaque
+        self.drops = self.drops or other.drops
+
+    # --- segments ---
+
+    def finish(self, pipeline: list[ShellCommand]) -> None:
+        if not pipeline:
+            return
+        cd = False
+        for i, command in enumerate(pipeline):
+            start = command.start()
+            if start == len(command.words) or command.dynamic[start]:
+                continue
+            name = unquoted(command.words[start])
+            if name in COMPOUND_WORDS:
+                self.opaque = True
+            # Only the last command of a pipeline writes where nothing reads it as input
+            if name in DATA_NAMES and command.data_ok and i == len(pipeline) - 1:
+                command.data = self.data_kind(command, start)
+                self.drops = self.drops or command.data is not None
+            cd = cd or (i == 0 and name in CD_WORDS)
+        self.segments.append((pipeline, cd))
+
+    @staticmethod
+    def data_kind(command: ShellCommand, start: int) -> tuple[str, int] | None:
+        """(DATA_COMMANDS kind, length of the command name) if the command has data to leave out."""
+        names = command.names(start)
+        for length in (3, 2, 1):
+            kind = DATA_COMMANDS.get(tuple(names[:length])) if len(names) >= length else None
+            if kind is None:
+                continue
+            if command.writes_file(start):
+                return None     # A file someone may run later: screened like the command itself
+            if (command.heredocs or kind == 'args' and len(command.words) > start + length
+                    or kind == 'strings' and any(command.quoted[start + length:])):
+                return kind, length
+            return None
+        return None
+
+    def executes_data(self) -> bool:
+        """Whether anything in the command could run text that a data command printed or wrote."""
+        # Quotes removed first: b'as'h is bash
+        executors = re.search(EXECUTOR_HINT, self.text.translate(UNQUOTE), re.IGNORECASE) is not None
+        for pipeline, _ in self.segments:
+            for command in pipeline:
+                start = command.start()
+                names = command.names(start)
+                if start < len(command.words) and command.dynamic[start]:
+                    return True     # $cmd, $(cmd) ...: unknown command
+                if names and (names[0] in WRAPPERS or '/' in names[0]):
+                    return True
+                if executors and any(re.fullmatch(EXECUTOR, unquoted(word), re.IGNORECASE)
+                                     for word, dynamic in zip(command.words, command.dynamic) if not dynamic):
+                    return True
+        return False
+
+    @staticmethod
+    def render(pipeline: list[ShellCommand]) -> str:
+        """Segment text of a pipeline (heredoc bodies are known once parsing is done)."""
+        return ' | '.join(ShellScript.render_command(command) for command in pipeline)
+
+    @staticmethod
+    def render_command(command: ShellCommand) -> str:
+        """Text of one command, without the parts that are plain data."""
+        words = command.words
+        if command.data is not None:
+            kind, length = command.data
+            prefix = command.start() + length
+            if kind == 'args':
+                words = words[:prefix]
+            elif kind == 'strings':
+                words = words[:prefix] + [w for w, q in zip(words[prefix:], command.quoted[prefix:]) if not q]
+            return ' '.join(words + command.redirects)
+        return ' '.join(words + command.redirects + [heredoc[3] for heredoc in command.heredocs if heredoc[3]])
+
+
+def shell_segments(command: str) -> list[str]:
+    """
+    Texts the Bash rules are matched against: one per pipeline (see
+    ShellScript), each prefixed with the command's cd/pushd segments so
+    `cd / && rm -rf *` still shows the path. Falls back to the whole command
+    when it cannot be segmented or is opaque.
+    """
+    if SHELL_SYNTAX.SIMPLE_COMMAND.fullmatch(command):
+        words = command.split(None, 1)
+        if not words or DATA_COMMANDS.get((words[0],)) != 'args':
+            return [command]
+    try:
+        script = ShellScript(command).parse()
+    except (ShellSyntaxError, RecursionError):
+        return [command]
+    if script.opaque or not script.segments or (script.drops and script.executes_data()):
+        return [command]
+
+    texts = [(ShellScript.render(pipeline), is_cd) for pipeline, is_cd in script.segments]
+    cd = ' ; '.join(text for text, is_cd in texts if is_cd)
+    return [f"{cd} ; {text}" if cd and not is_cd else text for text, is_cd in texts]
+
+
+def command_segments(command: str) -> list[str]:
+    """shell_segments() in the normalized form delete and system rules are matched against."""
+    return [normalize_command(segment) for segment in shell_segments(command)]
+
+
+# Characters of plain words, and of the separators between commands, as str.translate() deletion
+# tables: quotes, $, backticks, redirections, (), {}, [], \, !, # and ^ send a command down the full path
+SAFE_WORD_CHARS = dict.fromkeys(map(ord, 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_./:=,+@%~*?-'))
+SAFE_CHARS = {**SAFE_WORD_CHARS, **dict.fromkeys(map(ord, ' \t\n;&|'))}
+
+
+def safe_pipelines(command: str) -> list[str] | None:
+    """
+    The pipelines of command, as shell_segments() would give them, if every
+    command in every pipeline is an allowlisted prefix followed only by its
+    allowed options (see SAFE_PREFIXES), joined by ; & && || |; else None.
+    The allowlist is a token trie: the cost is one pass over the command.
+    """
+    if not command or command.translate(SAFE_CHARS):
+        return None
+    trie = get_rules().safe_prefixes
+    pipelines = []
+    for pipeline in SHELL_SYNTAX.PIPELINE_SEPARATORS.split(command):
+        if not pipeline.strip():
+            continue
+        for simple in pipeline.split('|'):
+            node = trie
+            tokens = simple.split()
+            for index, token in enumerate(tokens, 1):
+                node = node.get(token)
+                if node is None or None in node:
+                    break
+            if node is None or None not in node:
+                return None
+            if any(token not in node[None] for token in tokens[index:]):
+                return None
+        pipelines.append(pipeline.strip())
+    return pipelines or None
+
+
+# =============================================================================
+# Path extraction and resolution
+# =============================================================================
+
+# Input fields holding paths; a second field (a glob) is relative to the first
+TOOL_PATH_FIELDS = {
+    'Read': ('file_path',),
+    'Write': ('file_path',),
+    'Edit': ('file_path',),
+    'MultiEdit': ('file_path',),
+    'NotebookEdit': ('notebook_path',),
+    'Grep': ('path', 'glob'),
+    'Glob': ('path', 'pattern'),
+}
+# Tools whose path is the root of a recursive search
+SEARCH_TOOLS = ('Grep', 'Glob')
+TOOL_VERBS = {'Read': 'Reading', 'Write': 'Writing', 'Edit': 'Editing', 'MultiEdit': 'Editing',
+              'NotebookEdit': 'Editing', 'Grep': 'Searching', 'Glob': 'Listing'}
+
+PATH_SYNTAX = LazyPatterns(
+    PATH_WORD_SEPARATORS=r'[\s|&;<>()=\'"`]+',
+    BRACES=r'\{([^{}]*,[^{}]*)\}',
+    HOME_VARIABLE=r'^\$(?:HOME|\{HOME\})(?=[/\\]|$)',
+)
+BRACE_EXPANSIONS = 64
+
+
+def tool_paths(tool_name: str, tool_input: dict) -> list[str]:
+    """Paths a file tool call touches, as given (plus path/glob joined for Grep and Glob)."""
+    paths = [value for value in (tool_input.get(field) for field in TOOL_PATH_FIELDS.get(tool_name, ()))
+             if isinstance(value, str) and value]
+    if len(paths) == 2:
+        paths.append(paths[0].rstrip('/\\') + '/' + paths[1])
+    return paths
+
+
+def brace_expanded(word: str) -> list[str]:
+    """word with {a,b} alternatives expanded, up to BRACE_EXPANSIONS words (the rest kept as is)."""
+    pending, words = [word], []
+    while pending and len(words) + len(pending) < BRACE_EXPANSIONS:
+        word = pending.pop()
+        match = PATH_SYNTAX.BRACES.search(word)
+        if match is None:
+            words.append(word)
+            continue
+        pending.extend(word[:match.start()] + alternative + word[match.end():]
+                       for alternative in reversed(match.group(1).split(',')))
+    return words + pending
+
+
+def path_words(segment: str) -> list[str]:
+    """Words of a Bash segment that may name files, unquoted, '--opt=' values split off."""
+    words = {}
+    for word in PATH_SYNTAX.PATH_WORD_SEPARATORS.split(segment):
+        if word:
+            words.update(dict.fromkeys(brace_expanded(word) if '{' in word else (word,)))
+    return list(words)
+
+
+@functools.lru_cache(maxsize=REALPATH_CACHE)
+def _resolved(path: str, existing: bool, epoch: int) -> str | None:
+    try:
+        if existing and not os.path.lexists(path):
+            return None
+        return os.path.realpath(path)
+    except (OSError, ValueError):
+        return None
+
+
+def resolved_path(path: str, existing: bool = False) -> str | None:
+    """
+    path with ~/$HOME expanded and symlinks resolved, memoized for
+    REALPATH_TTL seconds so a daemon notices new links. With existing, a
+    path that does not exist gives None: nothing can be read through it.
+    """
+    epoch = int(time.monotonic() / REALPATH_TTL)
+    return _resolved(os.path.expanduser(PATH_SYNTAX.HOME_VARIABLE.sub('~', path, 1)), existing, epoch)
+
+
+def search_root(path: str) -> str:
+    """Directory a Grep/Glob path (or path/glob) searches: the components before the first wildcard."""
+    parts = path.replace('\\', '/').split('/')
+    for index, part in enumerate(parts):
+        if POLICY_SYNTAX.GLOB_CHARS.search(part):
+            return '/'.join(parts[:index]) or ('/' if index else '.')
+    return path
+
+
+def protected_within(directory: str) -> tuple | None:
+    """
+    First protected-path entry located in or under directory, as written
+    (relative to the working directory) or where its symlinks lead: a
+    recursive search rooted there reaches it.
+    """
+    policy = get_rules().paths
+    expanded = os.path.expanduser(PATH_SYNTAX.HOME_VARIABLE.sub('~', directory, 1))
+    rule = policy.first_within(os.path.abspath(expanded))
+    if rule is None:
+        real = resolved_path(directory)
+        if real is not None:
+            rule = policy.first_within(real)
+    return rule
+
+
+def protected(path: str, existing: bool = False) -> tuple | None:
+    """First protected-path entry matching path as written or where its symlinks lead."""
+    policy = get_rules().paths
+    rule = policy.first(path)
+    if rule is None:
+        real = resolved_path(path, existing)
+        if real is not None:
+            rule = policy.first(real)
+    return rule
+
+
+# =============================================================================
+# Checks
+# =============================================================================
+
+
+def normalize_command(command: str) -> str:
+    """Lowercased, whitespace collapsed: the form delete and system rules are matched against."""
+    return ' '.join(command.lower().split())
+
+
+def is_dangerous_delete_command(command: str, normalized: str | None = None) -> bool:
+    """
+    Detection of dangerous delete commands.
+    Cross-platform: Unix (rm) and Windows (del, rd, rmdir, Remove-Item).
+    """
+    if normalized is None:
+        normalized = normalize_command(command)
+
+    for delete_patterns, dangerous_paths in get_rules().delete:
+        if delete_patterns.matches(normalized) and dangerous_paths.matches(normalized):
+            return True
+
+    return False
+
+
+def is_dangerous_system_command(command: str, normalized: str | None = None) -> tuple[bool, str | None]:
+    """
+    Detection of dangerous system commands.
+    Cross-platform: Unix and Windows/PowerShell.
+    """
+    if normalized is None:
+        normalized = normalize_command(command)
+
+    rule = get_rules().system.first(normalized)
+    if rule is not None:
+        return True, rule[1]
+
+    return False, None
+
+
+def is_credential_read(tool_name: str, tool_input: dict, segments: list[str] | None = None) -> tuple:
+    """
+    Blocks access to protected credential paths by any file tool.
+    For Bash, a read command and a protected path must be in the same segment
+    (segments as returned by shell_segments()).
+    """
+    rules = get_rules()
+
+    if tool_name in TOOL_PATH_FIELDS:
+        paths = tool_paths(tool_name, tool_input)
+        if tool_name in SEARCH_TOOLS and not tool_input.get('path'):
+            paths.append(os.getcwd())  # Without a path, the search starts in the working directory
+        for path in paths:
+            for candidate in brace_expanded(path) if '{' in path else (path,):
+                rule = protected(candidate) or rules.credentials.first(candidate)
+                if rule is None and tool_name in SEARCH_TOOLS:
+                    rule = protected_within(search_root(candidate))
+                if rule is not None:
+                    return True, f"{TOOL_VERBS[tool_name]} {rule[1]}: {path}"
+
+    elif tool_name == 'Bash':
+        if segments is None:
+            segments = shell_segments(tool_input.get('command', ''))
+        for segment in segments:
+            normalized = normalize_command(segment)
+            if not rules.read_commands.matches(normalized):
+                continue
+            for word in path_words(segment):
+                rule = protected(word, existing=True)
+                if rule is not None:
+                    return True, f"Reading {rule[1]} via shell"
+            rule = rules.credentials.first(normalized)
+            if rule is not None:
+                return True, f"Reading {rule[1]} via shell"
+
+    return False, None
+
+
+def is_docker_safe(command: str) -> bool:
+    """
+    Checks if command is a safe docker command.
+    Docker commands are generally allowed, but some require attention.
+    """
+    normalized = command.strip().lower()
+
+    return not get_rules().docker.matches(normalized)
+
+
+def rotate_log(log_path: str, keep: int = LOG_SEGMENTS) -> None:
+    """
+    Shift log_path -> log_path.1 -> ... -> log_path.<keep>, dropping the oldest.
+    Claiming the active file with an atomic rename makes exactly one of several
+    concurrent writers perform the rotation; the others keep appending.
+    """
+    claimed = f"{log_path}.rotating.{os.getpid()}"
+    try:
+        os.replace(log_path, claimed)
+    except OSError:
+        return
+
+    for index in range(keep - 1, 0, -1):
+        try:
+            os.replace(f"{log_path}.{index}", f"{log_path}.{index + 1}")
+        except OSError:
+            continue
+
+    try:
+        if keep > 0:
+            os.replace(claimed, f"{log_path}.1")
+        else:
+            os.remove(claimed)
+    except OSError:
+        return
+
+
+class AuditLog:
+    """
+    Append-only JSON Lines writer for one log file.
+    The descriptor stays open between appends (daemon mode) and is reopened
+    when another process has rotated the file away.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = None
+
+    def append(self, line: bytes) -> None:
+        if self.fd is not None and not self._is_current():
+            self.close()
+        if self.fd is None:
+            self.fd = self._open()
+        os.write(self.fd, line)
+        if os.fstat(self.fd).st_size >= LOG_SEGMENT_BYTES:
+            self.close()
+            rotate_log(self.path)
+
+    def _open(self) -> int:
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        try:
+            return os.open(self.path, flags, 0o600)
+        except FileNotFoundError:
+            # Log directory removed since it was resolved (and cached)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            return os.open(self.path, flags, 0o600)
+
+    def close(self) -> None:
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
+
+    def _is_current(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self.fd).st_ino
+        except OSError:
+            return False
+
+
+_AUDIT_LOGS = {}
+_AUDIT_STORES = {}
+
+
+def store_records(log_dir: str, records: list[tuple[float, dict]]) -> bool:
+    """Record (unix time, entry) pairs in the SQLite audit store; False if that failed."""
+    try:
+        store = _AUDIT_STORES.get(log_dir)
+        if store is None:
+            from guard_audit import DB_NAME, AuditStore
+            store = _AUDIT_STORES[log_dir] = AuditStore(os.path.join(log_dir, DB_NAME))
+        store.record(records)
+        return True
+    except Exception:
+        # No sqlite3, database locked past the busy timeout, disk full...
+        return False
+
+
+def write_records(log_dir: str, records: list[tuple[float, dict]]) -> bool:
+    """
+    Write (unix time, entry) pairs to the audit backends (CODEX_GUARD_AUDIT):
+    one O_APPEND write to the JSON Lines log and/or one SQLite transaction.
+    Records the store could not take go to the JSON Lines log instead.
+    Returns False if they could not be written anywhere.
+    """
+    if AUDIT_BACKEND in ('sqlite', 'both'):
+        if store_records(log_dir, records) and AUDIT_BACKEND == 'sqlite':
+            return True
+
+    log_path = os.path.join(log_dir, LOG_NAME)
+    lines = ''.join(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n' for _, entry in records)
+
+    audit_log = _AUDIT_LOGS.get(log_path)
+    if audit_log is None:
+        audit_log = _AUDIT_LOGS[log_path] = AuditLog(log_path)
+    try:
+        audit_log.append(lines.encode('utf-8'))
+        return True
+    except OSError:
+        audit_log.close()
+        # The cached log directory may have gone away; re-probe on the next run
+        forget_log_dir()
+        return False
+
+
+BLOB_DIR = 'blobs'
+ELIDED_FLOOR = 64      # smallest field size the record cap shrinks fields to
+
+
+def bounded_value(value, limit: int, path: str, elided: dict):
+    """value with every string over limit bytes cut short; the full strings go to elided by field path."""
+    if isinstance(value, str):
+        # UTF-8 takes at most 4 bytes per character: most strings need no encoding
+        if len(value) * 4 <= limit:
+            return value
+        data = value.encode('utf-8', 'surrogatepass')
+        if len(data) <= limit:
+            return value
+        elided[path] = data
+        return data[:limit].decode('utf-8', 'ignore') + '…'
+    if isinstance(value, dict):
+        return {key: bounded_value(item, limit, f"{path}.{key}", elided) for key, item in value.items()}
+    if isinstance(value, list):
+        return [bounded_value(item, limit, f"{path}.{index}", elided) for index, item in enumerate(value)]
+    return value
+
+
+def json_bytes(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8', 'surrogatepass')
+
+
+def bounded_entry(log_dir: str, entry: dict) -> dict:
+    """
+    entry with its reason and tool_input bounded (see LOG_FIELD_BYTES).
+    Each elided value is listed under "elided" as {field path: {"sha256",
+    "bytes"}}. Strings shrink until the record fits LOG_RECORD_BYTES; below
+    ELIDED_FLOOR, whole lists/objects of tool_input are elided instead
+    (largest first, "json": true, value null), then tool_input itself.
+    """
+    if LOG_FIELD_BYTES <= 0:
+        return entry
+
+    def fits(bounded: dict, elided: dict) -> bool:
+        # Each "elided" item adds its path, a hex digest and a length
+        overhead = sum(len(path) + 112 for path in elided)
+        return LOG_RECORD_BYTES <= 0 or len(json_bytes(bounded)) + overhead <= LOG_RECORD_BYTES
+
+    limit = LOG_FIELD_BYTES
+    while True:
+        elided = {}
+        bounded = dict(entry, reason=bounded_value(entry['reason'], limit, 'reason', elided),
+                       tool_input=bounded_value(entry['tool_input'], limit, 'tool_input', elided))
+        if fits(bounded, elided) or limit == ELIDED_FLOOR:
+            break
+        limit = max(ELIDED_FLOOR, limit // 4)
+
+    structured = set()
+    fields = bounded['tool_input']
+    if not fits(bounded, elided) and isinstance(fields, dict):
+        sizes = {key: len(json_bytes(value)) for key, value in fields.items() if isinstance(value, (dict, list))}
+        for key in sorted(sizes, key=sizes.get, reverse=True):
+            path = f"tool_input.{key}"
+            elided = {name: data for name, data in elided.items() if not name.startswith(path + '.')}
+            elided[path] = json_bytes(entry['tool_input'][key])
+            structured.add(path)
+            fields[key] = None
+            if fits(bounded, elided):
+                break
+    if not fits(bounded, elided):
+        elided = {name: data for name, data in elided.items() if name == 'reason'}
+        elided['tool_input'] = json_bytes(entry['tool_input'])
+        structured = {'tool_input'}
+        bounded['tool_input'] = None
+
+    if not elided:
+        return entry
+    import hashlib
+
+    bounded['elided'] = {}
+    for path, data in elided.items():
+        digest = hashlib.sha256(data).hexdigest()
+        bounded['elided'][path] = {"sha256": digest, "bytes": len(data)}
+        if path in structured:
+            bounded['elided'][path]["json"] = True
+        if LOG_BLOBS:
+            store_blob(log_dir, digest, data)
+    return bounded
+
+
+def blob_path(log_dir: str, digest: str) -> str:
+    return os.path.join(log_dir, BLOB_DIR, digest[:2], digest)
+
+
+def store_blob(log_dir: str, digest: str, data: bytes) -> None:
+    """Keep an elided value under its SHA-256; content already stored is not written again."""
+    path = blob_path(log_dir, digest)
+    if os.path.exists(path):
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # The record still carries the digest
+
+
+def log_action(log_dir: str, input_data: dict, blocked: bool = False, reason: str = None):
+    """
+    Record one decision. In deferred mode (CODEX_GUARD_LOG_MODE=deferred) it
+    is only spooled, and a background collector writes it; otherwise it is
+    written before the verdict goes out.
+    """
+    now = time.time()
+    entry = {
+        "timestamp": timestamp(now),
+        "tool_name": input_data.get('tool_name', ''),
+        "blocked": blocked,
+        "reason": reason,
+        "tool_input": input_data.get('tool_input', {})
+    }
+    entry = bounded_entry(log_dir, entry)
+
+    if LOG_MODE == 'deferred' and hasattr(os, 'fork'):
+        try:
+            from guard_spool import spool_record, start_collector
+            spool_record(now, log_dir, entry)
+            start_collector()
+            return
+        except OSError:
+            pass  # Spool unusable - write synchronously
+
+    write_records(log_dir, [(now, entry)])
+
+
+# =============================================================================
+# Verdict
+# =============================================================================
+
+DOCKER_REASON = "Potentially dangerous docker command"
+
+
+def scanned_text(tool_name: str, tool_input: dict) -> str | None:
+    """The input evaluate() matches rules against, or None for tools without checks."""
+    if tool_name == 'Bash':
+        return tool_input.get('command', '')
+    if tool_name in TOOL_PATH_FIELDS:
+        return '\n'.join(tool_paths(tool_name, tool_input))
+    return None
+
+
+def oversized(text: str | None) -> bool:
+    return MAX_SCAN > 0 and text is not None and len(text) > MAX_SCAN
+
+
+def evaluate(tool_name: str, tool_input: dict) -> tuple[bool, str | None]:
+    """Run every check on one tool call; returns (blocked, reason)."""
+    # === Block input too large to screen (fail-closed) ===
+    text = scanned_text(tool_name, tool_input)
+    if oversized(text):
+        return True, f"Input too large to screen ({len(text)} chars, limit {MAX_SCAN}; see CODEX_GUARD_MAX_SCAN)"
+
+    get_rules()
+    TIMER.mark('rules.load')
+
+    # Allowlisted commands (see safe_pipelines) skip segmentation and every rule but the credential checks
+    fast = None
+    if tool_name == 'Bash' and FAST_PATH:
+        fast = safe_pipelines(text)
+        TIMER.count('fast_path.miss' if fast is None else 'fast_path.hit')
+
+    # Bash rules see each pipeline on its own, without echoed text or heredoc data
+    raw_segments = fast or (shell_segments(text) if tool_name == 'Bash' else None)
+    TIMER.mark('segments')
+
+    # === Check credential file access ===
+    is_cred, cred_reason = is_credential_read(tool_name, tool_input, raw_segments)
+    TIMER.mark('rules.credential')
+    if is_cred:
+        return True, cred_reason
+    if fast is not None:
+        return False, None
+
+    # === Check Bash commands ===
+    if tool_name == 'Bash':
+        segments = [normalize_command(segment) for segment in raw_segments]
+        # Check dangerous delete commands (rm/del/rd), in each segment and across them: the
+        # path can sit in another segment than the delete (xargs rm -rf < list; ls /)
+        whole = ' ; '.join(segments)
+        dangerous_delete = (any(is_dangerous_delete_command(segment, segment) for segment in segments)
+                            or len(segments) > 1 and is_dangerous_delete_command(whole, whole))
+        TIMER.mark('rules.delete')
+        if dangerous_delete:
+            return True, "Dangerous delete command detected"
+
+        # Check system commands
+        for segment in segments:
+            is_dangerous, danger_reason = is_dangerous_system_command(segment, segment)
+            if is_dangerous:
+                TIMER.mark('rules.system')
+                return True, f"Dangerous system command: {danger_reason}"
+        TIMER.mark('rules.system')
+
+        # Check docker commands
+        dangerous_docker = any('docker' in segment and not is_docker_safe(segment) for segment in segments)
+        TIMER.mark('rules.docker')
+        if dangerous_docker:
+            return True, DOCKER_REASON
+
+    return False, None
+
+
+def handle_event(input_data: dict, log_dir: str) -> tuple[int, str]:
+    """Evaluate and log one hook event; returns (exit code, stderr message)."""
+    blocked, reason = evaluate_cached(input_data.get('tool_name', ''), input_data.get('tool_input', {}))
+    log_action(log_dir, input_data, blocked=blocked, reason=reason)
+    TIMER.mark('log_action')
+    return verdict_reply(blocked, reason)
+
+
+def verdict_reply(blocked: bool, reason: str | None) -> tuple[int, str]:
+    """Exit code and stderr message for a verdict."""
+    if not blocked:
+        return 0, ''
+    message = f"BLOCKED: {reason}"
+    if reason == DOCKER_REASON:
+        message += "\nPrivileged containers and root mounts are restricted"
+    return 2, message
+
+
+def evaluate_cached(tool_name: str, tool_input: dict) -> tuple[bool, str | None]:
+    """evaluate() behind the verdict cache (guard_verdicts.py) while CODEX_GUARD_VERDICT_CACHE is set."""
+    if VERDICT_CACHE_ENTRIES <= 0:
+        return evaluate(tool_name, tool_input)
+    from guard_verdicts import cached_verdict
+    return cached_verdict(tool_name, tool_input)
+
+
+# =============================================================================
+# Hook run
+# =============================================================================
+
+
+def save_metrics() -> None:
+    """Add this run's phase timings to the metrics file (no-op while metrics are off)."""
+    if isinstance(TIMER, NoTimer):
+        return
+    from hook_metrics import metrics_path
+    try:
+        TIMER.save(metrics_path(state_dir()))
+    except OSError:
+        pass  # Metrics never decide a verdict
+
+
+def save_rule_stats() -> None:
+    """Add the per-rule counters gathered since the last save to the stats file (stats mode only)."""
+    if RULE_STATS:
+        from guard_stats import merge_rule_stats
+        merge_rule_stats(RULE_STATS)
+
+
+def main(raw: bytes | None = None):
+    """One hook call: the event on stdin (or raw), the verdict as exit code and stderr."""
+    global TIMER
+    try:
+        if os.environ.get('CODEX_HOOK_METRICS') == '1' or '--metrics' in sys.argv:
+            from hook_metrics import PhaseTimer
+            TIMER = PhaseTimer('guard')
+
+        input_data = json.loads(raw) if raw is not None else json.load(sys.stdin)
+        TIMER.mark('parse')
+
+        # Define log directory (platform-agnostic: Codex or Claude Code)
+        log_dir = resolve_log_dir()
+        TIMER.mark('resolve_log_dir')
+
+        code, message = handle_event(input_data, log_dir)
+        if message:
+            print(message, file=sys.stderr)
+        save_metrics()
+        save_rule_stats()
+        sys.exit(code)
+
+    except json.JSONDecodeError:
+        sys.exit(2)
+    except RuleFileError as e:
+        print(f"BLOCKED: invalid guard rules: {e}", file=sys.stderr)
+        sys.exit(2)
+    except Exception:
+        # On hook error - block (fail-close)
+        sys.exit(2)
+
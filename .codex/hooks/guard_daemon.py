@@ -0,0 +1,94 @@
+"""
+Resident guard (optional): `guard.py --daemon`, queried by guard_client.py.
+Keeps the rules compiled and the audit log open, so a tool call only pays
+for the client's socket round trip. Loaded only in daemon mode; the
+one-shot hook never imports it.
+"""
+
+import json
+import os
+import sys
+
+from guard_core import (RuleFileError, evaluate_cached, get_rules, log_action, refresh_rules, save_rule_stats,
+                        verdict_reply)
+from hook_paths import resolve_log_dir
+
+
+def serve(socket_path: str) -> None:
+    """
+    Serve verdicts over a Unix socket with rules compiled and the log open.
+    Protocol: the client sends the hook JSON and shuts down its write side;
+    the reply is the exit code on the first line followed by the stderr text.
+    """
+    import signal
+    import socket
+    import socketserver
+    import threading
+
+    lock = threading.Lock()
+    log_dir = resolve_log_dir()
+    try:
+        get_rules()
+    except RuleFileError as e:
+        # Keep serving: every request is blocked with this message until the file is fixed
+        print(f"invalid guard rules: {e}", file=sys.stderr)
+
+    class Handler(socketserver.StreamRequestHandler):
+        timeout = 2
+
+        def handle(self):
+            try:
+                input_data = json.loads(self.rfile.read())
+                with lock:
+                    refresh_rules()
+                    verdict = evaluate_cached(input_data.get('tool_name', ''), input_data.get('tool_input', {}))
+                code, message = verdict_reply(*verdict)
+            except RuleFileError as e:
+                verdict, (code, message) = None, (2, f"BLOCKED: invalid guard rules: {e}")
+            except Exception:
+                # Malformed request or check failure - block (fail-close)
+                verdict, (code, message) = None, (2, '')
+            try:
+                self.wfile.write(f"{code}\n{message}".encode('utf-8'))
+                # EOF ends the client's read: log after replying, the agent does not wait for the write
+                self.request.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass  # Client gave up and fell back to in-process evaluation
+            if verdict is not None:
+                with lock:
+                    log_action(log_dir, input_data, *verdict)
+                    save_rule_stats()
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    socket_dir = os.path.dirname(socket_path)
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    if os.stat(socket_dir).st_uid != os.getuid():
+        raise SystemExit(f"{socket_dir} is not owned by the current user")
+
+    # Replace a stale socket, but never steal one from a running daemon
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            raise SystemExit(f"guard daemon already running on {socket_path}")
+        except OSError:
+            os.remove(socket_path)
+        finally:
+            probe.close()
+
+    old_umask = os.umask(0o077)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(old_umask)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Offline replay of guard audit logs against a candidate rule set.
+Every recorded tool call in the pre_tool_use.jsonl segments (or a legacy
+pre_tool_use.json array) is evaluated by the current rules and by the
+candidate, and the verdicts are compared: what would newly be blocked,
+what would no longer be, and which block reasons would change.
+
+    python3 guard_replay.py --candidate-rules new_rules.toml
+    python3 guard_replay.py --candidate-guard ~/src/guard_core.py --jobs 8 old/*.jsonl
+    python3 guard_replay.py --candidate-rules new_rules.toml --json > diff.json
+
+Logs are streamed in batches over a process pool; each worker returns
+counts, not verdicts. Exit status is 1 when any verdict changes.
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+REPLAY_BATCH = 2000
+# Verdicts memoized per worker: logs repeat the same few commands
+MEMO_ENTRIES = 65536
+ALLOWED = None  # reason key of an allowed verdict
+EXAMPLES = 5    # distinct sample calls kept per changed verdict
+
+_sides = None
+_log_dir = None
+_memo = {}
+
+
+# =============================================================================
+# Rule sets
+# =============================================================================
+
+
+def load_side(name: str, guard_path: str, rules_path: str | None):
+    """A private instance of guard_core.py at guard_path with its rules compiled from rules_path."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(f'guard_replay_{name}', guard_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # Not use_cache: the merged-rules cache belongs to the installed hook
+    module._RULES = module.load_rules(rules_path, use_cache=False)
+    return module
+
+
+def init_worker(sides: list[tuple[str, str, str | None]], log_dir: str | None) -> None:
+    global _sides, _log_dir
+    _sides = [load_side(*side) for side in sides]
+    _log_dir = log_dir
+
+
+def verdict(module, tool_name: str, tool_input: dict) -> str | None:
+    """Block reason of one side, ALLOWED when allowed; a failing check blocks, as in the hook."""
+    try:
+        blocked, reason = module.evaluate(tool_name, tool_input)
+    except Exception:
+        return 'Guard check failed'
+    return (reason or 'blocked') if blocked else ALLOWED
+
+
+# =============================================================================
+# Records
+# =============================================================================
+
+
+def restored_input(entry: dict) -> dict | None:
+    """
+    The tool_input a record was screened with. Fields elided from the log
+    (see guard_core.bounded_entry) are read back from the blob store; None when
+    a blob is missing and the call cannot be replayed faithfully.
+    """
+    tool_input = entry.get('tool_input')
+    elided = entry.get('elided') or {}
+    if not any(path.split('.')[0] == 'tool_input' for path in elided):
+        return tool_input if isinstance(tool_input, dict) else None
+    if _log_dir is None:
+        return None
+
+    root = {'tool_input': tool_input}
+    for path, info in sorted(elided.items(), key=lambda item: item[0].count('.')):
+        parts = path.split('.')
+        if parts[0] != 'tool_input':
+            continue
+        digest = info.get('sha256', '')
+        try:
+            with open(os.path.join(_log_dir, 'blobs', digest[:2], digest), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        value = json.loads(data) if info.get('json') else data.decode('utf-8', 'surrogatepass')
+        node = root
+        try:
+            for part in parts[:-1]:
+                node = node[int(part)] if isinstance(node, list) else node[part]
+            if isinstance(node, list):
+                node[int(parts[-1])] = value
+            else:
+                node[parts[-1]] = value
+        except (KeyError, IndexError, ValueError, TypeError):
+            return None
+    return root['tool_input'] if isinstance(root['tool_input'], dict) else None
+
+
+def replay_batch(records: list) -> dict:
+    """
+    Counts for one batch of log records (JSON lines or parsed entries):
+    {"records", "skipped", "incomplete", "drift", "transitions":
+    [[before reason, after reason, count, [examples]]]}. Reasons are None
+    for allowed; "drift" counts records the current rules judge differently
+    from the log.
+    """
+    counts = {'records': 0, 'skipped': 0, 'incomplete': 0, 'drift': 0}
+    transitions = {}
+    for record in records:
+        counts['records'] += 1
+        try:
+            entry = json.loads(record) if isinstance(record, str) else record
+        except ValueError:
+            entry = None
+        if not isinstance(entry, dict) or 'tool_name' not in entry:
+            counts['skipped'] += 1
+            continue
+        tool_input = restored_input(entry)
+        if tool_input is None:
+            counts['incomplete'] += 1
+            continue
+
+        tool_name = entry['tool_name']
+        key = (tool_name, json.dumps(tool_input, sort_keys=True, ensure_ascii=False))
+        result = _memo.get(key)
+        if result is None:
+            if len(_memo) >= MEMO_ENTRIES:
+                _memo.clear()
+            result = _memo[key] = tuple(verdict(side, tool_name, tool_input) for side in _sides)
+        before, after = result
+        if (before is not ALLOWED) != bool(entry.get('blocked')):
+            counts['drift'] += 1
+
+        transition = transitions.get(result)
+        if transition is None:
+            transition = transitions[result] = [before, after, 0, []]
+        transition[2] += 1
+        if before != after and len(transition[3]) < EXAMPLES:
+            subject = tool_input.get('command') if tool_name == 'Bash' else tool_input.get('file_path')
+            example = f'{tool_name}: {subject}'
+            if example not in transition[3]:
+                transition[3].append(example)
+    counts['transitions'] = list(transitions.values())
+    return counts
+
+
+def batches(paths: list[str]):
+    from guard_audit import read_log
+
+    batch = []
+    for path in paths:
+        for record in read_log(path, raw=True):
+            batch.append(record)
+            if len(batch) >= REPLAY_BATCH:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def replay(paths: list[str], sides: list[tuple], log_dir: str | None, jobs: int = 1) -> dict:
+    """Replay paths (oldest first) through both sides; merged counts of every batch."""
+    totals = {'records': 0, 'skipped': 0, 'incomplete': 0, 'drift': 0}
+    transitions = {}
+
+    def merge(counts):
+        for field in totals:
+            totals[field] += counts[field]
+        for before, after, count, examples in counts['transitions']:
+            transition = transitions.setdefault((before, after), [before, after, 0, []])
+            transition[2] += count
+            for example in examples:
+                if len(transition[3]) < EXAMPLES and example not in transition[3]:
+                    transition[3].append(example)
+
+    # Load both sides here first: rule file errors surface once, and jobs=1 needs no pool
+    init_worker(sides, log_dir)
+    if jobs <= 1:
+        for batch in batches(paths):
+            merge(replay_batch(batch))
+    else:
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(sides, log_dir)) as pool:
+            # A bounded window of batches in flight keeps memory flat on any log size
+            pending = set()
+            for batch in batches(paths):
+                if len(pending) >= jobs * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge(future.result())
+                pending.add(pool.submit(replay_batch, batch))
+            for future in pending:
+                merge(future.result())
+
+    totals['transitions'] = sorted(transitions.values(), key=lambda t: -t[2])
+    return totals
+
+
+# =============================================================================
+# CLI
+# =============================================================================
+
+
+def report(totals: dict, elapsed: float) -> None:
+    from guard_audit import one_line
+
+    transitions = totals['transitions']
+    replayed = sum(t[2] for t in transitions)
+    print(f"replayed {replayed} of {totals['records']} records in {elapsed:.2f} s "
+          f"({totals['skipped']} not tool calls, {totals['incomplete']} with elided input and no blob)")
+    if totals['drift']:
+        print(f"{totals['drift']} records are judged differently by the current rules than when logged")
+
+    sections = [
+        ('Newly blocked', [t for t in transitions if t[0] is ALLOWED and t[1] is not ALLOWED], 1),
+        ('No longer blocked', [t for t in transitions if t[0] is not ALLOWED and t[1] is ALLOWED], 0),
+        ('Block reason changed', [t for t in transitions if ALLOWED not in (t[0], t[1]) and t[0] != t[1]], None),
+    ]
+    for title, selected, column in sections:
+        print(f"\n{title}: {sum(t[2] for t in selected)}")
+        for before, after, count, examples in selected:
+            label = f'{before} -> {after}' if column is None else (after if column else before)
+            print(f"  {count:>8}  {label}")
+            for example in examples:
+                print(f"            {one_line(example)}")
+
+    unchanged = [t for t in transitions if t[0] == t[1]]
+    print(f"\nUnchanged: {sum(t[2] for t in unchanged)} "
+          f"({sum(t[2] for t in unchanged if t[0] is not ALLOWED)} blocked)")
+
+
+def main():
+    import argparse
+
+    from guard_core import rules_path
+    from guard_audit import log_files
+    from hook_paths import HOOKS_DIR, resolve_log_dir
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='log files, oldest first (default: the guard logs)')
+    parser.add_argument('--guard', default=os.path.join(HOOKS_DIR, 'guard_core.py'), help='current guard_core.py')
+    parser.add_argument('--rules', help='current rule file (default: the installed guard_rules.toml)')
+    parser.add_argument('--candidate-guard', help='candidate guard_core.py (default: --guard)')
+    parser.add_argument('--candidate-rules', help='candidate rule file (default: --rules)')
+    parser.add_argument('--log-dir', help='directory of the logs and their blobs (default: the guard log dir)')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='worker processes')
+    parser.add_argument('--json', action='store_true', help='print the counts as JSON')
+    args = parser.parse_args()
+    if not args.candidate_guard and not args.candidate_rules:
+        parser.error('give --candidate-rules and/or --candidate-guard')
+
+    log_dir = args.log_dir or resolve_log_dir()
+    paths = args.files or log_files(log_dir)
+    current_rules = args.rules or rules_path()
+    sides = [
+        ('current', os.path.abspath(args.guard), current_rules),
+        ('candidate', os.path.abspath(args.candidate_guard or args.guard), args.candidate_rules or current_rules),
+    ]
+
+    started = time.perf_counter()
+    try:
+        totals = replay(paths, sides, log_dir, args.jobs)
+    except ValueError as e:  # RuleFileError of either side
+        raise SystemExit(f"invalid guard rules: {e}")
+    elapsed = time.perf_counter() - started
+    changed = any(before != after for before, after, _, _ in totals['transitions'])
+
+    if args.json:
+        totals['transitions'] = [{'before': before, 'after': after, 'count': count, 'examples': examples}
+                                 for before, after, count, examples in totals['transitions']]
+        print(json.dumps(dict(totals, seconds=round(elapsed, 3)), ensure_ascii=False, indent=2))
+    else:
+        report(totals, elapsed)
+    sys.exit(1 if changed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Deferred audit logging (CODEX_GUARD_LOG_MODE=deferred): each hook writes its
+record to a spool directory and returns its verdict; a detached collector
+appends the spooled records to the audit log in batches. Imported only in
+deferred mode and by `guard.py --drain`.
+"""
+
+import json
+import os
+import time
+
+from guard_core import write_records
+from hook_paths import state_dir
+
+# Records are fsynced before the rename (survive power loss, not just a crash)
+SPOOL_SYNC = os.environ.get('CODEX_GUARD_SPOOL_SYNC') == '1'
+
+SPOOL_BATCH = 500
+SPOOL_LINGER = 0.05     # collector waits this long for more records before exiting
+SPOOL_STALE = 60        # seconds after which an unrenamed .tmp record is recovered
+
+
+def spool_dir() -> str:
+    return os.environ.get('CODEX_GUARD_SPOOL') or os.path.join(state_dir(), 'spool')
+
+
+def spool_record(now: float, log_dir: str, entry: dict) -> None:
+    """
+    Queue one record as its own file: written to .tmp, then renamed to .rec,
+    so the collector never sees a partial record. With CODEX_GUARD_SPOOL_SYNC=1
+    it is fsynced first and survives power loss, not just a crash.
+    """
+    directory = spool_dir()
+    name = os.path.join(directory, f"{time.time_ns():020d}.{os.getpid()}")
+    data = json.dumps([now, log_dir, entry], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL
+    try:
+        fd = os.open(name + '.tmp', flags, 0o600)
+    except FileNotFoundError:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd = os.open(name + '.tmp', flags, 0o600)
+    try:
+        os.write(fd, data)
+        if SPOOL_SYNC:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(name + '.tmp', name + '.rec')
+
+
+def spooled(directory: str) -> list[str]:
+    """Spooled record files, oldest first, including .tmp files a crashed hook left behind."""
+    names = []
+    stale = time.time() - SPOOL_STALE
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.rec'):
+            names.append(entry.name)
+        elif entry.name.endswith('.tmp'):
+            try:
+                if entry.stat().st_mtime < stale:
+                    names.append(entry.name)
+            except OSError:
+                continue
+    return sorted(names)
+
+
+def drain_spool() -> int:
+    """
+    Write spooled records to their audit logs in batches, oldest first, and
+    delete them once written. Returns how many were written; OSError if the
+    log cannot be written. Delivery is at-least-once: a collector killed
+    between the two steps repeats a batch.
+    """
+    directory = spool_dir()
+    drained = 0
+    while True:
+        try:
+            names = spooled(directory)[:SPOOL_BATCH]
+        except OSError:
+            return drained
+        if not names:
+            return drained
+
+        batches = {}
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    now, log_dir, entry = json.loads(f.read())
+            except FileNotFoundError:
+                continue  # Drained by a collector that just took over
+            except (OSError, ValueError):
+                # Unreadable or torn (.tmp) record: keep it out of the way, do not retry forever
+                os.replace(path, path + '.bad')
+                continue
+            batches.setdefault(log_dir, []).append((now, entry))
+
+        for log_dir, records in batches.items():
+            if not write_records(log_dir, records):
+                # Keep the records spooled for the next collector
+                raise OSError(f"cannot write the audit log in {log_dir}")
+        for name in names:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+        drained += sum(len(records) for records in batches.values())
+
+
+def start_collector() -> None:
+    """
+    Fork a detached collector that drains the spool, unless one is running
+    (it holds spool/.lock and picks up the new record). The hook process
+    exits right away; the collector has no stdio, so the agent is not kept
+    waiting on its pipes.
+    """
+    import fcntl
+
+    lock_fd = os.open(os.path.join(spool_dir(), '.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(lock_fd)
+        return
+
+    if os.fork() != 0:
+        os.close(lock_fd)  # The child's copy keeps the lock
+        return
+
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for stdio_fd in (0, 1, 2):
+            os.dup2(devnull, stdio_fd)
+        collect(lock_fd)
+    finally:
+        os._exit(0)
+
+
+def collect(lock_fd: int) -> None:
+    """Drain until the spool stays empty, then hand over the lock without stranding records."""
+    import fcntl
+
+    while True:
+        try:
+            while drain_spool():
+                time.sleep(SPOOL_LINGER)
+        except OSError:
+            return  # Log not writable; the records wait for the next collector
+        fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        # A hook that spooled while we held the lock did not start a collector
+        try:
+            if not spooled(spool_dir()):
+                return
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return  # Another collector has it
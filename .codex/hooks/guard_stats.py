@@ -0,0 +1,74 @@
+"""
+Per-rule statistics (CODEX_GUARD_RULE_STATS=1): the counters guard_core.py
+gathers are added to <state dir>/rule_stats.json, and `guard.py
+--rule-report` lists the hottest, most expensive and never-matched rules
+from it. Imported only in stats mode and for the report.
+"""
+
+import json
+import os
+import sys
+
+from guard_core import RULE_STATS_NAME
+from hook_paths import state_dir
+
+
+def add_rule_stats(data: dict, counters: dict) -> None:
+    """Add per-rule counters to data, both shaped like guard_core.RULE_STATS."""
+    for table, rules in counters.items():
+        saved_rules = data.setdefault(table, {})
+        for pattern, stats in rules.items():
+            saved = saved_rules.setdefault(pattern, {})
+            saved['reason'] = stats['reason']
+            for field in ('evaluations', 'hits', 'first', 'seconds'):
+                saved[field] = saved.get(field, 0) + stats[field]
+
+
+def merge_rule_stats(counters: dict) -> None:
+    """Add per-rule counters (guard_core.RULE_STATS) to the stats file, then clear them."""
+    from hook_metrics import update_json
+
+    try:
+        update_json(os.path.join(state_dir(), RULE_STATS_NAME), lambda data: add_rule_stats(data, counters))
+    except OSError:
+        pass  # Stats never decide a verdict
+    counters.clear()
+
+
+def rule_report(top: int = 10) -> int:
+    """--rule-report: hottest, most expensive and never-matched rules from the stats file."""
+    path = os.path.join(state_dir(), RULE_STATS_NAME)
+    try:
+        with open(path, 'rb') as f:
+            data = json.loads(f.read())
+    except (OSError, ValueError):
+        print(f"no rule stats in {path} (run hooks with CODEX_GUARD_RULE_STATS=1)", file=sys.stderr)
+        return 1
+
+    rows = []
+    for table, rules in sorted(data.items()):
+        for pattern, stats in rules.items():
+            evaluations = stats.get('evaluations', 0) or 1
+            rows.append({'table': table, 'pattern': pattern, 'reason': stats.get('reason'),
+                         'evaluations': stats.get('evaluations', 0), 'hits': stats.get('hits', 0),
+                         'first': stats.get('first', 0), 'seconds': stats.get('seconds', 0.0),
+                         'rate': stats.get('hits', 0) / evaluations,
+                         'mean': stats.get('seconds', 0.0) / evaluations})
+
+    def show(title, selected):
+        print(f"{title}:")
+        print(f"  {'table':<18} {'evals':>8} {'hits':>7} {'first':>7} {'total ms':>9} {'mean µs':>8}  rule")
+        for row in selected:
+            rule = row['reason'] or row['pattern']
+            print(f"  {row['table']:<18} {row['evaluations']:>8} {row['hits']:>7} {row['first']:>7} "
+                  f"{row['seconds'] * 1000:>9.3f} {row['mean'] * 1e6:>8.2f}  {rule[:60]}")
+        print()
+
+    show('Hottest (hits)', sorted(rows, key=lambda row: -row['hits'])[:top])
+    show('Most expensive (total time)', sorted(rows, key=lambda row: -row['seconds'])[:top])
+    show('Most expensive (mean time)', sorted(rows, key=lambda row: -row['mean'])[:top])
+    never = [row for row in rows if row['evaluations'] and not row['hits']]
+    print(f"Never matched: {len(never)} of {len(rows)} rules")
+    for row in never:
+        print(f"  {row['table']:<18} {row['reason'] or row['pattern']}")
+    return 0
@@ -0,0 +1,85 @@
+"""
+Batch screening: `guard.py --stream [--jobs N] < events.ndjson`.
+Tool events are checked by the same evaluate() as the hook, one verdict
+record per input line, optionally across a process pool.
+"""
+
+import json
+
+import guard_core
+from guard_core import evaluate, get_rules
+
+STREAM_BATCH = 4096
+
+
+def screen_line(line: str) -> dict:
+    """Verdict record for one NDJSON tool event, using the same checks as the hook."""
+    try:
+        input_data = json.loads(line)
+        tool_name = input_data.get('tool_name', '')
+        blocked, reason = evaluate(tool_name, input_data.get('tool_input', {}))
+    except Exception:
+        # Unparseable event or check failure - block (fail-close)
+        tool_name, blocked, reason = None, True, "Invalid tool event"
+    return {"tool_name": tool_name, "blocked": blocked, "reason": reason}
+
+
+def screen_chunk(lines: list) -> tuple[list, dict | None]:
+    """
+    Pool worker: verdict records for a run of lines, plus the rule stats
+    they added in this process (stats mode only), for the parent to merge.
+    """
+    verdicts = [screen_line(line) for line in lines]
+    counters = None
+    if guard_core.RULE_STATS:
+        counters = dict(guard_core.RULE_STATS)
+        guard_core.RULE_STATS.clear()
+    return verdicts, counters
+
+
+def pool_verdicts(pool, texts: list, jobs: int) -> list:
+    """Verdicts for texts from the pool, in order; worker rule stats go into guard_core.RULE_STATS."""
+    size = max(1, len(texts) // (jobs * 4))
+    verdicts = []
+    for chunk_verdicts, counters in pool.map(screen_chunk, [texts[i:i + size] for i in range(0, len(texts), size)]):
+        verdicts += chunk_verdicts
+        if counters:
+            from guard_stats import add_rule_stats
+            add_rule_stats(guard_core.RULE_STATS, counters)
+    return verdicts
+
+
+def screen_stream(lines, out, jobs: int = 1) -> int:
+    """
+    Write one verdict record per non-empty input line, in input order.
+    With jobs > 1, batches are fanned out over a process pool. Nothing is
+    written to the audit log: screening is not execution.
+    Returns 2 if any event is blocked, like the hook itself.
+    """
+    get_rules()  # Surface rule file errors once instead of blocking every line
+    numbered = ((number, line) for number, line in enumerate(lines, 1) if line.strip())
+    pool = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=jobs)
+
+    any_blocked = False
+    try:
+        while True:
+            batch = [item for _, item in zip(range(STREAM_BATCH), numbered)]
+            if not batch:
+                break
+            texts = [line for _, line in batch]
+            if pool is None:
+                verdicts = map(screen_line, texts)
+            else:
+                verdicts = pool_verdicts(pool, texts, jobs)
+            for (number, _), verdict in zip(batch, verdicts):
+                any_blocked = any_blocked or verdict["blocked"]
+                out.write(json.dumps({"line": number, **verdict}, ensure_ascii=False) + '\n')
+            out.flush()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return 2 if any_blocked else 0
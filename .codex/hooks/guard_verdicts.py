@@ -0,0 +1,191 @@
+"""
+Persistent verdict cache (CODEX_GUARD_VERDICT_CACHE=<entries>): verdicts of
+repeated Bash commands, shared by concurrent hook processes. Imported by
+guard_core.evaluate_cached() only while the cache is on.
+"""
+
+import hashlib
+import os
+import re
+import time
+
+import guard_core
+from guard_core import (ARTIFACT_FORMAT, IS_WINDOWS, READ_COMMANDS, evaluate, file_stamp, oversized, rules_path,
+                        scanned_text)
+from hook_paths import state_dir
+
+
+
+
+def rules_version() -> str:
+    """
+    Identity of everything a verdict depends on, without loading the rules:
+    guard_core.py, the rule file, the platform, the scan limit and whether
+    the allowlist fast path is on (it skips the delete, system and docker
+    rules). Any change to them gives new cache keys, so stale verdicts are
+    never served (they age out by LRU).
+    """
+    path = rules_path()
+    return repr((ARTIFACT_FORMAT, file_stamp(os.path.abspath(guard_core.__file__)), path, file_stamp(path), IS_WINDOWS,
+                 guard_core.MAX_SCAN, guard_core.FAST_PATH))
+
+
+def verdict_subject(tool_name: str, tool_input: dict) -> str | None:
+    """
+    The part of a tool call that evaluate() looks at. None for tools that
+    have no checks and for oversized input, which is blocked before any
+    lookup would help, and for calls whose verdict depends on where paths
+    lead (file tools, Bash read commands): a symlink can change that later.
+    """
+    if tool_name != 'Bash':
+        return None
+    text = scanned_text(tool_name, tool_input)
+    if oversized(text) or re.search(READ_COMMANDS, text, re.IGNORECASE):
+        return None
+    # Not lowercased: heredoc delimiters are case-sensitive, so case can change the segments
+    return text
+
+
+class VerdictCache:
+    """
+    Persistent verdict table shared by concurrent hook processes.
+    A fixed-size file of 256-byte slots in 8-way buckets, read and written
+    with single pread/pwrite calls (no sqlite3/mmap import on the hot path).
+    Keys are 128-bit BLAKE2b digests of (rules_version, tool, subject); each
+    bucket evicts its least recently used slot. A slot checksum turns torn
+    concurrent writes into misses, never into wrong verdicts.
+    """
+
+    MAGIC = b'CGVC1'
+    HEADER = 64
+    SLOT = 256
+    WAYS = 8
+    REASON_MAX = SLOT - 16 - 8 - 1 - 2 - 16
+
+    def __init__(self, path: str, entries: int):
+        self.path = path
+        self.buckets = max(1, entries // self.WAYS)
+        self.header = self.MAGIC + self.buckets.to_bytes(4, 'little') + self.WAYS.to_bytes(1, 'little')
+        self.fd = None
+
+    def key(self, version: str, tool_name: str, tool_input: dict) -> bytes | None:
+        subject = verdict_subject(tool_name, tool_input)
+        if subject is None:
+            return None
+        data = f"{version}\0{tool_name}\0{subject}".encode('utf-8', 'surrogatepass')
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    def _open(self) -> int:
+        if self.fd is not None:
+            return self.fd
+        size = self.HEADER + self.buckets * self.WAYS * self.SLOT
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        try:
+            fd = os.open(self.path, flags, 0o600)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd = os.open(self.path, flags, 0o600)
+        if _pread(fd, len(self.header), 0) != self.header or os.fstat(fd).st_size != size:
+            # New file or different size setting: start over
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, size)
+            _pwrite(fd, self.header, 0)
+        self.fd = fd
+        return fd
+
+    def _bucket_offset(self, key: bytes) -> int:
+        return self.HEADER + (int.from_bytes(key[:8], 'little') % self.buckets) * self.WAYS * self.SLOT
+
+    @staticmethod
+    def _checksum(key: bytes, body: bytes) -> bytes:
+        return hashlib.blake2b(key + body, digest_size=16).digest()
+
+    def get(self, key: bytes) -> tuple[bool, str | None] | None:
+        fd = self._open()
+        offset = self._bucket_offset(key)
+        bucket = _pread(fd, self.WAYS * self.SLOT, offset)
+        for way in range(self.WAYS):
+            slot = bucket[way * self.SLOT:(way + 1) * self.SLOT]
+            if slot[:16] != key:
+                continue
+            # key | used (8) | blocked (1) | reason length (2) | reason | checksum (16)
+            length = int.from_bytes(slot[25:27], 'little')
+            if length > self.REASON_MAX:
+                return None
+            body = slot[24:27 + length]
+            if slot[27 + length:43 + length] != self._checksum(key, body):
+                return None
+            _pwrite(fd, self._now(), offset + way * self.SLOT + 16)
+            reason = slot[27:27 + length].decode('utf-8') if slot[24] & 2 else None
+            return bool(slot[24] & 1), reason
+        return None
+
+    def put(self, key: bytes, blocked: bool, reason: str | None) -> None:
+        encoded = (reason or '').encode('utf-8')
+        if len(encoded) > self.REASON_MAX:
+            return
+        fd = self._open()
+        offset = self._bucket_offset(key)
+        bucket = _pread(fd, self.WAYS * self.SLOT, offset)
+        victim, oldest = 0, None
+        for way in range(self.WAYS):
+            slot = bucket[way * self.SLOT:(way + 1) * self.SLOT]
+            if slot[:16] == key:
+                victim = way
+                break
+            used = int.from_bytes(slot[16:24], 'little')
+            if oldest is None or used < oldest:
+                victim, oldest = way, used
+        flags = (1 if blocked else 0) | (2 if reason is not None else 0)
+        body = bytes([flags]) + len(encoded).to_bytes(2, 'little') + encoded
+        slot = key + self._now() + body + self._checksum(key, body)
+        _pwrite(fd, slot.ljust(self.SLOT, b'\0'), offset + victim * self.SLOT)
+
+    @staticmethod
+    def _now() -> bytes:
+        return time.time_ns().to_bytes(8, 'little')
+
+
+def _pread(fd: int, size: int, offset: int) -> bytes:
+    if hasattr(os, 'pread'):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def _pwrite(fd: int, data: bytes, offset: int) -> None:
+    if hasattr(os, 'pwrite'):
+        os.pwrite(fd, data, offset)
+        return
+    os.lseek(fd, offset, os.SEEK_SET)
+    os.write(fd, data)
+
+
+_VERDICT_CACHE = None
+
+
+def cached_verdict(tool_name: str, tool_input: dict) -> tuple[bool, str | None]:
+    """evaluate() behind the verdict cache; cache failures fall back to evaluating."""
+    global _VERDICT_CACHE
+    key = None
+    try:
+        if _VERDICT_CACHE is None:
+            path = os.path.join(state_dir(), 'verdicts.bin')
+            _VERDICT_CACHE = VerdictCache(path, guard_core.VERDICT_CACHE_ENTRIES)
+        key = _VERDICT_CACHE.key(rules_version(), tool_name, tool_input)
+        if key is not None:
+            verdict = _VERDICT_CACHE.get(key)
+            if verdict is not None:
+                guard_core.TIMER.mark('verdict_cache.hit')
+                return verdict
+    except (OSError, ValueError):
+        key = None
+    guard_core.TIMER.mark('verdict_cache')
+
+    verdict = evaluate(tool_name, tool_input)
+    if key is not None:
+        try:
+            _VERDICT_CACHE.put(key, *verdict)
+        except OSError:
+            pass
+    return verdict
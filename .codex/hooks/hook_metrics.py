@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Per-phase hook timings (opt-in).
+With CODEX_HOOK_METRICS=1 (or --metrics on the hook command line), guard.py
+and notification.py time each phase of a run with a monotonic clock and add
+the durations to cumulative histograms in <state dir>/metrics.json (override
+with CODEX_HOOK_METRICS_FILE). Export them in Prometheus textfile format for
+node_exporter's textfile collector:
+
+    python3 hook_metrics.py export --output /var/lib/node_exporter/textfile/codex_hooks.prom
+    python3 hook_metrics.py show                 # p50/p99 per phase, event counts
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+METRICS_NAME = 'metrics.json'
+# Histogram bucket upper bounds in seconds (+Inf is implicit)
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+METRIC = 'codex_hook_phase_seconds'
+COUNTER = 'codex_hook_events_total'
+
+
+def metrics_path(state_dir: str) -> str:
+    return os.environ.get('CODEX_HOOK_METRICS_FILE') or os.path.join(state_dir, METRICS_NAME)
+
+
+class PhaseTimer:
+    """
+    Monotonic timings of one hook run; each mark() ends a phase that began
+    at the previous mark. count() tallies events, like fast-path hits.
+    """
+
+    def __init__(self, hook: str):
+        self.hook = hook
+        self.started = self.last = time.perf_counter()
+        self.phases = []
+        self.counts = {}
+
+    def mark(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def count(self, event: str) -> None:
+        self.counts[event] = self.counts.get(event, 0) + 1
+
+    def save(self, path: str) -> None:
+        """Add this run's phases, and their total, to the histograms in path."""
+        record(path, self.hook, self.phases + [('total', self.last - self.started)], self.counts)
+
+
+# =============================================================================
+# Histogram file
+# =============================================================================
+
+
+def lock(fd: int) -> None:
+    if sys.platform == 'win32':
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def read_all(fd: int) -> bytes:
+    data = b''
+    while chunk := os.read(fd, 65536):
+        data += chunk
+    return data
+
+
+def add_sample(histogram: dict, seconds: float) -> None:
+    buckets = histogram.setdefault('buckets', [0] * len(BUCKETS))
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            buckets[i] += 1
+            break
+    histogram['count'] = histogram.get('count', 0) + 1
+    histogram['sum'] = histogram.get('sum', 0.0) + seconds
+
+
+def update_json(path: str, update) -> None:
+    """
+    Run update(data) on the JSON object in path under an exclusive lock and
+    write it back, so concurrent hooks never lose each other's counts. A
+    torn or foreign file reads as {}.
+    """
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+    try:
+        fd = os.open(path, flags, 0o600)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd = os.open(path, flags, 0o600)
+    try:
+        lock(fd)
+        try:
+            data = json.loads(read_all(fd) or b'{}')
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        update(data)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+    finally:
+        os.close(fd)  # Releases the lock
+
+
+def record(path: str, hook: str, phases: list[tuple[str, float]], counts: dict | None = None) -> None:
+    """
+    Merge samples into the histogram file. Layout: {"buckets": bounds,
+    "hooks": {hook: {phase: {"buckets": [per-bucket counts], "count": n,
+    "sum": seconds}}}, "counters": {hook: {event: n}}}. A file with other
+    bounds starts over.
+    """
+    def merge(histograms):
+        if histograms.get('buckets') != list(BUCKETS):
+            histograms.clear()
+            histograms.update({'buckets': list(BUCKETS), 'hooks': {}})
+        hook_phases = histograms['hooks'].setdefault(hook, {})
+        for phase, seconds in phases:
+            add_sample(hook_phases.setdefault(phase, {}), seconds)
+        if counts:
+            hook_counters = histograms.setdefault('counters', {}).setdefault(hook, {})
+            for event, n in counts.items():
+                hook_counters[event] = hook_counters.get(event, 0) + n
+
+    update_json(path, merge)
+
+
+def load(path: str, section: str = 'hooks') -> dict:
+    """One section of the histogram file: 'hooks' (histograms) or 'counters'."""
+    try:
+        with open(path, 'rb') as f:
+            histograms = json.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+    return histograms.get(section, {}) if isinstance(histograms, dict) else {}
+
+
+# =============================================================================
+# Export
+# =============================================================================
+
+
+def label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(hooks: dict, counters: dict | None = None) -> str:
+    """Cumulative histograms, and event counters, in the Prometheus text exposition format."""
+    lines = [
+        f'# HELP {METRIC} Time spent in each phase of a Codex hook run.',
+        f'# TYPE {METRIC} histogram',
+    ]
+    for hook in sorted(hooks):
+        for phase in sorted(hooks[hook]):
+            histogram = hooks[hook][phase]
+            labels = f'hook="{label(hook)}",phase="{label(phase)}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.get('buckets', [])):
+                cumulative += count
+                lines.append(f'{METRIC}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{METRIC}_bucket{{{labels},le="+Inf"}} {histogram.get("count", 0)}')
+            lines.append(f'{METRIC}_sum{{{labels}}} {histogram.get("sum", 0.0):.9g}')
+            lines.append(f'{METRIC}_count{{{labels}}} {histogram.get("count", 0)}')
+    if counters:
+        lines.append(f'# HELP {COUNTER} Events counted during Codex hook runs.')
+        lines.append(f'# TYPE {COUNTER} counter')
+        for hook in sorted(counters):
+            for event, n in sorted(counters[hook].items()):
+                lines.append(f'{COUNTER}{{hook="{label(hook)}",event="{label(event)}"}} {n}')
+    return '\n'.join(lines) + '\n'
+
+
+def quantile(histogram: dict, q: float) -> float | None:
+    """Upper bound of the bucket holding quantile q (what histogram_quantile would interpolate)."""
+    count = histogram.get('count', 0)
+    if not count:
+        return None
+    seen = 0
+    for bound, n in zip(BUCKETS, histogram.get('buckets', [])):
+        seen += n
+        if seen >= q * count:
+            return bound
+    return float('inf')
+
+
+def write_atomic(path: str, text: str) -> None:
+    """The textfile collector may read at any moment: never expose a half-written file."""
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def main():
+    import argparse
+
+    from hook_paths import state_dir
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--file', help=f'histogram file (default: <state dir>/{METRICS_NAME})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write the histograms in Prometheus textfile format')
+    export.add_argument('--output', help='.prom file, replaced atomically (default: stdout)')
+    commands.add_parser('show', help='count, p50 and p99 bucket per hook phase')
+    commands.add_parser('reset', help='delete the histograms')
+    args = parser.parse_args()
+    path = args.file or metrics_path(state_dir())
+
+    if args.command == 'export':
+        text = prometheus_text(load(path), load(path, 'counters'))
+        if args.output:
+            write_atomic(args.output, text)
+        else:
+            sys.stdout.write(text)
+    elif args.command == 'show':
+        def ms(seconds):
+            return '-' if seconds is None else '>5000' if seconds == float('inf') else f'{seconds * 1000:g}'
+        hooks = load(path)
+        print(f"{'hook':<14} {'phase':<22} {'count':>8} {'mean ms':>9} {'p50 ≤ms':>8} {'p99 ≤ms':>8}")
+        for hook in sorted(hooks):
+            for phase, histogram in sorted(hooks[hook].items()):
+                count = histogram.get('count', 0)
+                mean = histogram.get('sum', 0.0) / count * 1000 if count else 0.0
+                print(f"{hook:<14} {phase:<22} {count:>8} {mean:>9.3f} "
+                      f"{ms(quantile(histogram, 0.5)):>8} {ms(quantile(histogram, 0.99)):>8}")
+        counters = load(path, 'counters')
+        if counters:
+            print(f"\n{'hook':<14} {'event':<22} {'count':>8}  share of its group")
+        for hook in sorted(counters):
+            for event, n in sorted(counters[hook].items()):
+                # fast_path.hit is a share of every fast_path.* event
+                group = event.rpartition('.')[0]
+                total = sum(m for other, m in counters[hook].items() if other.rpartition('.')[0] == group)
+                print(f"{hook:<14} {event:<22} {n:>8}  {n / total:.1%}")
+    else:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+if __name__ == '__main__':
+    main()
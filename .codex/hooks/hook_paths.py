@@ -0,0 +1,94 @@
+"""
+Locations shared by the hook scripts: the per-user state directory, the
+guard's log directory and the guard daemon's socket.
+Hooks run as `python3 -I -S <script>`, which leaves the script's directory
+off sys.path. Each script that can be run directly puts HOOKS_DIR there
+once, at the top, and imports its sibling modules (this one included) by name.
+"""
+
+import os
+
+HOOKS_DIR = os.path.dirname(os.path.realpath(__file__))
+SCRIPT_ROOT = os.path.dirname(HOOKS_DIR)
+
+
+def state_dir() -> str:
+    """Per-user directory for small hook caches; created on first write only."""
+    override = os.environ.get('CODEX_HOOKS_STATE')
+    if override:
+        return override
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'codex-hooks')
+
+
+def log_dir_candidates() -> list[str]:
+    candidates = []
+
+    codex_home = os.environ.get('CODEX_HOME')
+    if codex_home:
+        candidates.append(os.path.join(codex_home, 'logs'))
+    if os.path.basename(SCRIPT_ROOT) == '.codex':
+        candidates.append(os.path.join(SCRIPT_ROOT, 'log'))
+    candidates.append('/tmp/codex-hooks')
+    candidates.append(os.path.join(os.path.expanduser('~'), '.claude', 'logs'))
+
+    return candidates
+
+
+def resolve_log_dir() -> str:
+    """
+    First writable log directory candidate.
+    The answer is cached under state_dir() together with the candidate list it
+    was computed from, so a steady-state run does one small read instead of a
+    mkdir/access probe per candidate. forget_log_dir() drops a stale answer.
+    """
+    candidates = log_dir_candidates()
+    cache_path = os.path.join(state_dir(), 'log_dir')
+
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            if not hasattr(os, 'getuid') or os.fstat(f.fileno()).st_uid == os.getuid():
+                *cached_candidates, cached_dir = f.read().split('\n')
+                if cached_candidates == candidates and cached_dir:
+                    return cached_dir
+    except (OSError, ValueError):
+        pass
+
+    log_dir = '/tmp'
+    for candidate in candidates:
+        try:
+            os.makedirs(candidate, exist_ok=True)
+            if os.access(candidate, os.W_OK):
+                log_dir = candidate
+                break
+        except OSError:
+            continue
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(candidates + [log_dir]))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+    return log_dir
+
+
+def forget_log_dir() -> None:
+    try:
+        os.remove(os.path.join(state_dir(), 'log_dir'))
+    except OSError:
+        pass
+
+
+def default_socket_path() -> str:
+    """Unix socket of `guard.py --daemon`, which guard_client.py connects to."""
+    path = os.environ.get('CODEX_GUARD_SOCKET')
+    if path:
+        return path
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'codex-guard.sock')
+    return os.path.join('/tmp', f'codex-guard-{os.getuid()}', 'guard.sock')
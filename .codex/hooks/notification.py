@@ -7,15 +7,15 @@ Used as a Stop (post-response) and Notification hook.
 
 import json
 import os
-import platform
-import random
-import shutil
-import subprocess
 import sys
-from pathlib import Path
 
-CACHE_DIR = Path(__file__).parent / "cache"
-IS_WINDOWS = platform.system() == "Windows"
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from hook_paths import state_dir
+
+# subprocess, shutil and random are imported where they are used: most hook
+# events never reach them, and platform/pathlib are not needed at all
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+IS_WINDOWS = sys.platform == "win32"
 
 # Messages — correspond to cache files in hooks/cache/
 MESSAGES = {
@@ -39,6 +39,11 @@ COMPLETION_PHRASES = [
     "Wrapped up! Your move.",
 ]
 
+# Alert text: CODEX_NOTIFY_TEMPLATE with {message}, {project} (name of the working
+# directory) and {session} (short session id), e.g. "{project}: {message}". Text
+# with no pre-made clip is spoken by a local TTS backend (alert_audio.tts_clip)
+MESSAGE_TEMPLATE = "{message}"
+
 # Desktop notification titles
 NOTIFICATION_TITLES = {
     "ready": "Codex — Complete",
@@ -46,6 +51,54 @@ NOTIFICATION_TITLES = {
     "idle": "Codex",
 }
 
+# Audio queue: hooks queue clips for one detached player process (see start_player)
+COALESCE_WINDOW = 0.3   # the player waits this long for the rest of a burst before playing
+PLAYER_LINGER = 1.0     # and exits once the queue has stayed empty this long
+REQUEST_STALE = 120     # seconds after which a queued clip is dropped unplayed
+# When a burst is merged into one clip, the most urgent type wins
+PRIORITY = {"permission": 2, "idle": 1, "ready": 0}
+
+# Cross-session debounce: within CODEX_NOTIFY_DEBOUNCE seconds (default 5, 0 = off)
+# of an alert, further alerts of the same type only count; the player then sends
+# one summary when the window closes
+DEBOUNCE_WINDOW = 5.0
+SUMMARIES = {
+    "ready": "{count} agents finished. Awaiting your instructions.",
+    "permission": "{count} agents need your attention.",
+    "idle": "{count} agents are awaiting your instructions.",
+}
+
+
+class NoTimer:
+    """Stands in for hook_metrics.PhaseTimer while per-phase metrics are off (same as guard.py)."""
+
+    def mark(self, phase: str) -> None:
+        pass
+
+
+# Runs with CODEX_HOOK_METRICS=1 or --metrics replace this with a PhaseTimer (see main)
+TIMER = NoTimer()
+
+
+def metrics_enabled() -> bool:
+    return os.environ.get("CODEX_HOOK_METRICS") == "1" or "--metrics" in sys.argv
+
+
+def phase_timer(hook: str):
+    from hook_metrics import PhaseTimer
+    return PhaseTimer(hook)
+
+
+def save_metrics(timer) -> None:
+    """Add a run's phase timings to the metrics file (no-op while metrics are off)."""
+    if isinstance(timer, NoTimer):
+        return
+    from hook_metrics import metrics_path
+    try:
+        timer.save(metrics_path(state_dir()))
+    except OSError:
+        pass
+
 
 # =============================================================================
 # Desktop Notifications (cross-platform)
@@ -53,20 +106,49 @@ NOTIFICATION_TITLES = {
 
 
 def send_desktop_notification(title: str, message: str) -> bool:
-    system = platform.system()
     try:
-        if system == "Linux":
+        if sys.platform.startswith("linux"):
             return _notify_linux(title, message)
-        elif system == "Darwin":
+        elif sys.platform == "darwin":
             return _notify_macos(title, message)
-        elif system == "Windows":
+        elif IS_WINDOWS:
             return _notify_windows(title, message)
     except Exception:
         pass
     return False
 
 
+# D-Bus notifier, kept for the life of the process (the player sends several alerts)
+_notifier = None
+
+
+def _notify_dbus(title: str, message: str) -> bool:
+    """org.freedesktop.Notifications over the session bus; False if there is no bus or server."""
+    global _notifier
+    import dbus_notify
+
+    if dbus_notify.session_address() is None:
+        return False
+    if _notifier is None:
+        _notifier = dbus_notify.Notifier(
+            "Codex",
+            hints={"x-canonical-private-synchronous": "codex", "x-dunst-stack-tag": "codex"},
+            id_path=os.path.join(state_dir(), "notification_id"),
+        )
+    try:
+        _notifier.notify(title, message)
+        return True
+    except (OSError, dbus_notify.DBusError):
+        return False
+
+
 def _notify_linux(title: str, message: str) -> bool:
+    if _notify_dbus(title, message):
+        return True
+
+    import shutil
+    import subprocess
+
     if not shutil.which("notify-send"):
         return False
     try:
@@ -89,6 +171,9 @@ def _notify_linux(title: str, message: str) -> bool:
 
 
 def _notify_macos(title: str, message: str) -> bool:
+    import shutil
+    import subprocess
+
     if shutil.which("terminal-notifier"):
         try:
             # Detect current terminal app for click-to-focus
@@ -136,6 +221,8 @@ def _notify_macos(title: str, message: str) -> bool:
 
 
 def _notify_windows(title: str, message: str) -> bool:
+    import subprocess
+
     title_esc = title.replace("'", "''")
     message_esc = message.replace("'", "''")
 
@@ -184,77 +271,527 @@ $notify.Dispose()
 
 
 # =============================================================================
-# Audio Playback (cached MP3 only)
+# Audio Playback (cached clips)
 # =============================================================================
 
 
 def play_cached(text: str) -> bool:
+    # The asset pack (alert_audio.py build/pack): one mapped file, clips found by
+    # phrase, pre-decoded samples skip the decoder start-up entirely
+    import alert_audio
+    if alert_audio.play(text):
+        return True
+    level = alert_audio.volume()
+
     safe_name = text.replace("/", "-").replace("\x00", "")
-    cache_path = CACHE_DIR / f"{safe_name}.mp3"
-    if not cache_path.exists():
-        return False
+    cache_path = os.path.join(CACHE_DIR, f"{safe_name}.mp3")
+    if not os.path.exists(cache_path):
+        # No pre-made clip (a templated or new phrase): synthesized once, then cached
+        return alert_audio.speak(text)
 
     # Windows: use winmm MCI (no external deps, supports MP3)
     if IS_WINDOWS:
         try:
             import ctypes
             winmm = ctypes.windll.winmm
-            path_str = str(cache_path).replace("\\", "\\\\")
+            path_str = cache_path.replace("\\", "\\\\")
             buf = ctypes.create_unicode_buffer(256)
             winmm.mciSendStringW(f'open "{path_str}" type mpegvideo alias agent_snd', buf, 256, None)
+            winmm.mciSendStringW(f'setaudio agent_snd volume to {level}', buf, 256, None)
             winmm.mciSendStringW('play agent_snd wait', buf, 256, None)
             winmm.mciSendStringW('close agent_snd', buf, 256, None)
             return True
         except Exception:
             pass  # Fall through to ffplay/mpv
 
+    import shutil
+    import subprocess
+
     players = [
-        ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet"],
-        ["mpv", "--no-video", "--really-quiet"],
+        ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet", "-volume", str(level // 10)],
+        ["mpv", "--no-video", "--really-quiet", f"--volume={level // 10}"],
     ]
     for cmd in players:
         if shutil.which(cmd[0]):
             try:
-                subprocess.run(cmd + [str(cache_path)], check=True, capture_output=True)
+                subprocess.run(cmd + [cache_path], check=True, capture_output=True)
                 return True
             except subprocess.CalledProcessError:
                 continue
     return False
 
 
+# =============================================================================
+# Audio queue (one detached player per user)
+# =============================================================================
+
+
+def queue_dir() -> str:
+    return os.environ.get("CODEX_AUDIO_QUEUE") or os.path.join(state_dir(), "audio")
+
+
+def enqueue_clip(message: str, notification_type: str, warm: list[str] | None = None,
+                 title: str | None = None) -> None:
+    """
+    Queue one clip request as its own file (.tmp renamed to .req, never seen
+    half-written). With a title, the player also shows message as a desktop
+    notification. warm lists phrases the player should synthesize ahead of
+    their first use.
+    """
+    import time
+
+    directory = queue_dir()
+    name = os.path.join(directory, f"{time.time_ns():020d}.{os.getpid()}")
+    request = {"message": message, "type": notification_type}
+    if title:
+        request["title"] = title
+    if warm:
+        request["warm"] = warm
+    data = json.dumps(request).encode("utf-8")
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    try:
+        fd = os.open(name + ".tmp", flags, 0o600)
+    except FileNotFoundError:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd = os.open(name + ".tmp", flags, 0o600)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+    os.replace(name + ".tmp", name + ".req")
+
+
+def queued(directory: str) -> list[str]:
+    """Queued request files, oldest first."""
+    return sorted(name for name in os.listdir(directory) if name.endswith(".req"))
+
+
+def take_batch(directory: str) -> list[dict]:
+    """Remove and return every queued request that is not stale, oldest first."""
+    import time
+
+    stale_ns = time.time_ns() - REQUEST_STALE * 1_000_000_000
+    batch = []
+    for name in queued(directory):
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "rb") as f:
+                request = json.loads(f.read())
+            os.remove(path)
+        except (OSError, ValueError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        if int(name.split(".", 1)[0]) >= stale_ns and isinstance(request, dict):
+            batch.append(request)
+    return batch
+
+
+def notify_batch(batch: list[dict]) -> None:
+    """Show the desktop notification of every request in a burst, each distinct one once, oldest first."""
+    shown = set()
+    for request in batch:
+        title, message = request.get("title"), request.get("message")
+        if isinstance(title, str) and isinstance(message, str) and (title, message) not in shown:
+            shown.add((title, message))
+            send_desktop_notification(title, message)
+
+
+def choose_clip(batch: list[dict]) -> str | None:
+    """
+    The one message a burst of requests is played as: the most urgent type,
+    latest request first. Identical and lower-priority clips are dropped.
+    """
+    best = None
+    for request in batch:
+        if best is None or PRIORITY.get(request.get("type"), 0) >= PRIORITY.get(best.get("type"), 0):
+            best = request
+    return best.get("message") if best else None
+
+
+def try_lock(fd: int) -> bool:
+    if IS_WINDOWS:
+        import msvcrt
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    import fcntl
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def unlock(fd: int) -> None:
+    if IS_WINDOWS:
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def lock(fd: int) -> None:
+    """Exclusive lock, waiting for the holder (held only for a read-modify-write)."""
+    if IS_WINDOWS:
+        import msvcrt
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def lock_path() -> str:
+    return os.path.join(queue_dir(), ".lock")
+
+
+def start_player() -> None:
+    """
+    Make sure a detached player is draining the queue, then return at once.
+    A running player (it holds audio/.lock) picks up the new request. On
+    Unix the player is a forked child without stdio, so the agent is not
+    kept waiting on its pipes; on Windows it is a detached `--player`
+    process that takes the lock itself.
+    """
+    if IS_WINDOWS:
+        import subprocess
+
+        flags = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.CREATE_NO_WINDOW
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--player"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            creationflags=flags, close_fds=True,
+        )
+        return
+
+    lock_fd = os.open(lock_path(), os.O_RDWR | os.O_CREAT, 0o600)
+    if not try_lock(lock_fd):
+        os.close(lock_fd)
+        return
+
+    if os.fork() != 0:
+        os.close(lock_fd)  # The child's copy keeps the lock
+        return
+
+    try:
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for stdio_fd in (0, 1, 2):
+            os.dup2(devnull, stdio_fd)
+        run_player(lock_fd)
+    finally:
+        os._exit(0)
+
+
+def run_player(lock_fd: int) -> None:
+    """
+    Show the desktop notifications of queued requests and play their clips
+    one at a time until the queue stays empty. Requests that arrive within
+    COALESCE_WINDOW of each other, or while a clip is playing, are merged
+    into one clip (choose_clip). While the queue is
+    empty, phrases the requests asked to warm are synthesized one at a time.
+    Hands the lock over without stranding requests, like guard.py's log
+    collector.
+    """
+    import time
+
+    directory = queue_dir()
+    to_warm = []
+    summary_due = time.monotonic()  # when the next debounce window closes (inf: none open)
+    while True:
+        idle_since = time.monotonic()
+        while time.monotonic() - idle_since < PLAYER_LINGER:
+            try:
+                pending = queued(directory)
+            except OSError:
+                return
+            if not pending:
+                # The shared state is only read (under its lock) when a window is due to close
+                now = time.monotonic()
+                if now >= summary_due:
+                    next_close = flush_summaries()
+                    summary_due = now + next_close if next_close is not None else float("inf")
+                # Stay up until every open debounce window has been summarized
+                if summary_due != float("inf"):
+                    idle_since = now
+                if to_warm:
+                    # One phrase per pass: a new alert waits for one synthesis at most
+                    import alert_audio
+                    alert_audio.warm([to_warm.pop(0)])
+                    idle_since = time.monotonic()
+                    continue
+                time.sleep(max(0.0, min(0.05, summary_due - now)))
+                continue
+            timer = phase_timer("player") if metrics_enabled() else NoTimer()
+            time.sleep(COALESCE_WINDOW)
+            batch = take_batch(directory)
+            timer.mark("coalesce")
+            notify_batch(batch)
+            timer.mark("notify")
+            message = choose_clip(batch)
+            for request in batch:
+                phrases = request.get("warm")
+                if isinstance(phrases, list):
+                    to_warm.extend(p for p in phrases if isinstance(p, str) and p not in to_warm)
+            if message:
+                play_cached(message)
+                timer.mark("playback")
+            save_metrics(timer)
+            # An alert that went out may have opened a window
+            summary_due = idle_since = time.monotonic()
+        unlock(lock_fd)
+        # A hook that queued while we held the lock did not start a player
+        try:
+            if not queued(directory) or not try_lock(lock_fd):
+                return
+        except OSError:
+            return
+
+
+def player_main() -> int:
+    """--player (Windows): become the player unless one is already running."""
+    try:
+        os.makedirs(queue_dir(), mode=0o700, exist_ok=True)
+        lock_fd = os.open(lock_path(), os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o600)
+    except OSError:
+        return 1
+    if try_lock(lock_fd):
+        run_player(lock_fd)
+    return 0
+
+
+def queue_clip(message: str, notification_type: str, warm: list[str] | None = None,
+               title: str | None = None) -> None:
+    """
+    Hand a clip (and its desktop notification, with a title) to the player
+    and return; notifies and plays in-process if the queue cannot be used.
+    """
+    try:
+        enqueue_clip(message, notification_type, warm, title)
+        start_player()
+    except OSError:
+        if title:
+            send_desktop_notification(title, message)
+        play_cached(message)
+
+
+# =============================================================================
+# Cross-session debounce (shared, lock-protected state)
+# =============================================================================
+
+
+def debounce_window() -> float:
+    try:
+        return max(0.0, float(os.environ.get("CODEX_NOTIFY_DEBOUNCE", DEBOUNCE_WINDOW)))
+    except ValueError:
+        return DEBOUNCE_WINDOW
+
+
+def with_state(update):
+    """
+    Run update(state) on the shared debounce state under an exclusive lock
+    and save it if update changed it; returns update's result. State: {type: {"until": unix time
+    the window closes, "count": alerts in it, "reported": summary handled}}.
+    A torn or unreadable file counts as empty (at worst, one extra alert).
+    """
+    path = os.path.join(state_dir(), "notify.json")
+    flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    try:
+        fd = os.open(path, flags, 0o600)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        fd = os.open(path, flags, 0o600)
+    try:
+        lock(fd)
+        data = b""
+        while chunk := os.read(fd, 65536):
+            data += chunk
+        try:
+            state = json.loads(data) if data else {}
+        except ValueError:
+            state = {}
+        if not isinstance(state, dict):
+            state = {}
+        result = update(state)
+        updated = json.dumps(state).encode("utf-8")
+        if updated != data:
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, updated)
+        return result
+    finally:
+        os.close(fd)  # Releases the lock
+
+
+def debounced(notification_type: str) -> bool:
+    """
+    True when an alert of this type went out less than the debounce window
+    ago, in any session: this one is counted for the summary and the hook
+    exits without a notification, sound or subprocess.
+    """
+    window = debounce_window()
+    if window <= 0:
+        return False
+    import time
+
+    now = time.time()
+
+    def update(state):
+        current = state.get(notification_type)
+        if isinstance(current, dict) and now < current.get("until", 0):
+            current["count"] = current.get("count", 1) + 1
+            return True
+        state[notification_type] = {"until": now + window, "count": 1, "reported": False}
+        return False
+
+    try:
+        return with_state(update)
+    except OSError:
+        return False
+
+
+def flush_summaries() -> float | None:
+    """
+    Player side: send one "N agents ..." notification for each closed window
+    that collapsed several alerts. Returns the seconds until the next open
+    window closes, or None when nothing is left to summarize.
+    """
+    import time
+
+    now = time.time()
+    due = []
+
+    def update(state):
+        next_close = None
+        for notification_type, current in state.items():
+            if not isinstance(current, dict) or current.get("reported", True):
+                continue
+            remaining = current.get("until", 0) - now
+            if remaining > 0:
+                next_close = remaining if next_close is None else min(next_close, remaining)
+                continue
+            current["reported"] = True
+            if current.get("count", 1) > 1:
+                due.append((notification_type, current["count"]))
+        return next_close
+
+    try:
+        next_close = with_state(update)
+    except OSError:
+        return None
+    for notification_type, count in due:
+        timer = phase_timer("player") if metrics_enabled() else NoTimer()
+        title = NOTIFICATION_TITLES.get(notification_type, NOTIFICATION_TITLES["ready"])
+        send_desktop_notification(title, SUMMARIES.get(notification_type, SUMMARIES["ready"]).format(count=count))
+        timer.mark("summary")
+        save_metrics(timer)
+    return next_close
+
+
+# =============================================================================
+# Alert text
+# =============================================================================
+
+
+def message_template() -> str:
+    return os.environ.get("CODEX_NOTIFY_TEMPLATE") or MESSAGE_TEMPLATE
+
+
+def alert_context(input_data: dict) -> dict:
+    """Template fields of a hook event: {project} (working directory name) and {session}."""
+    cwd = input_data.get("cwd") or os.getcwd()
+    return {
+        "project": os.path.basename(os.path.normpath(str(cwd))),
+        "session": str(input_data.get("session_id") or "")[:8],
+    }
+
+
+def render(message: str, context: dict) -> str:
+    """message put into the alert template; an invalid template leaves it as is."""
+    try:
+        return message_template().format(message=message, **context)
+    except (KeyError, IndexError, ValueError):
+        return message
+
+
+def expected_phrases(context: dict) -> list[str]:
+    """Every alert text this context can produce, for the player to synthesize ahead of time."""
+    return list(dict.fromkeys(render(message, context) for message in [*MESSAGES.values(), *COMPLETION_PHRASES]))
+
+
 # =============================================================================
 # Main
 # =============================================================================
 
 
-def announce(message: str, notification_type: str) -> None:
+def announce(message: str, notification_type: str, context: dict) -> None:
+    """
+    Queue the alert for the detached player, which shows the desktop
+    notification and plays the clip: notify-send or PowerShell can take
+    seconds, and the agent waits for this hook.
+    """
     title = NOTIFICATION_TITLES.get(notification_type, NOTIFICATION_TITLES["ready"])
-    send_desktop_notification(title, message)
-    play_cached(message)
+    text = render(message, context)
+    # The built-in phrases have pre-made clips; templated ones are warmed for next time
+    warm = expected_phrases(context) if message_template() != MESSAGE_TEMPLATE else None
+    queue_clip(text, notification_type, warm, title)
+    TIMER.mark("queue")
+
+
+def startup_report() -> int:
+    """--startup-report: import and end-to-end timings of the fast exit path."""
+    from startup_report import run_report
+
+    # A non-Stop event exits without notifying, so the report makes no noise.
+    # There is no setup phase: everything else happens on the alert path.
+    event = {"hook_event_name": "SessionStart"}
+
+    return run_report(__file__, event, lambda timed: None, args=("--notify",))
 
 
 def main():
+    if "--startup-report" in sys.argv:
+        sys.exit(startup_report())
+    if "--player" in sys.argv:
+        sys.exit(player_main())
+
+    global TIMER
     notify = "--notify" in sys.argv
     permission = "--permission" in sys.argv
+    if metrics_enabled():
+        TIMER = phase_timer("notification")
 
     try:
         input_data = json.load(sys.stdin)
     except json.JSONDecodeError:
         input_data = {}
+    TIMER.mark("parse")
 
     if permission:
-        notif_type = input_data.get("notification_type", "")
-        if notif_type == "idle_prompt":
-            announce(MESSAGES["idle"], "idle")
-        else:
-            announce(MESSAGES["permission"], "permission")
+        notif_type = "idle" if input_data.get("notification_type", "") == "idle_prompt" else "permission"
+        skip = debounced(notif_type)
+        TIMER.mark("debounce")
+        if not skip:
+            announce(MESSAGES[notif_type], notif_type, alert_context(input_data))
+        save_metrics(TIMER)
         sys.exit(0)
 
-    if notify:
-        if input_data.get("hook_event_name") == "Stop":
+    if notify and input_data.get("hook_event_name") == "Stop":
+        skip = debounced("ready")
+        TIMER.mark("debounce")
+        if not skip:
+            import random
             message = random.choice(COMPLETION_PHRASES)
-            announce(message, "ready")
+            announce(message, "ready", alert_context(input_data))
 
+    save_metrics(TIMER)
     sys.exit(0)
 
 
@@ -0,0 +1,112 @@
+"""
+Startup-time report for the hook scripts (`--startup-report`).
+Times module imports (via -X importtime), in-process setup phases and the
+end-to-end wall clock of a hook run, using the caller's interpreter flags.
+The budget (CODEX_HOOK_BUDGET_MS) is for the hook's own cost: its median
+run minus the median start-up of a bare interpreter with the same flags,
+which no hook can avoid and which varies widely between machines. Runs in
+a throwaway CODEX_HOME so real logs and caches are untouched. Exit code 1
+means the budget was exceeded.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+BUDGET_MS = 50.0
+RUNS = 7
+
+
+def interpreter_flags() -> list[str]:
+    """Flags the report was started with, so child runs are measured the same way."""
+    flags = []
+    if sys.flags.isolated:
+        flags.append('-I')
+    else:
+        if sys.flags.ignore_environment:
+            flags.append('-E')
+        if sys.flags.no_user_site:
+            flags.append('-s')
+    if sys.flags.no_site:
+        flags.append('-S')
+    return flags
+
+
+def import_timings(command: list[str], payload: bytes, env: dict) -> list[tuple[str, float]]:
+    """Top-level imports of one hook run with their cumulative time in ms."""
+    result = subprocess.run(
+        command[:1] + ['-X', 'importtime'] + command[1:],
+        input=payload, env=env, capture_output=True,
+    )
+    timings = []
+    for line in result.stderr.decode('utf-8', 'replace').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, _, cumulative, name = (part.strip() for part in line.replace('import time:', '|', 1).split('|'))
+        # Top-level imports are the ones without tree indentation
+        if cumulative.isdigit() and not line.rsplit('|', 1)[1].startswith('  '):
+            timings.append((name, int(cumulative) / 1000))
+    return sorted(timings, key=lambda item: item[1], reverse=True)
+
+
+def end_to_end(command: list[str], payload: bytes, env: dict, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(command, input=payload, env=env, capture_output=True)
+        samples.append((time.perf_counter() - started) * 1000)
+    return sorted(samples)
+
+
+def run_report(script: str, event: dict, measure_phases, args: tuple = ()) -> int:
+    """
+    measure_phases(timed) runs the in-process setup steps, wrapping each in
+    timed(label, fn, *args). Prints the report and returns the exit code.
+    """
+    budget_ms = float(os.environ.get('CODEX_HOOK_BUDGET_MS', BUDGET_MS))
+    command = [sys.executable] + interpreter_flags() + [os.path.abspath(script), *args]
+    payload = json.dumps(event).encode('utf-8')
+    phases = []
+
+    def timed(label, fn, *fn_args):
+        started = time.perf_counter()
+        result = fn(*fn_args)
+        phases.append((label, (time.perf_counter() - started) * 1000))
+        return result
+
+    saved_env = dict(os.environ)
+    with tempfile.TemporaryDirectory(prefix='codex-hooks-report-') as tmp:
+        os.environ['CODEX_HOME'] = os.path.join(tmp, 'home')
+        os.environ['CODEX_HOOKS_STATE'] = os.path.join(tmp, 'state')
+        try:
+            measure_phases(timed)
+            env = dict(os.environ)
+            imports = import_timings(command, payload, env)
+            samples = end_to_end(command, payload, env, RUNS)
+            bare = end_to_end(command[:-1 - len(args)] + ['-c', 'pass'], b'', env, RUNS)
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_env)
+
+    median = samples[len(samples) // 2]
+    bare_median = bare[len(bare) // 2]
+    own = max(0.0, median - bare_median)
+    over = own > budget_ms
+
+    print(f"{os.path.basename(script)} startup report")
+    print(f"  interpreter  {' '.join(command[:-1 - len(args)])}")
+    print("  imports (cumulative)")
+    for name, ms in imports:
+        print(f"    {name:<28} {ms:8.2f} ms")
+    if phases:
+        print("  setup")
+    for label, ms in phases:
+        print(f"    {label:<28} {ms:8.2f} ms")
+    print(f"  end-to-end   median {median:.1f} ms, max {samples[-1]:.1f} ms over {RUNS} runs")
+    print(f"  bare python  median {bare_median:.1f} ms (same flags, no script)")
+    print(f"  hook's own   median {own:.1f} ms")
+    print(f"  budget       {budget_ms:.0f} ms — {'OVER' if over else 'OK'}")
+    return 1 if over else 0
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Hook latency benchmark and verdict check.
+
+Runs the command corpus (bench/corpus.jsonl) through guard.py and reports:
+- verdict mismatches against the corpus expectations (exit 1 on any)
+- per-decision latency percentiles and throughput of the in-process checks
+- end-to-end wall clock of guard.py and notification.py as hook subprocesses
+- with --engine: the rule tables' RuleSet against a plain loop over the same
+  precompiled patterns (exit 1 if RuleSet is more than --threshold slower)
+- with --pathological: how evaluate() scales on inputs built to make regex
+  matching slow, up to CODEX_GUARD_MAX_SCAN (exit 1 if it grows superlinearly,
+  any input takes longer than --max-ms, or a verdict is not the expected one)
+
+Results are written as JSON so runs can be compared:
+
+    python3 bench/hook_bench.py --output base.json
+    python3 bench/hook_bench.py --compare base.json      # exit 1 on p50 regression
+    python3 bench/hook_bench.py --check-only --pathological   # verdicts and worst-case bounds only
+    python3 bench/hook_bench.py --check-only --engine         # verdicts and rule engine vs a plain loop
+
+Logs and caches go to a throwaway CODEX_HOME, never to the real ones.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+HOOKS_DIR = REPO_ROOT / ".codex" / "hooks"
+CORPUS = Path(__file__).resolve().parent / "corpus.jsonl"
+
+
+def load_corpus(path: Path) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentiles(samples_ns: list[int], unit: float) -> dict:
+    """p50/p90/p99/max of samples in the given unit (1e3 = us, 1e6 = ms)."""
+    ordered = sorted(samples_ns)
+
+    def pick(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] / unit, 3)
+
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": round(ordered[-1] / unit, 3)}
+
+
+# =============================================================================
+# Verdicts
+# =============================================================================
+
+
+def check_verdicts(guard, corpus: list[dict]) -> dict:
+    """Windows-only corpus entries are checked against the Windows tables on any host."""
+    rules = {"any": guard.GuardRules(windows=False), "windows": guard.GuardRules(windows=True)}
+    mismatches = []
+    for index, entry in enumerate(corpus):
+        guard._RULES = rules[entry.get("platform", "any")]
+        blocked, reason = guard.evaluate(entry["tool_name"], entry["tool_input"])
+        expected = entry["expect"]
+        if blocked != expected["blocked"] or reason != expected["reason"]:
+            mismatches.append({
+                "line": index + 1,
+                "tool_name": entry["tool_name"],
+                "tool_input": entry["tool_input"],
+                "expected": expected,
+                "actual": {"blocked": blocked, "reason": reason},
+            })
+    guard._RULES = None
+    return {"total": len(corpus), "mismatches": mismatches}
+
+
+# =============================================================================
+# In-process latency
+# =============================================================================
+
+
+def time_calls(fn, args_list: list[tuple], iterations: int) -> dict:
+    samples = []
+    clock = time.perf_counter_ns
+    started = clock()
+    for _ in range(iterations):
+        for args in args_list:
+            t0 = clock()
+            fn(*args)
+            samples.append(clock() - t0)
+    elapsed = (clock() - started) / 1e9
+    result = percentiles(samples, 1e3)
+    result["unit"] = "us"
+    result["calls_per_s"] = round(len(samples) / elapsed) if elapsed else None
+    return result
+
+
+def bench_in_process(guard, corpus: list[dict], iterations: int) -> dict:
+    guard._RULES = guard.GuardRules()
+    guard.get_rules()
+    bash = [e for e in corpus if e["tool_name"] == "Bash" and e.get("platform", "any") == "any"]
+    commands = [(e["tool_input"]["command"],) for e in bash]
+    events = [(e["tool_name"], e["tool_input"]) for e in corpus if e.get("platform", "any") == "any"]
+
+    results = {
+        "is_dangerous_delete_command": time_calls(guard.is_dangerous_delete_command, commands, iterations),
+        "is_dangerous_system_command": time_calls(guard.is_dangerous_system_command, commands, iterations),
+        "is_credential_read": time_calls(guard.is_credential_read, events, iterations),
+        "evaluate": time_calls(guard.evaluate, events, iterations),
+    }
+    for tag in sorted({e["tag"] for e in corpus}):
+        tagged = [(e["tool_name"], e["tool_input"]) for e in corpus
+                  if e["tag"] == tag and e.get("platform", "any") == "any"]
+        if tagged:
+            results[f"evaluate[{tag}]"] = time_calls(guard.evaluate, tagged, iterations)
+
+    # Verdict cache hits (the table lives in the throwaway state dir)
+    guard.VERDICT_CACHE_ENTRIES = 4096
+    for args in events:
+        guard.evaluate_cached(*args)
+    results["evaluate_cached[hit]"] = time_calls(guard.evaluate_cached, events, iterations)
+    guard.VERDICT_CACHE_ENTRIES = 0
+
+    started = time.perf_counter_ns()
+    guard.GuardRules()
+    results["compile_rules"] = {"ms": round((time.perf_counter_ns() - started) / 1e6, 3)}
+    return results
+
+
+# =============================================================================
+# Rule engine against a plain loop
+# =============================================================================
+
+# Long benign commands, as agents send them: a long commit message, a generated script
+LONG_COMMANDS = [
+    "git commit -m " + "'" + "update the parser and its tests for the new token rules. " * 280 + "'",
+    "python3 -c " + "'" + "import json; print(json.dumps({\"key\": [1, 2, 3]}))\n" * 300 + "'",
+]
+
+
+def rule_checks(rules, text: str) -> None:
+    """What evaluate() asks the rule tables for a Bash command, through RuleSet."""
+    for commands, paths in rules.delete:
+        if commands.matches(text) and paths.matches(text):
+            break
+    rules.system.first(text)
+    rules.docker.matches(text)
+
+
+def plain_checks(tables, text: str) -> None:
+    """The same questions as a first-match loop over precompiled patterns, in table order."""
+    for commands, paths in tables["delete"]:
+        if any(p.search(text) for p in commands) and any(p.search(text) for p in paths):
+            break
+    next((reason for pattern, reason in tables["system"] if pattern.search(text)), None)
+    any(p.search(text) for p in tables["docker"])
+
+
+def bench_engine(guard, corpus: list[dict], iterations: int, threshold: float) -> tuple[dict, list[str]]:
+    """
+    Time the rule tables' RuleSet against a plain loop over the same patterns
+    compiled with re.compile(), on the corpus commands (Unix and Windows
+    tables) and on long commands. Returns results and failures: any input
+    group on which RuleSet is more than threshold slower than the loop.
+    """
+    commands = [guard.normalize_command(e["tool_input"]["command"]) for e in corpus if e["tool_name"] == "Bash"]
+    groups = {
+        "corpus": (False, commands),
+        "corpus[windows]": (True, commands),
+        "long": (False, [guard.normalize_command(command) for command in LONG_COMMANDS]),
+    }
+    results, failures = {}, []
+    for name, (windows, texts) in groups.items():
+        rules = guard.GuardRules(windows=windows)
+        tables = {
+            "delete": [([re.compile(p) for p in commands], [re.compile(p) for p in paths])
+                       for commands, paths in rules.tables["delete"]],
+            "system": [(re.compile(pattern), reason) for pattern, reason in rules.tables["system"]],
+            "docker": [re.compile(p) for p in rules.tables["docker"]],
+        }
+        timings = {}
+        for label, check, arg in (("plain_loop", plain_checks, tables), ("ruleset", rule_checks, rules)):
+            for text in texts:
+                check(arg, text)    # Compile on first use outside the timing
+            passes = []
+            for _ in range(max(1, iterations // 10)):
+                t0 = time.perf_counter_ns()
+                for text in texts:
+                    check(arg, text)
+                passes.append(time.perf_counter_ns() - t0)
+            timings[label] = min(passes) / len(texts) / 1e3
+        ratio = timings["ruleset"] / timings["plain_loop"]
+        results[name] = {"plain_loop_us": round(timings["plain_loop"], 2), "ruleset_us": round(timings["ruleset"], 2),
+                         "ratio": round(ratio, 2)}
+        if ratio > 1 + threshold:
+            failures.append(f"{name}: RuleSet {timings['ruleset']:.1f} us per command, "
+                            f"plain loop {timings['plain_loop']:.1f} us ({ratio - 1:+.0%})")
+    return results, failures
+
+
+# =============================================================================
+# Pathological inputs
+# =============================================================================
+
+# Commands of about n chars that make a backtracking matcher slow: rule
+# prefixes repeated on one line with no suffix, long flag, whitespace and
+# wildcard runs. Each is truncated to n.
+PATHOLOGICAL = {
+    "rm-flag-run": lambda n: "rm -" + "r" * n,
+    "rm-repeated": lambda n: "rm " * (n // 3 + 1),
+    "curl-no-pipe": lambda n: "curl " * (n // 5 + 1),
+    "git-push-repeated": lambda n: "git push " * (n // 9 + 1),
+    "docker-run-repeated": lambda n: "docker run " * (n // 11 + 1),
+    "docker-whitespace": lambda n: "docker" + " " * n,
+    "net-user-repeated": lambda n: "net user " * (n // 9 + 1),
+    "windows-wildcards": lambda n: "del /s c:\\" + "*" * n,
+    "heredoc-lines": lambda n: "cat <<'EOF'\n" + "curl x | rm -r y\n" * (n // 17 + 1),
+    "cat-credentials": lambda n: "cat ~/" + "~.ssh/" * (n // 6 + 1),     # near-miss protected dirs
+}
+
+# Random concatenations of rule prefixes: they never complete a rule, so every
+# rule scans the whole input (fixed seeds)
+FUZZ_FRAGMENTS = ["rm", "-", "r", "rm -r", " ", "  ", "\t", "\n", "curl", "wget", "git", "push", "git push",
+                  "docker", "run", "docker run", "net user", "iex", "(", "powershell", "c:\\", ".ssh", "a", "x"]
+FUZZ_SEEDS = (1, 2, 3)
+
+# Expected verdict of each input above at every size, as in the corpus; inputs not listed must pass
+PATHOLOGICAL_EXPECT = {
+    "windows-wildcards": {"blocked": True, "reason": "Dangerous delete command detected"},
+}
+PASS = {"blocked": False, "reason": None}
+
+
+def fuzz_command(seed: int, n: int) -> str:
+    rng = random.Random(seed)
+    parts, size = [], 0
+    while size < n:
+        parts.append(rng.choice(FUZZ_FRAGMENTS))
+        size += len(parts[-1])
+    return "".join(parts)
+
+
+def bench_pathological(guard, max_exponent: float, max_ms: float) -> tuple[dict, list[str]]:
+    """
+    Time evaluate() on each pathological input at 1/8 .. 1x of the scan
+    limit, with every rule table loaded. Returns results and failures: an
+    input whose time grows faster than size**max_exponent, one that takes
+    longer than max_ms at any size, a verdict other than PATHOLOGICAL_EXPECT,
+    or an input past the limit that is not blocked.
+    """
+    guard._RULES = guard.GuardRules(windows=True)
+    limit = guard.MAX_SCAN if guard.MAX_SCAN > 0 else 16 * 1024
+    sizes = [limit // 8, limit // 4, limit // 2, limit]
+    cases = dict(PATHOLOGICAL)
+    cases.update({f"fuzz-{seed}": (lambda n, seed=seed: fuzz_command(seed, n)) for seed in FUZZ_SEEDS})
+
+    results, failures = {"limit_chars": limit}, []
+    for name, build in cases.items():
+        expected = PATHOLOGICAL_EXPECT.get(name, PASS)
+        timings = []
+        for n in sizes:
+            tool_input = {"command": build(n)[:n]}
+            samples = []
+            for _ in range(3):
+                t0 = time.perf_counter_ns()
+                blocked, reason = guard.evaluate("Bash", tool_input)
+                samples.append(time.perf_counter_ns() - t0)
+            timings.append(min(samples) / 1e6)
+            actual = {"blocked": blocked, "reason": reason}
+            if actual != expected:
+                failures.append(f"{name} at {n} chars: expected {expected}, got {actual}")
+            if timings[-1] > max_ms:
+                failures.append(f"{name} at {n} chars: {timings[-1]:.0f} ms (limit {max_ms:.0f} ms)")
+        # Slope of log(time) over log(size): 1 is linear, 2 quadratic
+        exponent = math.log(max(timings[-1], 1e-3) / max(timings[0], 1e-3)) / math.log(sizes[-1] / sizes[0])
+        results[name] = {"ms": dict(zip(map(str, sizes), (round(t, 3) for t in timings))),
+                         "max_ms": round(max(timings), 3), "exponent": round(exponent, 2)}
+        if exponent > max_exponent:
+            failures.append(f"{name}: time grows as size^{exponent:.2f}")
+
+    t0 = time.perf_counter_ns()
+    blocked, reason = guard.evaluate("Bash", {"command": PATHOLOGICAL["rm-repeated"](limit + 1)})
+    results["over-limit"] = {"ms": round((time.perf_counter_ns() - t0) / 1e6, 3), "blocked": blocked, "reason": reason}
+    if guard.MAX_SCAN > 0 and not blocked:
+        failures.append("over-limit: input past CODEX_GUARD_MAX_SCAN was not blocked")
+
+    guard._RULES = None
+    return results, failures
+
+
+# =============================================================================
+# End-to-end
+# =============================================================================
+
+
+def time_subprocess(command: list[str], payloads: list[bytes], runs: int, env: dict) -> dict:
+    samples = []
+    for i in range(runs):
+        payload = payloads[i % len(payloads)]
+        t0 = time.perf_counter_ns()
+        subprocess.run(command, input=payload, env=env, capture_output=True)
+        samples.append(time.perf_counter_ns() - t0)
+    result = percentiles(samples, 1e6)
+    result["unit"] = "ms"
+    result["runs"] = runs
+    return result
+
+
+def bench_end_to_end(hooks_dir: Path, corpus: list[dict], runs: int, flags: list[str],
+                     notify_stop: bool, env: dict) -> dict:
+    python = [sys.executable, *flags]
+    payloads = [json.dumps({"tool_name": e["tool_name"], "tool_input": e["tool_input"]}).encode("utf-8")
+                for e in corpus if e.get("platform", "any") == "any"]
+    results = {"guard.py": time_subprocess(python + [str(hooks_dir / "guard.py")], payloads, runs, env)}
+
+    # The Stop event plays audio and shows a notification, so it is opt-in
+    event = {"hook_event_name": "Stop" if notify_stop else "SessionStart"}
+    results["notification.py"] = time_subprocess(
+        python + [str(hooks_dir / "notification.py"), "--notify"],
+        [json.dumps(event).encode("utf-8")], runs if not notify_stop else min(runs, 5), env,
+    )
+    results["notification.py"]["event"] = event["hook_event_name"]
+    return results
+
+
+# =============================================================================
+# Comparison
+# =============================================================================
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return regressions where p50 grew by more than threshold (0.2 = 20%)."""
+    regressions = []
+    for section in ("in_process", "end_to_end"):
+        for name, stats in current.get(section, {}).items():
+            old = baseline.get(section, {}).get(name, {})
+            if "p50" not in stats or not old.get("p50"):
+                continue
+            ratio = stats["p50"] / old["p50"]
+            marker = "REGRESSION" if ratio > 1 + threshold else ""
+            print(f"  {section}.{name:<36} p50 {old['p50']:>10} -> {stats['p50']:>10} {stats['unit']:<2} "
+                  f"({ratio - 1:+.0%}) {marker}", file=sys.stderr)
+            if marker:
+                regressions.append(f"{section}.{name}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, default=CORPUS)
+    parser.add_argument("--hooks-dir", type=Path, default=HOOKS_DIR, help="benchmark installed hooks, e.g. ~/.codex/hooks")
+    parser.add_argument("--iterations", type=int, default=200, help="in-process passes over the corpus")
+    parser.add_argument("--runs", type=int, default=30, help="end-to-end hook subprocess runs")
+    parser.add_argument("--python-flags", default="-I -S", help="interpreter flags for end-to-end runs")
+    parser.add_argument("--notify-stop", action="store_true", help="time notification.py on a real Stop event (plays audio)")
+    parser.add_argument("--check-only", action="store_true", help="only check verdicts")
+    parser.add_argument("--skip-e2e", action="store_true")
+    parser.add_argument("--pathological", action="store_true", help="check that matching time stays linear on worst-case inputs")
+    parser.add_argument("--engine", action="store_true", help="time the rule engine against a plain loop over its patterns")
+    parser.add_argument("--max-exponent", type=float, default=1.4, help="allowed growth exponent for --pathological")
+    parser.add_argument("--max-ms", type=float, default=25.0,
+                        help="time limit per --pathological input, at any size (what the 50 ms hook budget "
+                             "leaves after the hook's own ~20 ms)")
+    parser.add_argument("--output", type=Path, help="write JSON results here instead of stdout")
+    parser.add_argument("--compare", type=Path, help="previous JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed p50 growth before failing --compare, and RuleSet slowdown before failing --engine")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="codex-hooks-bench-") as tmp:
+        os.environ["CODEX_HOME"] = os.path.join(tmp, "home")
+        os.environ["CODEX_HOOKS_STATE"] = os.path.join(tmp, "state")
+        sys.path.insert(0, str(args.hooks_dir))
+        import guard_core as guard
+
+        corpus = load_corpus(args.corpus)
+        results = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "corpus": str(args.corpus),
+                "corpus_size": len(corpus),
+            },
+            "verdicts": check_verdicts(guard, corpus),
+        }
+        failures = []
+        if args.pathological:
+            results["pathological"], failures = bench_pathological(guard, args.max_exponent, args.max_ms)
+        if args.engine or not args.check_only:
+            results["engine"], engine_failures = bench_engine(guard, corpus, args.iterations, args.threshold)
+            failures += engine_failures
+        if not args.check_only:
+            results["in_process"] = bench_in_process(guard, corpus, args.iterations)
+            if not args.skip_e2e:
+                results["end_to_end"] = bench_end_to_end(
+                    args.hooks_dir, corpus, args.runs, args.python_flags.split(), args.notify_stop, dict(os.environ),
+                )
+
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(text + "\n")
+    else:
+        print(text)
+
+    status = 0
+    mismatches = results["verdicts"]["mismatches"]
+    if mismatches:
+        print(f"{len(mismatches)} verdict mismatch(es):", file=sys.stderr)
+        for m in mismatches:
+            print(f"  line {m['line']}: expected {m['expected']}, got {m['actual']}", file=sys.stderr)
+        status = 1
+    if failures:
+        print(f"{len(failures)} bound(s) exceeded:", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        status = 1
+    if args.compare:
+        print(f"compared with {args.compare}:", file=sys.stderr)
+        if compare(results, json.loads(args.compare.read_text()), args.threshold):
+            status = 1
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()